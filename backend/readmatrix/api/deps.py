@@ -0,0 +1,129 @@
+"""Process-wide service singletons shared by API routes."""
+
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Coroutine, TypeVar
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from ..conversation import ConversationService
+from ..indexer import Database, IndexManager, VectorStore
+from ..qa import QAEngine
+from ..retriever import Retriever
+
+
+logger = logging.getLogger("readmatrix.api")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+@lru_cache(maxsize=1)
+def get_database() -> Database:
+    """Shared SQLite database handle."""
+    return Database()
+
+
+@lru_cache(maxsize=1)
+def get_vectorstore() -> VectorStore:
+    """Shared ChromaDB persistent client and collection."""
+    return VectorStore(db=get_database())
+
+
+@lru_cache(maxsize=1)
+def get_conversation_service() -> ConversationService:
+    """Shared conversation service backed by the shared database."""
+    return ConversationService(db=get_database())
+
+
+@lru_cache(maxsize=1)
+def get_qa_engine() -> QAEngine:
+    """Shared QA engine; reuses the vector store and conversation service."""
+    return QAEngine(
+        retriever=Retriever(vectorstore=get_vectorstore()),
+        conversation_service=get_conversation_service(),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_index_manager() -> IndexManager:
+    """Shared index manager over the same database and vector store."""
+    return IndexManager(db=get_database(), vectorstore=get_vectorstore())
+
+
+def _warm_embedder() -> None:
+    """Create the query-path embedding provider (lazy on Retriever otherwise)."""
+    get_qa_engine().retriever.embedder
+
+
+def warm_up() -> None:
+    """Build all singletons up front so the first request doesn't pay for init."""
+    for factory in (get_conversation_service, get_qa_engine, get_index_manager, _warm_embedder):
+        try:
+            factory()
+        except Exception as e:
+            # 启动失败不阻塞服务，首个请求时会再次尝试初始化
+            logger.warning("Failed to warm up %s: %s", factory.__name__, e)
+
+
+def shutdown() -> None:
+    """Release resources held by singletons that were actually created."""
+    if get_conversation_service.cache_info().currsize:
+        get_conversation_service().close()
+    if get_database.cache_info().currsize:
+        get_database().close_all()
+    # 清空缓存，使同一进程内重新启动的应用拿到新的实例
+    for factory in (
+        get_qa_engine,
+        get_index_manager,
+        get_conversation_service,
+        get_vectorstore,
+        get_database,
+    ):
+        factory.cache_clear()
+
+
+def json_body(model: type[ModelT]) -> Callable[[Request], Coroutine[Any, Any, ModelT]]:
+    """
+    Dependency parsing the raw request body with ``model_validate_json``.
+
+    Pydantic parses and validates the bytes in one pass (jiter) instead of
+    json.loads followed by dict validation. Errors surface as the usual 422.
+    """
+
+    async def dependency(request: Request) -> ModelT:
+        body = await request.body()
+        try:
+            return model.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors()],
+                body=body,
+            )
+
+    return dependency
+
+
+def _inline_defs(node: Any, defs: dict) -> Any:
+    """Replace local ``#/$defs/...`` references with the definitions themselves."""
+    if isinstance(node, dict):
+        ref = node.get("$ref", "")
+        if ref.startswith("#/$defs/"):
+            return _inline_defs(defs[ref.removeprefix("#/$defs/")], defs)
+        return {key: _inline_defs(value, defs) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_inline_defs(item, defs) for item in node]
+    return node
+
+
+def json_body_openapi(model: type[BaseModel]) -> dict:
+    """OpenAPI requestBody entry for routes that parse their body via json_body."""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_defs(schema, defs)}},
+        }
+    }
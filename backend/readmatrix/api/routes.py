@@ -1,20 +1,55 @@
 """API routes for health, indexing, conversations, and ask."""
 
-from typing import Literal, Optional
-import json
+import asyncio
+from typing import Any, Literal, Optional
 
-from fastapi import APIRouter, HTTPException, Query, Request
-from fastapi.responses import StreamingResponse
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
 
+from ..clients import get_openai_client
 from ..conversation import ConversationService
 from ..config import get_settings
-from ..indexer import Database, IndexManager, VectorStore
+from ..indexer import IndexManager
+from ..models import citations_to_dicts
 from ..qa import QAEngine
+from ..vault import count_markdown_files, has_weread_markers
+from .deps import (
+    get_conversation_service,
+    get_database,
+    get_index_manager,
+    get_qa_engine,
+    get_vectorstore,
+    json_body,
+    json_body_openapi,
+)
 
 
 router = APIRouter(prefix="/api")
 
+# Seconds between keep-alive ping comments on /ask streams, so proxies don't
+# drop the connection during long generations
+SSE_PING_INTERVAL = 15
+
+
+# Pre-encoded "event: <type>\ndata: " prefixes for the known SSE event types
+_SSE_PREFIXES: dict[str, bytes] = {
+    event_type: f"event: {event_type}\ndata: ".encode()
+    for event_type in ("meta", "delta", "citations", "done")
+}
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, bypassing jsonable_encoder."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
 
 # === Request/Response Models ===
 
@@ -122,223 +157,246 @@ async def health_check():
 
 # === Doctor ===
 
-@router.post("/doctor", response_model=DoctorResponse)
-async def doctor():
-    """
-    Environment self-check with enhanced diagnostics.
-
-    Checks:
-    1. Vault path exists
-    2. WeRead folder detected
-    3. WeRead file structure valid
-    4. SQLite writable
-    5. ChromaDB persistent
-    6. OpenAI API available
-    """
+def _check_vault() -> tuple[list[dict], bool]:
+    """Vault path exists."""
     settings = get_settings()
-    checks = []
-    all_passed = True
-
-    # 1. Vault path
     vault_exists = settings.vault_path.exists()
-    checks.append(
-        {
-            "name": "Vault Path",
-            "passed": vault_exists,
-            "message": str(settings.vault_path)
-            if vault_exists
-            else f"Not found: {settings.vault_path}",
-        }
-    )
-    if not vault_exists:
-        all_passed = False
-
-    # 2. WeRead folder
-    weread_path = settings.weread_path
+    check = {
+        "name": "Vault Path",
+        "passed": vault_exists,
+        "message": str(settings.vault_path)
+        if vault_exists
+        else f"Not found: {settings.vault_path}",
+    }
+    return [check], vault_exists
+
+
+def _check_weread() -> tuple[list[dict], bool]:
+    """WeRead folder detected and its file structure valid."""
+    weread_path = get_settings().weread_path
     weread_exists = weread_path.exists()
-    md_count = len(list(weread_path.glob("*.md"))) if weread_exists else 0
-    checks.append(
-        {
-            "name": "WeRead Folder",
-            "passed": weread_exists and md_count > 0,
-            "message": f"Found {md_count} files"
-            if weread_exists
-            else f"Not found: {weread_path}",
-        }
+    md_count, sample_file = (
+        count_markdown_files(weread_path) if weread_exists else (0, None)
     )
-    if not weread_exists:
-        all_passed = False
-
-    # 3. WeRead structure detection
-    weread_valid = False
-    if weread_exists and md_count > 0:
-        sample_file = next(weread_path.glob("*.md"), None)
-        if sample_file:
-            try:
-                content = sample_file.read_text(encoding="utf-8")[:1000]
-                weread_valid = "bookId:" in content or "📌" in content
-            except Exception:
-                pass
-    checks.append(
-        {
-            "name": "WeRead Structure",
-            "passed": weread_valid,
-            "message": "Valid WeRead format detected"
-            if weread_valid
-            else "No valid WeRead files found",
-        }
-    )
-
-    # 4. SQLite writable
+    folder_check = {
+        "name": "WeRead Folder",
+        "passed": weread_exists and md_count > 0,
+        "message": f"Found {md_count} files"
+        if weread_exists
+        else f"Not found: {weread_path}",
+    }
+
+    weread_valid = bool(sample_file) and has_weread_markers(sample_file)
+    structure_check = {
+        "name": "WeRead Structure",
+        "passed": weread_valid,
+        "message": "Valid WeRead format detected"
+        if weread_valid
+        else "No valid WeRead files found",
+    }
+    # 结构检测仅作提示，不影响整体状态
+    return [folder_check, structure_check], weread_exists
+
+
+def _check_sqlite() -> tuple[list[dict], bool]:
+    """SQLite writable."""
     sqlite_ok = False
     try:
-        db = Database()
+        db = get_database()
         db.get_file_count()  # Simple read test
         sqlite_ok = True
     except Exception:
         sqlite_ok = False
-    checks.append(
-        {
-            "name": "SQLite Database",
-            "passed": sqlite_ok,
-            "message": str(settings.sqlite_path) if sqlite_ok else "Cannot access database",
-        }
-    )
-    if not sqlite_ok:
-        all_passed = False
+    check = {
+        "name": "SQLite Database",
+        "passed": sqlite_ok,
+        "message": str(get_settings().sqlite_path) if sqlite_ok else "Cannot access database",
+    }
+    return [check], sqlite_ok
+
 
-    # 5. ChromaDB persistent
+def _check_chroma() -> tuple[list[dict], bool]:
+    """ChromaDB persistent."""
     chroma_ok = False
     try:
-        vs = VectorStore()
+        vs = get_vectorstore()
         chroma_ok = vs.test_persistence()
     except Exception:
         chroma_ok = False
-    checks.append(
-        {
-            "name": "ChromaDB Storage",
-            "passed": chroma_ok,
-            "message": str(settings.chroma_path) if chroma_ok else "Cannot persist data",
-        }
-    )
-    if not chroma_ok:
-        all_passed = False
+    check = {
+        "name": "ChromaDB Storage",
+        "passed": chroma_ok,
+        "message": str(get_settings().chroma_path) if chroma_ok else "Cannot persist data",
+    }
+    return [check], chroma_ok
 
-    # 6. OpenAI API
+
+def _check_openai() -> tuple[list[dict], bool]:
+    """OpenAI API available."""
+    settings = get_settings()
     openai_ok = False
     if settings.openai_api_key:
         try:
-            import openai
-
-            client = openai.OpenAI(api_key=settings.openai_api_key)
+            client = get_openai_client(settings.openai_api_key)
             client.models.list()
             openai_ok = True
         except Exception:
             openai_ok = False
-    checks.append(
-        {
-            "name": "OpenAI API",
-            "passed": openai_ok,
-            "message": "Connected" if openai_ok else "API key missing or invalid",
-        }
+    check = {
+        "name": "OpenAI API",
+        "passed": openai_ok,
+        "message": "Connected" if openai_ok else "API key missing or invalid",
+    }
+    return [check], openai_ok
+
+
+_DOCTOR_CHECKS = (_check_vault, _check_weread, _check_sqlite, _check_chroma, _check_openai)
+
+
+@router.post("/doctor", response_model=None, responses={200: {"model": DoctorResponse}})
+async def doctor():
+    """
+    Environment self-check with enhanced diagnostics.
+
+    Checks:
+    1. Vault path exists
+    2. WeRead folder detected
+    3. WeRead file structure valid
+    4. SQLite writable
+    5. ChromaDB persistent
+    6. OpenAI API available
+
+    The checks are independent blocking I/O, so they run concurrently in the
+    threadpool and the endpoint latency is that of the slowest check.
+    """
+    results = await asyncio.gather(
+        *(run_in_threadpool(check) for check in _DOCTOR_CHECKS)
     )
-    if not openai_ok:
-        all_passed = False
 
-    return DoctorResponse(
-        status="ok" if all_passed else "error",
-        checks=checks,
+    checks = [check for group, _ in results for check in group]
+    all_passed = all(ok for _, ok in results)
+
+    return ORJSONResponse(
+        {
+            "status": "ok" if all_passed else "error",
+            "checks": checks,
+        }
     )
 
 
 # === Conversations ===
 
-@router.get("/conversations", response_model=ConversationListResponse)
-async def list_conversations(
+@router.get(
+    "/conversations",
+    response_model=None,
+    responses={200: {"model": ConversationListResponse}},
+)
+def list_conversations(
     limit: int = Query(30, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    service: ConversationService = Depends(get_conversation_service),
 ):
     """列出所有会话，按最后活跃时间倒序。"""
-    service = ConversationService()
     conversations, total = service.list_conversations(limit=limit, offset=offset)
-    return ConversationListResponse(
-        conversations=conversations,
-        total=total,
-        limit=limit,
-        offset=offset,
+    return ORJSONResponse(
+        {
+            "conversations": conversations,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+        }
     )
 
 
-@router.post("/conversations", response_model=ConversationCreateResponse)
-async def create_conversation(request: ConversationCreateRequest | None = None):
+@router.post(
+    "/conversations",
+    response_model=None,
+    responses={200: {"model": ConversationCreateResponse}},
+)
+def create_conversation(
+    request: ConversationCreateRequest | None = None,
+    service: ConversationService = Depends(get_conversation_service),
+):
     """创建新会话，返回会话 ID。"""
-    service = ConversationService()
     title = request.title if request else None
     conversation_id = service.create_conversation(title=title)
-    return ConversationCreateResponse(conversation_id=conversation_id)
+    return ORJSONResponse({"conversation_id": conversation_id})
 
 
 @router.get(
     "/conversations/{conversation_id}/messages",
-    response_model=ConversationMessagesResponse,
+    response_model=None,
+    responses={200: {"model": ConversationMessagesResponse}},
 )
-async def get_conversation_messages(
+def get_conversation_messages(
     conversation_id: str,
     limit: int = Query(30, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    service: ConversationService = Depends(get_conversation_service),
 ):
     """分页读取会话消息（默认不返回 system 摘要消息）。"""
-    service = ConversationService()
-    if not service.db.conversation_exists(conversation_id):
-        raise HTTPException(status_code=404, detail="Conversation not found")
-
-    messages = service.list_messages(
+    exists, messages, total = service.list_messages_page(
         conversation_id=conversation_id,
         limit=limit,
         offset=offset,
         include_system=False,
     )
-    total = service.db.count_conversation_messages(
-        conversation_id=conversation_id,
-        include_system=False,
-    )
+    if not exists:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
     debate_state = service.get_latest_debate_state(conversation_id)
 
-    return ConversationMessagesResponse(
-        conversation_id=conversation_id,
-        messages=[
-            {
-                "id": item.id,
-                "role": item.role,
-                "content": item.content,
-                "citations": item.citations,
-                "created_at": item.created_at,
-                "is_clarification": item.is_clarification,
-            }
-            for item in messages
-        ],
-        limit=limit,
-        offset=offset,
-        total=total,
-        debate_state=debate_state,
+    return ORJSONResponse(
+        {
+            "conversation_id": conversation_id,
+            "messages": [
+                {
+                    "id": item.id,
+                    "role": item.role,
+                    "content": item.content,
+                    "citations": item.citations,
+                    "created_at": item.created_at,
+                    "is_clarification": item.is_clarification,
+                }
+                for item in messages
+            ],
+            "limit": limit,
+            "offset": offset,
+            "total": total,
+            "debate_state": debate_state,
+        }
     )
 
 
-@router.delete("/conversations/{conversation_id}", response_model=GenericStatusResponse)
-async def delete_conversation(conversation_id: str):
+@router.delete(
+    "/conversations/{conversation_id}",
+    response_model=None,
+    responses={200: {"model": GenericStatusResponse}},
+)
+def delete_conversation(
+    conversation_id: str,
+    service: ConversationService = Depends(get_conversation_service),
+):
     """删除会话及其历史消息。"""
-    service = ConversationService()
     if not service.db.conversation_exists(conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
 
     service.delete_conversation(conversation_id)
-    return GenericStatusResponse(status="ok")
+    return ORJSONResponse({"status": "ok"})
 
 
 # === Index ===
 
-@router.post("/index", response_model=IndexResponse)
-async def index(request: IndexRequest):
+@router.post(
+    "/index",
+    response_model=None,
+    responses={200: {"model": IndexResponse}},
+    openapi_extra=json_body_openapi(IndexRequest),
+)
+def index(
+    request: IndexRequest = Depends(json_body(IndexRequest)),
+    manager: IndexManager = Depends(get_index_manager),
+):
     """
     Build or rebuild the index.
 
@@ -346,25 +404,35 @@ async def index(request: IndexRequest):
         full_rebuild: If true, clear and rebuild from scratch
     """
     try:
-        manager = IndexManager()
-
         if request.full_rebuild:
             stats = manager.full_rebuild()
         else:
             stats = manager.incremental_update()
 
-        return IndexResponse(
-            status="ok",
-            stats=stats,
-        )
+        # 索引内容变化后，缓存的答案与检索结果可能引用过期笔记
+        qa = get_qa_engine()
+        qa.answer_cache.clear()
+        qa.fused_cache.clear()
+        qa.retriever.invalidate_cache()
+
+        return ORJSONResponse({"status": "ok", "stats": stats})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # === Ask ===
 
-@router.post("/ask", response_model=AskResponse)
-async def ask(request: AskRequest, req: Request):
+@router.post(
+    "/ask",
+    response_model=None,
+    responses={200: {"model": AskResponse}},
+    openapi_extra=json_body_openapi(AskRequest),
+)
+async def ask(
+    req: Request,
+    request: AskRequest = Depends(json_body(AskRequest)),
+    qa: QAEngine = Depends(get_qa_engine),
+):
     """
     Ask a question with grounded answer and conversation memory.
 
@@ -394,8 +462,9 @@ async def ask(request: AskRequest, req: Request):
 
     accept = req.headers.get("accept", "")
     if "text/event-stream" in accept:
-        return StreamingResponse(
+        return EventSourceResponse(
             _stream_answer(
+                qa=qa,
                 query=request.query,
                 book_id=book_id,
                 book_title=book_title,
@@ -404,12 +473,12 @@ async def ask(request: AskRequest, req: Request):
                 mode=mode,
                 debate=debate_payload,
             ),
-            media_type="text/event-stream",
+            ping=SSE_PING_INTERVAL,
         )
 
     try:
-        qa = QAEngine()
-        result = qa.ask_with_conversation(
+        result = await run_in_threadpool(
+            qa.ask_with_conversation,
             query=request.query,
             book_id=book_id,
             book_title=book_title,
@@ -419,21 +488,24 @@ async def ask(request: AskRequest, req: Request):
             debate=debate_payload,
         )
 
-        return AskResponse(
-            answer=result.answer,
-            citations=[c.to_dict() for c in result.citations],
-            conversation_id=result.conversation_id,
-            needs_clarification=result.needs_clarification,
-            clarification_question=result.clarification_question,
-            mode=result.mode,
-            debate_status=result.debate_status,
-            debate_event=result.debate_event,
+        return ORJSONResponse(
+            {
+                "answer": result.answer,
+                "citations": citations_to_dicts(result.citations),
+                "conversation_id": result.conversation_id,
+                "needs_clarification": result.needs_clarification,
+                "clarification_question": result.clarification_question,
+                "mode": result.mode,
+                "debate_status": result.debate_status,
+                "debate_event": result.debate_event,
+            }
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 async def _stream_answer(
+    qa: QAEngine,
     query: str,
     book_id: str | None,
     book_title: str | None,
@@ -442,9 +514,7 @@ async def _stream_answer(
     mode: str,
     debate: dict | None,
 ):
-    """Generate SSE events for streaming answer with conversation metadata."""
-    qa = QAEngine()
-
+    """Generate pre-encoded SSE frames for streaming answer with conversation metadata."""
     async for event in qa.ask_stream_with_conversation(
         query=query,
         book_id=book_id,
@@ -455,5 +525,7 @@ async def _stream_answer(
         debate=debate,
     ):
         event_type = event["event"]
-        data = json.dumps(event["data"], ensure_ascii=False)
-        yield f"event: {event_type}\ndata: {data}\n\n"
+        prefix = _SSE_PREFIXES.get(event_type)
+        if prefix is None:
+            prefix = f"event: {event_type}\ndata: ".encode()
+        yield prefix + orjson.dumps(event["data"], default=str) + b"\n\n"
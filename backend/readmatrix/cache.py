@@ -0,0 +1,154 @@
+"""In-process caches for the QA and retrieval pipeline."""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe exact-key LRU cache."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = max(1, maxsize)
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value (marking it recently used) or None."""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any | None:
+        """Remove and return the cached value, or None if absent."""
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass
+class _SemanticEntry:
+    scope: Hashable
+    value: Any
+    created_at: float
+    last_used: float
+
+
+class SemanticCache:
+    """
+    Cache keyed by query embedding, hit when cosine similarity >= threshold.
+
+    Entries are partitioned by ``scope`` (e.g. retrieval filters), expire after
+    ``ttl_seconds`` and are evicted least-recently-used beyond ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600.0,
+    ):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # 每行是一条已归一化的查询向量，与 _entries 一一对应
+        self._matrix: np.ndarray | None = None
+        self._entries: list[_SemanticEntry] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _remove(self, indices: list[int]):
+        if not indices:
+            return
+        keep = sorted(set(range(len(self._entries))) - set(indices))
+        self._entries = [self._entries[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    def get(self, embedding, scope: Hashable = None) -> Any | None:
+        """Return the value of the most similar live entry in scope, or None."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                i
+                for i, entry in enumerate(self._entries)
+                if now - entry.created_at > self.ttl_seconds
+            ]
+            self._remove(expired)
+
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            sims = self._matrix @ query
+            for i, entry in enumerate(self._entries):
+                if entry.scope != scope:
+                    sims[i] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best]
+            entry.last_used = now
+            self.hits += 1
+            return entry.value
+
+    def put(self, embedding, value: Any, scope: Hashable = None):
+        """Store a value under the given query embedding."""
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+                # 向量维度变化（更换了 embedding 模型），旧条目不可比，直接清空
+                self._matrix = None
+                self._entries = []
+
+            self._entries.append(
+                _SemanticEntry(scope=scope, value=value, created_at=now, last_used=now)
+            )
+            row = vector.reshape(1, -1)
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+            if len(self._entries) > self.max_entries:
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i].last_used)
+                self._remove([lru])
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._entries = []
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
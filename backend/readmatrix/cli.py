@@ -18,6 +18,8 @@ def doctor():
     """Run environment self-checks"""
     from .config import get_settings
     from .indexer import Database, VectorStore
+    from .clients import get_http_client, get_openai_client
+    from .vault import count_markdown_files, has_weread_markers
     
     settings = get_settings()
     
@@ -43,7 +45,7 @@ def doctor():
     # 2. WeRead folder
     weread_path = settings.weread_path
     weread_ok = weread_path.exists()
-    md_count = len(list(weread_path.glob("*.md"))) if weread_ok else 0
+    md_count, sample = count_markdown_files(weread_path) if weread_ok else (0, None)
     table.add_row(
         "WeRead Folder",
         "[green]✓[/green]" if weread_ok else "[red]✗[/red]",
@@ -53,15 +55,7 @@ def doctor():
         all_passed = False
     
     # 3. WeRead structure
-    weread_valid = False
-    if weread_ok and md_count > 0:
-        sample = next(weread_path.glob("*.md"), None)
-        if sample:
-            try:
-                content = sample.read_text(encoding="utf-8")[:1000]
-                weread_valid = "bookId:" in content or "📌" in content
-            except Exception:
-                pass
+    weread_valid = bool(sample) and has_weread_markers(sample)
     table.add_row(
         "WeRead Structure",
         "[green]✓[/green]" if weread_valid else "[yellow]?[/yellow]",
@@ -107,10 +101,9 @@ def doctor():
     if llm_provider == "siliconflow":
         if settings.siliconflow_api_key:
             try:
-                import openai
-                client = openai.OpenAI(
-                    api_key=settings.siliconflow_api_key,
-                    base_url=settings.siliconflow_base_url,
+                client = get_openai_client(
+                    settings.siliconflow_api_key,
+                    settings.siliconflow_base_url,
                 )
                 # Test with a simple models list request
                 client.models.list()
@@ -121,8 +114,7 @@ def doctor():
     elif llm_provider == "openai":
         if settings.openai_api_key:
             try:
-                import openai
-                client = openai.OpenAI(api_key=settings.openai_api_key)
+                client = get_openai_client(settings.openai_api_key)
                 client.models.list()
                 llm_ok = True
                 llm_message = "OpenAI connected"
@@ -130,8 +122,9 @@ def doctor():
                 llm_message = f"OpenAI error: {str(e)[:30]}"
     elif llm_provider == "ollama":
         try:
-            import httpx
-            response = httpx.get(f"{settings.ollama_base_url}/api/tags", timeout=5.0)
+            response = get_http_client().get(
+                f"{settings.ollama_base_url}/api/tags", timeout=5.0
+            )
             if response.status_code == 200:
                 llm_ok = True
                 llm_message = "Ollama connected"
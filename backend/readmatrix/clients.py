@@ -0,0 +1,49 @@
+"""Shared HTTP/LLM clients, reused across requests to keep connection pools warm."""
+
+from functools import lru_cache
+
+import httpx
+
+
+# 连接池上限：嵌入批次与问答请求会并发共享同一个客户端
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+@lru_cache(maxsize=1)
+def http2_available() -> bool:
+    """Whether the optional ``h2`` package is installed, so httpx can negotiate HTTP/2."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=8)
+def get_openai_client(api_key: str | None, base_url: str | None = None):
+    """Return a cached OpenAI-compatible client keyed by (api_key, base_url)."""
+    import openai
+
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=openai.DefaultHttpxClient(limits=HTTP_LIMITS),
+    )
+
+
+@lru_cache(maxsize=8)
+def get_async_openai_client(api_key: str | None, base_url: str | None = None):
+    """Async counterpart of get_openai_client, for streaming without blocking the event loop."""
+    import openai
+
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=openai.DefaultAsyncHttpxClient(limits=HTTP_LIMITS),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """Return the shared httpx client used for Ollama requests."""
+    return httpx.Client(timeout=60.0, limits=HTTP_LIMITS)
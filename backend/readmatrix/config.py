@@ -33,6 +33,10 @@ class Settings(BaseSettings):
         default="gpt-4o-mini",
         description="LLM model name"
     )
+    llm_max_concurrency: int = Field(
+        default=8,
+        description="Max LLM requests in flight at once across all requests (keep under provider limits)"
+    )
     openai_api_key: str = Field(
         default="",
         description="OpenAI API key"
@@ -61,6 +65,14 @@ class Settings(BaseSettings):
         default="text-embedding-3-small",
         description="Embedding model name"
     )
+    embedding_concurrency: int = Field(
+        default=8,
+        description="Max embedding batches requested concurrently (keep under provider RPM limits)"
+    )
+    embedding_cache_enabled: bool = Field(
+        default=True,
+        description="Reuse stored vectors for unchanged chunk text when indexing (SQLite, keyed by content hash and model)"
+    )
     
     # === Index Configuration ===
     chunk_size: int = Field(
@@ -71,6 +83,22 @@ class Settings(BaseSettings):
         default=50,
         description="Chunk overlap in characters"
     )
+    index_batch_size: int = Field(
+        default=128,
+        description="Chunks embedded and upserted to ChromaDB per batch during full rebuild"
+    )
+    index_workers: int = Field(
+        default=0,
+        description="Processes parsing/chunking files during full rebuild (0 = CPU count - 1, 1 = in-process)"
+    )
+    hash_algo: str = Field(
+        default="xxh3",
+        description="File change-detection hash: xxh3 / blake3 (optional packages, fall back to sha256) or any hashlib algorithm"
+    )
+    index_stat_only: bool = Field(
+        default=False,
+        description="Fast incremental scan: re-index any file whose mtime changed without hashing it to confirm"
+    )
     
     # === Storage Configuration ===
     data_dir: Path = Field(
@@ -94,6 +122,10 @@ class Settings(BaseSettings):
     host: str = Field(default="0.0.0.0")
     port: int = Field(default=8000)
     cors_origins: list[str] = Field(default=["http://localhost:3000"])
+    threadpool_size: int = Field(
+        default=200,
+        description="同步接口与阻塞调用使用的线程池大小",
+    )
     
     # === RAG Configuration ===
     retrieval_top_k: int = Field(default=5, description="Number of chunks to retrieve")
@@ -116,6 +148,44 @@ class Settings(BaseSettings):
         default="BAAI/bge-reranker-v2-m3",
         description="Reranker 模型名称"
     )
+    retrieval_mmr_lambda: float | None = Field(
+        default=None,
+        description="未启用 Reranker 时按 MMR 重排候选：越大越看重相关性、越小越看重多样性(0-1)；为 None 时保持向量检索顺序",
+    )
+
+    # === Answer Cache Configuration ===
+    answer_cache_enabled: bool = Field(
+        default=False,
+        description="是否对新会话的首个问题启用语义答案缓存；命中时跳过检索与 LLM，相似问题可能拿到另一本书的回答，默认关闭",
+    )
+    answer_cache_threshold: float = Field(
+        default=0.95,
+        description="命中答案缓存所需的查询向量余弦相似度",
+    )
+    answer_cache_max_entries: int = Field(default=256, description="答案缓存最大条目数")
+    answer_cache_ttl: float = Field(default=3600.0, description="答案缓存过期时间（秒）")
+
+    # === Retrieval Cache Configuration ===
+    retrieval_cache_enabled: bool = Field(
+        default=False,
+        description="相似查询复用上次检索（含 rerank）得到的 chunk，跳过向量检索与重排序；不同问题也可能命中，默认关闭",
+    )
+    retrieval_cache_threshold: float = Field(
+        default=0.95,
+        description="命中检索缓存所需的查询向量余弦相似度（查询之间比较，应高于查询-文档阈值）",
+    )
+    retrieval_cache_max_entries: int = Field(default=512, description="检索缓存最大条目数")
+    retrieval_cache_ttl: float = Field(default=3600.0, description="检索缓存过期时间（秒）")
+    fused_retrieval_cache_enabled: bool = Field(
+        default=False,
+        description="相似问题复用上次改写 + 多查询融合后的 top-k（跳过改写与各子查询检索）；按答案缓存阈值匹配，需同时启用检索缓存",
+    )
+
+    # === Conversation Configuration ===
+    conversation_cache_size: int = Field(
+        default=1024,
+        description="内存中缓存最近窗口 / 摘要 / token 计数的会话数，超出后淘汰最久未访问的会话",
+    )
 
     # === Context Window Configuration ===
     context_window: int = Field(
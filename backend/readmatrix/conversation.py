@@ -3,16 +3,58 @@
 from __future__ import annotations
 
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Callable
+from functools import lru_cache
+from typing import Any, Callable, Iterator
 
+import numpy as np
+
+from .cache import LRUCache
+from .config import get_settings
 from .indexer.database import Database
 
 
 DEBATE_STATE_PREFIX = "__debate_state__:"
-
-
-@dataclass
+# 仅缓存较短文本的 token 估算，避免长回答占用缓存内存
+TOKEN_CACHE_MAX_CHARS = 2048
+# map-reduce 摘要时每个分段包含的消息数
+SUMMARY_MAP_BATCH_SIZE = 8
+SUMMARY_MAP_WORKERS = 4
+# 新增对话与上次摘要时的新增对话 SimHash 汉明距离不超过该值时，视为重复内容，跳过摘要 LLM 调用
+SUMMARY_SKETCH_MAX_DISTANCE = 4
+_SIMHASH_BITS = np.arange(64, dtype=np.uint64)
+
+
+def _simhash64(text: str) -> int:
+    """64-bit SimHash over character bigrams (in-process only: uses the salted built-in hash)."""
+    if len(text) < 2:
+        text = text.ljust(2)
+    hashes = np.fromiter(
+        (hash(text[i : i + 2]) for i in range(len(text) - 1)),
+        dtype=np.int64,
+        count=len(text) - 1,
+    ).view(np.uint64)
+    # 每一位按所有 bigram 在该位上的 0/1 投票，多数为 1 则置 1
+    ones = ((hashes[:, None] >> _SIMHASH_BITS) & np.uint64(1)).sum(axis=0)
+    bits = (ones * 2 > len(hashes)).astype(np.uint64)
+    return int((bits << _SIMHASH_BITS).sum())
+
+
+@lru_cache(maxsize=1)
+def _get_token_encoder():
+    """Load the tiktoken encoder once when tiktoken is installed (optional)."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@dataclass(slots=True, frozen=True)
 class ConversationMessage:
     """Conversation message model used between service and API layers."""
 
@@ -27,8 +69,10 @@ class ConversationMessage:
     is_summary: bool = False
 
     @classmethod
-    def from_dict(cls, payload: dict) -> "ConversationMessage":
+    def from_dict(cls, payload: dict | ConversationMessage) -> "ConversationMessage":
         """Build a message object from database payload."""
+        if isinstance(payload, cls):
+            return payload
         return cls(
             id=payload["id"],
             conversation_id=payload["conversation_id"],
@@ -60,6 +104,10 @@ class DebateState:
         }
 
 
+# summary_builder(previous_summary, messages, strategy="stuff"|"map"|"reduce") -> str
+SummaryBuilder = Callable[..., str]
+
+
 class ConversationService:
     """Conversation service for CRUD, message IO, and summary refresh."""
 
@@ -67,13 +115,60 @@ class ConversationService:
         self,
         db: Database | None = None,
         window_turns: int = 6,
-        summary_refresh_every: int = 8,
+        summary_token_budget: int = 6000,
         summary_max_chars: int = 1200,
+        summary_stuff_max_tokens: int = 8000,
+        cache_size: int | None = None,
     ):
         self.db = db or Database()
         self.window_turns = max(1, window_turns)
-        self.summary_refresh_every = max(1, summary_refresh_every)
+        self.summary_token_budget = max(1, summary_token_budget)
         self.summary_max_chars = max(200, summary_max_chars)
+        # 待摘要消息超过该 token 数时改用 map-reduce，避免单次调用超出上下文
+        self.summary_stuff_max_tokens = max(1, summary_stuff_max_tokens)
+        # 按会话缓存 summary / recent_window / token_total，写入时按键失效；
+        # 服务进程常驻，按 LRU 淘汰不再活跃的会话，被淘汰的状态下次从数据库重新加载
+        self._cache = LRUCache(
+            maxsize=cache_size if cache_size is not None else get_settings().conversation_cache_size
+        )
+        # 保护各会话 entry 字典的读改写
+        self._cache_lock = threading.Lock()
+        # 摘要刷新调用 LLM，放到后台线程执行；同一会话同时最多一个刷新任务
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+        self._pending: dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+
+    def _cache_get(self, conversation_id: str, key: str) -> Any | None:
+        with self._cache_lock:
+            entry = self._cache.get(conversation_id)
+            return entry.get(key) if entry else None
+
+    def _cache_set(self, conversation_id: str, key: str, value: Any):
+        with self._cache_lock:
+            entry = self._cache.get(conversation_id)
+            if entry is None:
+                entry = {}
+                self._cache.put(conversation_id, entry)
+            entry[key] = value
+
+    def _cache_discard(self, conversation_id: str, *keys: str):
+        with self._cache_lock:
+            entry = self._cache.get(conversation_id)
+            if entry:
+                for key in keys:
+                    entry.pop(key, None)
+
+    def _cache_add(self, conversation_id: str, key: str, amount: int):
+        """Add to a cached counter in place; unseeded counters stay unseeded."""
+        with self._cache_lock:
+            entry = self._cache.get(conversation_id)
+            if entry and key in entry:
+                entry[key] += amount
+
+    def invalidate(self, conversation_id: str):
+        """Drop all cached state for a conversation."""
+        with self._cache_lock:
+            self._cache.pop(conversation_id)
 
     def list_conversations(
         self,
@@ -96,6 +191,26 @@ class ConversationService:
     def delete_conversation(self, conversation_id: str):
         """Delete conversation and all its messages."""
         self.db.delete_conversation(conversation_id)
+        self.invalidate(conversation_id)
+
+    def iter_messages(
+        self,
+        conversation_id: str,
+        limit: int = 30,
+        offset: int = 0,
+        include_system: bool = False,
+    ) -> Iterator[ConversationMessage]:
+        """Read conversation messages in ascending order, building objects lazily.
+
+        The query runs immediately; only the row-to-message mapping is deferred.
+        """
+        records = self.db.list_conversation_messages(
+            conversation_id=conversation_id,
+            limit=limit,
+            offset=offset,
+            include_system=include_system,
+        )
+        return (ConversationMessage.from_dict(item) for item in records)
 
     def list_messages(
         self,
@@ -105,29 +220,63 @@ class ConversationService:
         include_system: bool = False,
     ) -> list[ConversationMessage]:
         """Read conversation messages in ascending order."""
-        records = self.db.list_conversation_messages(
+        return list(
+            self.iter_messages(
+                conversation_id=conversation_id,
+                limit=limit,
+                offset=offset,
+                include_system=include_system,
+            )
+        )
+
+    def list_messages_page(
+        self,
+        conversation_id: str,
+        limit: int = 30,
+        offset: int = 0,
+        include_system: bool = False,
+    ) -> tuple[bool, list[ConversationMessage], int]:
+        """Read one page of messages with existence flag and total count."""
+        exists, records, total = self.db.get_conversation_page(
             conversation_id=conversation_id,
             limit=limit,
             offset=offset,
             include_system=include_system,
         )
-        return [ConversationMessage.from_dict(item) for item in records]
+        return exists, [ConversationMessage.from_dict(item) for item in records], total
 
-    def list_messages_since(
+    def iter_messages_since(
         self,
         conversation_id: str,
         since_created_at: str,
         limit: int = 200,
         include_system: bool = False,
-    ) -> list[ConversationMessage]:
-        """Read conversation messages since a timestamp."""
+    ) -> Iterator[ConversationMessage]:
+        """Read conversation messages since a timestamp, building objects lazily."""
         records = self.db.list_conversation_messages_since(
             conversation_id=conversation_id,
             since_created_at=since_created_at,
             limit=limit,
             include_system=include_system,
         )
-        return [ConversationMessage.from_dict(item) for item in records]
+        return (ConversationMessage.from_dict(item) for item in records)
+
+    def list_messages_since(
+        self,
+        conversation_id: str,
+        since_created_at: str,
+        limit: int = 200,
+        include_system: bool = False,
+    ) -> list[ConversationMessage]:
+        """Read conversation messages since a timestamp."""
+        return list(
+            self.iter_messages_since(
+                conversation_id=conversation_id,
+                since_created_at=since_created_at,
+                limit=limit,
+                include_system=include_system,
+            )
+        )
 
     def get_latest_debate_state(self, conversation_id: str) -> dict | None:
         """Read latest hidden debate state metadata from system message."""
@@ -166,15 +315,30 @@ class ConversationService:
             is_summary=False,
         )
 
+    @contextmanager
+    def batch_append(self, conversation_id: str) -> Iterator["ConversationService"]:
+        """Write the messages appended inside the block in one atomic commit."""
+        try:
+            with self.db.transaction():
+                yield self
+        except Exception:
+            # 事务已回滚，内存中累计的状态不再可信
+            self.invalidate(conversation_id)
+            raise
+
     def append_user_message(self, conversation_id: str, content: str) -> str:
         """Append a user message and return message ID."""
-        return self.db.add_conversation_message(
+        token_estimate = self._estimate_tokens(content)
+        message_id = self.db.add_conversation_message(
             conversation_id=conversation_id,
             role="user",
             content=content,
             citations=[],
-            token_estimate=self._estimate_tokens(content),
+            token_estimate=token_estimate,
         )
+        self._cache_discard(conversation_id, "recent_window")
+        self._cache_add(conversation_id, "token_total", token_estimate)
+        return message_id
 
     def append_assistant_message(
         self,
@@ -184,84 +348,247 @@ class ConversationService:
         is_clarification: bool = False,
     ) -> str:
         """Append an assistant message and return message ID."""
-        return self.db.add_conversation_message(
+        token_estimate = self._estimate_tokens(content)
+        message_id = self.db.add_conversation_message(
             conversation_id=conversation_id,
             role="assistant",
             content=content,
             citations=citations or [],
-            token_estimate=self._estimate_tokens(content),
+            token_estimate=token_estimate,
             is_clarification=is_clarification,
         )
+        self._cache_discard(conversation_id, "recent_window")
+        self._cache_add(conversation_id, "token_total", token_estimate)
+        return message_id
 
     def get_recent_window(self, conversation_id: str) -> list[ConversationMessage]:
         """Read latest message window by turns."""
+        cached = self._cache_get(conversation_id, "recent_window")
+        if cached is not None:
+            return list(cached)
+
         limit = self.window_turns * 2
         records = self.db.get_recent_conversation_messages(
             conversation_id=conversation_id,
             limit=limit,
             include_system=False,
         )
-        return [ConversationMessage.from_dict(item) for item in records]
+        window = [ConversationMessage.from_dict(item) for item in records]
+        self._cache_set(conversation_id, "recent_window", window)
+        return list(window)
 
     def get_summary(self, conversation_id: str) -> str:
         """Read latest summary text."""
-        return self.db.get_latest_summary(conversation_id) or ""
+        cached = self._cache_get(conversation_id, "summary")
+        if cached is not None:
+            return cached
 
-    def save_summary(self, conversation_id: str, summary: str):
-        """Save summary text with truncation."""
+        summary = self.db.get_latest_summary(conversation_id) or ""
+        self._cache_set(conversation_id, "summary", summary)
+        return summary
+
+    def save_summary(
+        self,
+        conversation_id: str,
+        summary: str,
+        last_message_id: str | None = None,
+    ):
+        """Save summary text with truncation, recording the last message it covers."""
         if not summary:
             return
-        safe_summary = summary[: self.summary_max_chars]
-        self.db.save_summary(conversation_id, safe_summary)
+        safe_summary = summary
+        if len(safe_summary) > self.summary_max_chars:
+            safe_summary = safe_summary[: self.summary_max_chars]
+        self.db.save_summary(
+            conversation_id,
+            safe_summary,
+            last_message_id=last_message_id,
+            token_estimate=self._estimate_tokens(safe_summary),
+        )
+        self._cache_set(conversation_id, "summary", safe_summary)
+        # 刷新期间可能有新消息写入，预算按摘要游标从数据库重新播种
+        self._cache_discard(conversation_id, "token_total")
 
     def should_refresh_summary(self, conversation_id: str) -> bool:
-        """Decide whether summary should be refreshed by user turn count."""
-        user_count = self.db.count_conversation_messages(
-            conversation_id=conversation_id,
-            include_system=False,
-            role="user",
-        )
-        return user_count > 0 and user_count % self.summary_refresh_every == 0
+        """Decide whether summary should be refreshed by the unsummarized token budget."""
+        # 首次访问时从数据库播种，之后随 append_* 与 save_summary 在内存中累计
+        token_total = self._cache_get(conversation_id, "token_total")
+        if token_total is None:
+            token_total = self.db.sum_unsummarized_tokens(conversation_id)
+            self._cache_set(conversation_id, "token_total", token_total)
+        return token_total >= self.summary_token_budget
 
     def refresh_summary_if_needed(
         self,
         conversation_id: str,
-        summary_builder: Callable[[str, list[ConversationMessage]], str],
+        summary_builder: SummaryBuilder,
     ) -> None:
-        """Refresh summary when threshold is reached; degrade silently on failure."""
-        if not self.should_refresh_summary(conversation_id):
+        """
+        Schedule a background summary refresh when the threshold is reached; never blocks.
+
+        ``summary_builder(previous_summary, messages, strategy=...)`` 只接收上次摘要
+        之后的新增消息，应在历史摘要基础上增量合并（refine）并返回新摘要。
+        strategy 为 "stuff"（一次性合并）、"map"（总结单个分段，previous_summary 为空）
+        或 "reduce"（messages 为各分段摘要，合并进历史摘要）。
+        """
+        # 只看内存中的累计值，不在请求路径上查询数据库：尚未播种时交给后台线程判断，
+        # 因此异步接口可以直接调用而无需 to_thread
+        token_total = self._cache_get(conversation_id, "token_total")
+        if token_total is not None and token_total < self.summary_token_budget:
             return
 
+        with self._pending_lock:
+            pending = self._pending.get(conversation_id)
+            if pending is not None and not pending.done():
+                return
+            self._pending[conversation_id] = self._executor.submit(
+                self._do_refresh, conversation_id, summary_builder
+            )
+
+    def _do_refresh(
+        self,
+        conversation_id: str,
+        summary_builder: SummaryBuilder,
+    ) -> None:
+        """Rebuild and save the summary; degrade silently on failure."""
+        try:
+            if self.should_refresh_summary(conversation_id):
+                self._refresh_summary(conversation_id, summary_builder)
+        except Exception:
+            pass
+        finally:
+            with self._pending_lock:
+                self._pending.pop(conversation_id, None)
+
+    def _refresh_summary(
+        self,
+        conversation_id: str,
+        summary_builder: SummaryBuilder,
+    ) -> None:
         previous_summary = self.get_summary(conversation_id)
-        history = self.list_messages(
+        records = self.db.list_messages_after(
             conversation_id=conversation_id,
-            limit=self.window_turns * 4,
-            offset=0,
+            after_message_id=self.db.get_summary_cursor(conversation_id),
             include_system=False,
         )
-        if not history:
+        new_messages = [ConversationMessage.from_dict(item) for item in records]
+        if not new_messages:
+            return
+
+        # 新增对话与上次摘要的那段几乎相同（重复提问/回答）时，摘要无需变化：只推进游标
+        sketch = _simhash64("\n".join(item.content for item in new_messages))
+        last_sketch = self._cache_get(conversation_id, "summary_sketch")
+        if (
+            previous_summary
+            and last_sketch is not None
+            and (sketch ^ last_sketch).bit_count() <= SUMMARY_SKETCH_MAX_DISTANCE
+        ):
+            self.save_summary(
+                conversation_id,
+                previous_summary,
+                last_message_id=new_messages[-1].id,
+            )
             return
 
         try:
-            updated_summary = summary_builder(previous_summary, history)
+            if self._choose_summary_strategy(new_messages) == "map_reduce":
+                updated_summary = self._map_reduce_summary(
+                    previous_summary, new_messages, summary_builder
+                )
+            else:
+                updated_summary = summary_builder(
+                    previous_summary, new_messages, strategy="stuff"
+                )
         except Exception:
             return
 
         if updated_summary:
-            self.save_summary(conversation_id, updated_summary)
+            self.save_summary(
+                conversation_id,
+                updated_summary,
+                last_message_id=new_messages[-1].id,
+            )
+            self._cache_set(conversation_id, "summary_sketch", sketch)
+
+    def _choose_summary_strategy(self, messages: list[ConversationMessage]) -> str:
+        """Pick "stuff" when the delta fits in one call, otherwise "map_reduce"."""
+        total = sum(item.token_estimate for item in messages)
+        return "stuff" if total <= self.summary_stuff_max_tokens else "map_reduce"
+
+    def _map_reduce_summary(
+        self,
+        previous_summary: str,
+        messages: list[ConversationMessage],
+        summary_builder: SummaryBuilder,
+    ) -> str:
+        """Summarize message batches concurrently, then fold them into the previous summary."""
+        batches = [
+            messages[i : i + SUMMARY_MAP_BATCH_SIZE]
+            for i in range(0, len(messages), SUMMARY_MAP_BATCH_SIZE)
+        ]
+        # 独立线程池：当前已运行在 self._executor 中，复用它可能因等待自身而死锁
+        with ThreadPoolExecutor(
+            max_workers=min(SUMMARY_MAP_WORKERS, len(batches)),
+            thread_name_prefix="summary-map",
+        ) as executor:
+            partials = list(
+                executor.map(
+                    lambda batch: summary_builder("", batch, strategy="map"),
+                    batches,
+                )
+            )
+
+        partial_messages = [
+            ConversationMessage(
+                id=batch[-1].id,
+                conversation_id=batch[-1].conversation_id,
+                role="system",
+                content=partial,
+                citations=[],
+                created_at=batch[-1].created_at,
+                token_estimate=self._estimate_tokens(partial),
+                is_summary=True,
+            )
+            for batch, partial in zip(batches, partials)
+            if partial
+        ]
+        if not partial_messages:
+            return ""
+        return summary_builder(previous_summary, partial_messages, strategy="reduce")
+
+    def close(self):
+        """Wait for pending summary refreshes and stop the background worker."""
+        self._executor.shutdown(wait=True)
 
     def get_recent_clarification_count(self, conversation_id: str, limit: int = 2) -> int:
         """Count recent consecutive clarification replies."""
         return self.db.count_recent_clarifications(conversation_id=conversation_id, limit=limit)
 
     def _estimate_tokens(self, content: str) -> int:
-        """Rough token estimate for future cost tracking."""
-        return max(1, len(content) // 4)
+        """Token estimate for cost tracking: tiktoken if available, else UTF-8 bytes / 4."""
+        if len(content) <= TOKEN_CACHE_MAX_CHARS:
+            return self._estimate_tokens_cached(content)
+        return self._estimate_tokens_uncached(content)
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _estimate_tokens_cached(content: str) -> int:
+        return ConversationService._estimate_tokens_uncached(content)
+
+    @staticmethod
+    def _estimate_tokens_uncached(content: str) -> int:
+        encoder = _get_token_encoder()
+        if encoder is not None:
+            return max(1, len(encoder.encode(content, disallowed_special=())))
+        # 按字节估算，中文（3 字节/字）比按字符数更接近真实 token 数
+        return max(1, len(content.encode("utf-8", "ignore")) // 4)
 
 
 class ContextAssembler:
     """Assemble summary, recent dialogue, and retrieved note context."""
 
+    _ROLE_PREFIX = {"user": "用户: ", "assistant": "助手: "}
+
     def __init__(self, summary_max_chars: int = 1200):
         self.summary_max_chars = max(200, summary_max_chars)
 
@@ -272,7 +599,9 @@ class ContextAssembler:
         retrieved_context: str,
     ) -> dict[str, str]:
         """Build structured context sections for prompt injection."""
-        conversation_summary = summary.strip()[: self.summary_max_chars] if summary else ""
+        conversation_summary = summary.strip() if summary else ""
+        if len(conversation_summary) > self.summary_max_chars:
+            conversation_summary = conversation_summary[: self.summary_max_chars]
         recent_dialogue = self._format_recent_dialogue(recent_messages)
         note_context = retrieved_context.strip() if retrieved_context else ""
 
@@ -284,16 +613,17 @@ class ContextAssembler:
 
     def _format_recent_dialogue(self, messages: list[ConversationMessage]) -> str:
         """Format recent messages into readable dialogue text."""
-        lines: list[str] = []
+        role_prefix = self._ROLE_PREFIX
+        parts: list[str] = []
         for item in messages:
-            if item.role == "user":
-                prefix = "用户"
-            elif item.role == "assistant":
-                prefix = "助手"
-            else:
+            prefix = role_prefix.get(item.role)
+            if prefix is None or not item.content:
                 continue
             text = item.content.strip()
-            if not text:
-                continue
-            lines.append(f"{prefix}: {text}")
-        return "\n".join(lines)
+            if text:
+                parts.append(prefix)
+                parts.append(text)
+                parts.append("\n")
+        if parts:
+            parts.pop()  # 去掉末尾换行
+        return "".join(parts)
@@ -2,23 +2,50 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import hashlib
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from statistics import mean
-from typing import Any
-import json
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional
 
+import numpy as np
+import orjson
 from rich.console import Console
 from rich.table import Table
 import typer
 
-from .retriever import Retriever
-from .qa import QAEngine
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from .qa import QAEngine
+    from .retriever import Retriever
 
 
 console = Console()
 app = typer.Typer(help="RAG 评测工具")
 
+# 检索评测时每次批量嵌入的查询数
+EVAL_BATCH_SIZE = 32
+
+
+def _get_retriever() -> Retriever:
+    """延迟导入并构建检索器，--help 或参数校验失败时不加载向量库。"""
+    from .retriever import Retriever
+
+    # 关闭精确与语义检索缓存：相似用例不能复用之前用例的检索结果，否则 hit@k/MRR 失真
+    return Retriever(cache_enabled=False)
+
+
+def _get_qa_engine() -> QAEngine:
+    """延迟导入并构建问答引擎，仅生成模式需要。"""
+    from .qa import QAEngine
+
+    return QAEngine(retriever=_get_retriever())
+
 
 @dataclass
 class EvalCase:
@@ -27,68 +54,206 @@ class EvalCase:
     case_id: str
     query: str
     expected: dict[str, Any]
+    # 加载时预先规范化的期望条件，评测循环中直接使用
+    norm_book_titles: tuple[str, ...] = field(init=False)
+    norm_source_paths: tuple[str, ...] = field(init=False)
+    must_include: tuple[str, ...] = field(init=False)
+    matcher: Callable[[Any], bool] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        expected = self.expected or {}
+        self.norm_book_titles = tuple(_normalize_text(x) for x in expected.get("book_title", []))
+        self.norm_source_paths = tuple(
+            _normalize_text(x) for x in expected.get("source_path", [])
+        )
+        self.must_include = tuple(expected.get("must_include", []))
+        self.matcher = _build_matcher(
+            self.norm_book_titles,
+            self.norm_source_paths,
+            self.must_include,
+            enabled=bool(expected),
+        )
 
 
+@lru_cache(maxsize=8192)
 def _normalize_text(text: str) -> str:
     """规范化文本，便于路径或标题匹配。"""
     return text.replace("\\", "/").strip().lower()
 
 
-def _matches_expected(chunk, expected: dict[str, Any]) -> bool:
-    """判断检索结果是否满足期望条件。"""
-    if not expected:
-        return False
+def _build_matcher(
+    book_titles: tuple[str, ...],
+    source_paths: tuple[str, ...],
+    must_include: tuple[str, ...],
+    enabled: bool = True,
+) -> Callable[[Any], bool]:
+    """按已规范化的期望条件预编译匹配函数，缺省条件直接跳过。"""
+    if not enabled:
+        return lambda chunk: False
 
-    book_titles = [_normalize_text(x) for x in expected.get("book_title", [])]
-    source_paths = [_normalize_text(x) for x in expected.get("source_path", [])]
-    must_include = expected.get("must_include", [])
-
-    match = True
+    checks: list[Callable[[Any], bool]] = []
     if book_titles:
-        match = match and any(
-            bt in _normalize_text(chunk.book_title) for bt in book_titles
-        )
-    if source_paths:
-        match = match and any(
-            sp in _normalize_text(chunk.source_path) for sp in source_paths
-        )
-    if must_include:
-        match = match and all(keyword in chunk.content for keyword in must_include)
-
-    return match
+        def check_book_title(chunk) -> bool:
+            title = chunk.book_title.replace("\\", "/").lower()
+            return any(bt in title for bt in book_titles)
 
+        checks.append(check_book_title)
+    if source_paths:
+        def check_source_path(chunk) -> bool:
+            path = chunk.source_path.replace("\\", "/").lower()
+            return any(sp in path for sp in source_paths)
 
-def load_cases(cases_path: Path) -> list[EvalCase]:
-    """从 jsonl 文件加载评测样例。"""
-    cases = []
-    for line in cases_path.read_text(encoding="utf-8").splitlines():
-        if not line.strip():
-            continue
-        payload = json.loads(line)
-        cases.append(
-            EvalCase(
+        checks.append(check_source_path)
+    if must_include:
+        def check_content(chunk) -> bool:
+            content = chunk.content
+            return all(keyword in content for keyword in must_include)
+
+        checks.append(check_content)
+
+    if len(checks) == 1:
+        return checks[0]
+    return lambda chunk: all(check(chunk) for check in checks)
+
+
+@dataclass(slots=True)
+class CachedChunk:
+    """检索缓存中持久化的精简 chunk，只保留打分用到的字段。"""
+
+    book_title: str
+    source_path: str
+    content: str
+    distance: float | None
+
+
+# 参与检索的源码文件；任一文件改动后评测缓存失效
+RETRIEVAL_SOURCE_FILES = (
+    "retriever.py",
+    "reranker.py",
+    "models.py",
+    "indexer/vectorstore.py",
+    "indexer/embedder.py",
+)
+
+
+@lru_cache(maxsize=1)
+def _retrieval_code_signature() -> str:
+    """检索相关源码的摘要。"""
+    package_dir = Path(__file__).parent
+    digest = hashlib.sha256()
+    for name in RETRIEVAL_SOURCE_FILES:
+        digest.update(name.encode("utf-8"))
+        digest.update((package_dir / name).read_bytes())
+    return digest.hexdigest()
+
+
+class RetrievalCache:
+    """
+    按查询持久化检索结果（shelve），重复评测时跳过检索。
+
+    键包含全部配置、检索相关源码与索引内容（各文件哈希）的摘要，
+    改参数、改代码或笔记内容变化后自动失效。
+    """
+
+    def __init__(self, cache_dir: Path, retriever: Retriever, top_k: int):
+        settings = get_settings()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        vectorstore = retriever.vectorstore
+        self._fingerprint = repr(
+            (
+                settings.model_dump_json(),
+                _retrieval_code_signature(),
+                vectorstore.db.get_index_signature(),
+                vectorstore.get_chunk_count(),
+                top_k,
+            )
+        )
+        self._shelf = shelve.open(str(cache_dir / "retrieval"))
+        # shelve 不支持并发访问，评测批次在线程池中运行
+        self._lock = threading.Lock()
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(f"{self._fingerprint}\0{query}".encode("utf-8")).hexdigest()
+
+    def get(self, query: str) -> list[CachedChunk] | None:
+        with self._lock:
+            return self._shelf.get(self._key(query))
+
+    def put(self, query: str, chunks: list) -> list[CachedChunk]:
+        cached = [
+            CachedChunk(
+                book_title=c.book_title,
+                source_path=c.source_path,
+                content=c.content,
+                distance=c.distance,
+            )
+            for c in chunks
+        ]
+        with self._lock:
+            self._shelf[self._key(query)] = cached
+        return cached
+
+    def close(self):
+        with self._lock:
+            self._shelf.close()
+
+
+def load_cases(cases_path: Path) -> Iterator[EvalCase]:
+    """从 jsonl 文件逐行流式加载评测样例。"""
+    with cases_path.open("rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            payload = orjson.loads(line)
+            yield EvalCase(
                 case_id=str(payload.get("id", "")),
                 query=str(payload.get("query", "")),
                 expected=payload.get("expected", {}),
             )
-        )
-    return cases
 
 
 def evaluate_retrieval(case: EvalCase, retriever: Retriever, top_k: int) -> dict[str, Any]:
     """评估单条样例并返回检索结果字典。"""
     chunks = retriever.search(query=case.query, top_k=top_k)
+    return _score_retrieval(case, chunks)
+
+
+def evaluate_retrieval_batch(
+    cases: list[EvalCase],
+    retriever: Retriever,
+    top_k: int,
+    cache: RetrievalCache | None = None,
+) -> list[dict[str, Any]]:
+    """批量评估样例：一次请求生成整批查询向量，再逐条检索打分；命中缓存的样例跳过检索。"""
+    chunk_lists: list[list | None] = [
+        cache.get(case.query) if cache else None for case in cases
+    ]
+    missing = [i for i, chunks in enumerate(chunk_lists) if chunks is None]
+    if missing:
+        fresh = retriever.search_batch([cases[i].query for i in missing], top_k=top_k)
+        for i, chunks in zip(missing, fresh):
+            chunk_lists[i] = cache.put(cases[i].query, chunks) if cache else chunks
+    return [_score_retrieval(case, chunks) for case, chunks in zip(cases, chunk_lists)]
+
+
+def _score_retrieval(case: EvalCase, chunks: list) -> dict[str, Any]:
+    """根据检索结果计算命中、排名与平均距离（单次遍历）。"""
     rank = None
     matched_title = ""
+    matcher = case.matcher
+    dist_sum = 0.0
+    dist_count = 0
 
     for idx, chunk in enumerate(chunks, 1):
-        if _matches_expected(chunk, case.expected):
+        if chunk.distance is not None:
+            dist_sum += chunk.distance
+            dist_count += 1
+        if rank is None and matcher(chunk):
             rank = idx
             matched_title = chunk.book_title
-            break
 
-    distances = [c.distance for c in chunks if c.distance is not None]
-    avg_distance = mean(distances) if distances else None
+    avg_distance = dist_sum / dist_count if dist_count else None
 
     return {
         "id": case.case_id,
@@ -109,7 +274,7 @@ def evaluate_generation(case: EvalCase, qa_engine: QAEngine) -> dict[str, Any]:
     matched_titles = []
 
     if case.expected:
-        book_titles = [_normalize_text(x) for x in case.expected.get("book_title", [])]
+        book_titles = case.norm_book_titles
 
         for cit in citations:
             cit_book_title = _normalize_text(cit.book_title)
@@ -133,14 +298,24 @@ def summarize_results(results: list[dict[str, Any]], mode: str) -> dict[str, flo
     if not results:
         return {}
 
+    # 一次遍历装入结构化数组，再做向量化归约
     if mode == "retrieval":
-        hit_rate = sum(1 for r in results if r["hit"]) / len(results)
-        mrr = sum(r["mrr"] for r in results) / len(results)
-        return {"hit_rate": hit_rate, "mrr": mrr}
+        arr = np.fromiter(
+            ((r["hit"], r["mrr"]) for r in results),
+            dtype=[("hit", "?"), ("mrr", "f8")],
+            count=len(results),
+        )
+        return {"hit_rate": float(arr["hit"].mean()), "mrr": float(arr["mrr"].mean())}
     else:  # generation
-        citation_recall = sum(1 for r in results if r["citation_hit"]) / len(results)
-        avg_citations = sum(r["citation_count"] for r in results) / len(results)
-        return {"citation_recall": citation_recall, "avg_citations": avg_citations}
+        arr = np.fromiter(
+            ((r["citation_hit"], r["citation_count"]) for r in results),
+            dtype=[("citation_hit", "?"), ("citation_count", "i8")],
+            count=len(results),
+        )
+        return {
+            "citation_recall": float(arr["citation_hit"].mean()),
+            "avg_citations": float(arr["citation_count"].mean()),
+        }
 
 
 @app.command()
@@ -153,6 +328,22 @@ def run(
     top_k: int = typer.Option(5, "--top-k", help="每条样例的检索数量"),
     mode: str = typer.Option("retrieval", "--mode", "-m", help="模式: retrieval | generation"),
     limit: int = typer.Option(0, "--limit", "-n", help="限制测试数量（0为不限制）"),
+    concurrency: int = typer.Option(
+        8,
+        "--concurrency",
+        "-c",
+        help="并发评测的样例数（生成模式受 LLM 限流影响，可适当调低）",
+    ),
+    use_cache: bool = typer.Option(
+        False,
+        "--cache",
+        help="缓存检索结果，重复评测时跳过检索（配置、代码或索引内容变化后自动失效；仅检索模式）",
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None,
+        "--cache-dir",
+        help="检索结果缓存目录（默认 data_dir/eval_cache，需配合 --cache）",
+    ),
 ) -> None:
     """运行离线 RAG 评测（检索或生成）。"""
     cases_path = cases
@@ -162,19 +353,43 @@ def run(
         console.print(f"[red]评测文件不存在: {cases_path}[/red]")
         raise typer.Exit(code=1)
 
-    case_list = load_cases(cases_path)
+    cases_iter = load_cases(cases_path)
+    # 限制数量时只解析前 N 行
+    case_list = list(islice(cases_iter, limit) if limit > 0 else cases_iter)
     if not case_list:
         console.print("[yellow]评测样例为空[/yellow]")
         return
 
-    if limit > 0:
-        case_list = case_list[:limit]
-
     console.print(f"[bold]Running {mode} evaluation on {len(case_list)} cases...[/bold]")
+    max_workers = max(1, min(concurrency, len(case_list)))
 
     if mode == "retrieval":
-        retriever = Retriever()
-        results = [evaluate_retrieval(case, retriever, top_k) for case in case_list]
+        retriever = _get_retriever()
+        cache = None
+        if use_cache:
+            cache = RetrievalCache(
+                cache_dir or get_settings().data_dir / "eval_cache", retriever, top_k
+            )
+        batches = [
+            case_list[i : i + EVAL_BATCH_SIZE]
+            for i in range(0, len(case_list), EVAL_BATCH_SIZE)
+        ]
+        # 每批一次嵌入请求；批次之间相互独立且以网络 I/O 为主，用线程池重叠等待
+        try:
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(max_workers, len(batches)))
+            ) as executor:
+                results = [
+                    result
+                    for batch_results in executor.map(
+                        lambda batch: evaluate_retrieval_batch(batch, retriever, top_k, cache),
+                        batches,
+                    )
+                    for result in batch_results
+                ]
+        finally:
+            if cache is not None:
+                cache.close()
         summary = summarize_results(results, mode)
 
         table = Table(show_header=True)
@@ -199,12 +414,21 @@ def run(
         )
 
     elif mode == "generation":
-        qa_engine = QAEngine()
+        qa_engine = _get_qa_engine()
         results = []
 
-        with typer.progressbar(case_list, label="Generating answers") as progress:
-            for case in progress:
-                results.append(evaluate_generation(case, qa_engine))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            generated = executor.map(
+                lambda case: evaluate_generation(case, qa_engine),
+                case_list,
+            )
+            with typer.progressbar(
+                generated,
+                length=len(case_list),
+                label="Generating answers",
+            ) as progress:
+                for result in progress:
+                    results.append(result)
 
         summary = summarize_results(results, mode)
 
@@ -1,16 +1,52 @@
 """Indexer module - database, vector store, embedding, and index management"""
 
-from .database import Database
-from .vectorstore import VectorStore
-from .embedder import get_embedding_provider, OpenAIEmbedding, OllamaEmbedding, SiliconFlowEmbedding
-from .manager import IndexManager
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .database import Database
+    from .vectorstore import VectorStore
+    from .embedder import (
+        get_embedding_provider,
+        CachedEmbedding,
+        OpenAIEmbedding,
+        OllamaEmbedding,
+        SiliconFlowEmbedding,
+    )
+    from .manager import IndexManager
+
+# 按需导入子模块（PEP 562），只用 Database 时不会加载 chromadb / embedding 客户端
+_LAZY = {
+    "Database": "database",
+    "VectorStore": "vectorstore",
+    "get_embedding_provider": "embedder",
+    "CachedEmbedding": "embedder",
+    "OpenAIEmbedding": "embedder",
+    "OllamaEmbedding": "embedder",
+    "SiliconFlowEmbedding": "embedder",
+    "IndexManager": "manager",
+}
 
 __all__ = [
     "Database",
     "VectorStore",
     "get_embedding_provider",
+    "CachedEmbedding",
     "OpenAIEmbedding",
     "OllamaEmbedding",
     "SiliconFlowEmbedding",
     "IndexManager",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY))
@@ -1,28 +1,55 @@
 """SQLite database for file index state and conversation management"""
 
-import json
+import hashlib
 import sqlite3
+import threading
 import uuid
+import weakref
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterator
+from typing import Any, Iterable, Iterator
+
+import orjson
 
 from ..config import get_settings
 from ..models import FileRecord
 
 
-CREATE_TABLES_SQL = """
-CREATE TABLE IF NOT EXISTS files (
+# files 行很窄且总按 path 查找，WITHOUT ROWID 让主键 B 树直接存整行，省去 rowid 表 + 主键索引两套结构
+FILES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {name} (
     path TEXT PRIMARY KEY,
     hash TEXT NOT NULL,
     mtime REAL NOT NULL,
+    size INTEGER,
     status TEXT NOT NULL DEFAULT 'pending',
     source_type TEXT NOT NULL DEFAULT 'markdown',
     book_id TEXT,
     last_error TEXT,
     updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# seq 是单调递增的整数主键（即 rowid），消息按它保持插入顺序；对外仍使用 UUID 文本 id
+MESSAGES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {name} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    citations_json TEXT,
+    created_at TEXT NOT NULL,
+    token_estimate INTEGER NOT NULL DEFAULT 0,
+    is_clarification INTEGER NOT NULL DEFAULT 0,
+    is_summary INTEGER NOT NULL DEFAULT 0,
+    summary_last_message_id TEXT,
+    FOREIGN KEY(conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
 );
+"""
+
+CREATE_TABLES_SQL = FILES_TABLE_SQL.format(name="files") + """
 
 CREATE TABLE IF NOT EXISTS tasks (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,27 +70,140 @@ CREATE TABLE IF NOT EXISTS conversations (
     status TEXT NOT NULL DEFAULT 'active'
 );
 
-CREATE TABLE IF NOT EXISTS conversation_messages (
-    id TEXT PRIMARY KEY,
-    conversation_id TEXT NOT NULL,
-    role TEXT NOT NULL,
-    content TEXT NOT NULL,
-    citations_json TEXT,
-    created_at TEXT NOT NULL,
-    token_estimate INTEGER NOT NULL DEFAULT 0,
-    is_clarification INTEGER NOT NULL DEFAULT 0,
-    is_summary INTEGER NOT NULL DEFAULT 0,
-    FOREIGN KEY(conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
-);
+-- 按 (内容哈希, 模型) 缓存 float32 向量，全量重建时未变化的 chunk 不再请求 embedding
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    content_hash TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (content_hash, model_id)
+) WITHOUT ROWID;
+
+-- 源文件 -> chunk id 的旁路索引，删除文件的 chunk 时无需在 ChromaDB 中按 metadata 扫描
+CREATE TABLE IF NOT EXISTS chunk_sources (
+    source_path TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    PRIMARY KEY (source_path, chunk_id)
+) WITHOUT ROWID;
+""" + MESSAGES_TABLE_SQL.format(name="conversation_messages")
 
+# 索引与触发器在 _migrate 重建旧表之后创建
+CREATE_INDEXES_SQL = """
 CREATE INDEX IF NOT EXISTS idx_files_status ON files(status);
 CREATE INDEX IF NOT EXISTS idx_files_book_id ON files(book_id);
 CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
 CREATE INDEX IF NOT EXISTS idx_conv_updated_at ON conversations(updated_at);
 CREATE INDEX IF NOT EXISTS idx_msg_conversation_created_at ON conversation_messages(conversation_id, created_at);
-CREATE INDEX IF NOT EXISTS idx_msg_conversation_summary ON conversation_messages(conversation_id, is_summary);
+-- 最近 N 条 / 最新摘要 / 最近澄清等 "ORDER BY seq DESC LIMIT N" 查询直接从索引尾部读取，无需临时排序
+CREATE INDEX IF NOT EXISTS idx_msg_conv_seq ON conversation_messages(conversation_id, seq);
+CREATE INDEX IF NOT EXISTS idx_msg_conv_summary_seq ON conversation_messages(conversation_id, is_summary, seq);
+CREATE INDEX IF NOT EXISTS idx_msg_conv_role_seq ON conversation_messages(conversation_id, role, seq);
+
+-- 写入消息时在同一语句内刷新会话活跃时间，省去一次独立的 UPDATE
+CREATE TRIGGER IF NOT EXISTS trg_msg_touch_conversation
+AFTER INSERT ON conversation_messages
+BEGIN
+    UPDATE conversations SET updated_at = NEW.created_at WHERE id = NEW.conversation_id;
+END;
+
+-- 摘要通过 upsert 覆盖时走 UPDATE 分支，同样刷新会话活跃时间
+CREATE TRIGGER IF NOT EXISTS trg_msg_touch_conversation_on_update
+AFTER UPDATE OF created_at ON conversation_messages
+BEGIN
+    UPDATE conversations SET updated_at = NEW.created_at WHERE id = NEW.conversation_id;
+END;
+"""
+
+# sqlite3 按 SQL 文本缓存已编译语句；热点语句定义为模块常量，保证每次命中同一缓存项
+STATEMENT_CACHE_SIZE = 256
+
+UPSERT_FILE_SQL = """
+INSERT INTO files (path, hash, mtime, status, source_type, book_id, last_error, updated_at, size)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    hash = excluded.hash,
+    mtime = excluded.mtime,
+    size = excluded.size,
+    status = excluded.status,
+    source_type = excluded.source_type,
+    book_id = excluded.book_id,
+    last_error = excluded.last_error,
+    updated_at = excluded.updated_at
+"""
+
+UPDATE_FILE_STATUS_SQL = """
+UPDATE files SET status = ?, last_error = ?, updated_at = ?
+WHERE path = ?
+"""
+
+UPDATE_FILE_MTIME_SQL = "UPDATE files SET mtime = ?, updated_at = ? WHERE path = ?"
+
+INSERT_EMBEDDING_SQL = """
+INSERT OR IGNORE INTO embedding_cache (content_hash, model_id, vector)
+VALUES (?, ?, ?)
 """
 
+INSERT_CHUNK_SOURCE_SQL = "INSERT OR IGNORE INTO chunk_sources (source_path, chunk_id) VALUES (?, ?)"
+
+# 按内容哈希批量查询向量缓存时，每条 IN (...) 语句携带的哈希数
+EMBEDDING_LOOKUP_BATCH_SIZE = 500
+
+UPDATE_TASK_PROGRESS_SQL = "UPDATE tasks SET progress = ?, updated_at = ? WHERE id = ?"
+
+INSERT_MESSAGE_SQL = """
+INSERT INTO conversation_messages (
+    id,
+    conversation_id,
+    role,
+    content,
+    citations_json,
+    created_at,
+    token_estimate,
+    is_clarification,
+    is_summary,
+    summary_last_message_id
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 每个会话至多一条摘要（idx_msg_summary_unique），新摘要原地覆盖旧摘要
+UPSERT_SUMMARY_SQL = INSERT_MESSAGE_SQL + """
+ON CONFLICT(conversation_id) WHERE is_summary = 1 DO UPDATE SET
+    id = excluded.id,
+    content = excluded.content,
+    created_at = excluded.created_at,
+    token_estimate = excluded.token_estimate,
+    summary_last_message_id = excluded.summary_last_message_id
+"""
+
+# 增量更新启动时全表读取；WITHOUT ROWID 表按主键 B 树顺序扫描，整行即在叶子节点
+ALL_FILE_RECORDS_SQL = "SELECT path, hash, mtime, size FROM files"
+
+# 热点读取使用固定列序并按位置取值，配合 _tuple_cursor 跳过 sqlite3.Row 的构造
+FILE_COLUMNS = "path, hash, mtime, status, source_type, book_id, last_error, updated_at, size"
+MESSAGE_COLUMNS = (
+    "id, conversation_id, role, content, citations_json, created_at, "
+    "token_estimate, is_clarification, is_summary"
+)
+
+# Per-connection tuning; journal_mode=WAL is persisted in the file by _init_db
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 10737418240",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 30000",
+)
+
+
+def _now_iso() -> str:
+    """Current local time as the ISO-8601 text stored in timestamp columns."""
+    return datetime.now().isoformat()
+
+
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection subclass so instances can be weakly referenced."""
+
 
 class Database:
     """SQLite database manager for file index state and conversations"""
@@ -72,19 +212,112 @@ class Database:
         settings = get_settings()
         self.db_path = db_path or settings.sqlite_path
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 每个线程复用一条长连接，避免每次调用都重新打开数据库文件与 WAL
+        self._local = threading.local()
+        # 线程退出后其连接随 threading.local 释放，这里只弱引用以便 close_all
+        self._connections: weakref.WeakSet[sqlite3.Connection] = weakref.WeakSet()
         self._init_db()
 
     def _init_db(self):
         """Initialize database tables"""
         with self.connection() as conn:
+            # WAL 允许读写并发，且模式会持久化到数据库文件
+            conn.execute("PRAGMA journal_mode = WAL")
             conn.executescript(CREATE_TABLES_SQL)
+            self._migrate(conn)
+            conn.executescript(CREATE_INDEXES_SQL)
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """为旧库补齐新增列与表结构变更（CREATE TABLE IF NOT EXISTS 不会修改已有表）"""
+        files_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'files'"
+        ).fetchone()["sql"]
+        file_columns = {row["name"] for row in conn.execute("PRAGMA table_info(files)")}
+        if "size" not in file_columns:
+            # 须在下面的重建之前补列：重建按 FILE_COLUMNS 复制数据
+            conn.execute("ALTER TABLE files ADD COLUMN size INTEGER")
+        if "WITHOUT ROWID" not in files_sql.upper():
+            # 旧库的 files 是普通 rowid 表，重建为 WITHOUT ROWID；其索引随旧表删除后统一重建
+            conn.execute(FILES_TABLE_SQL.format(name="files_new"))
+            conn.execute(f"INSERT INTO files_new ({FILE_COLUMNS}) SELECT {FILE_COLUMNS} FROM files")
+            conn.execute("DROP TABLE files")
+            conn.execute("ALTER TABLE files_new RENAME TO files")
+        # files 已是以 path 为键的 WITHOUT ROWID 表，全表读取直接扫描主键 B 树；
+        # 旧的 (path, hash, mtime) 覆盖索引不再覆盖查询，只会增加写入开销
+        conn.execute("DROP INDEX IF EXISTS idx_files_covering")
+
+        columns = {
+            row["name"]
+            for row in conn.execute("PRAGMA table_info(conversation_messages)")
+        }
+        if "summary_last_message_id" not in columns:
+            conn.execute(
+                "ALTER TABLE conversation_messages ADD COLUMN summary_last_message_id TEXT"
+            )
+        if "seq" not in columns:
+            # 旧库以 UUID 文本为主键，按时间顺序复制进带 seq 自增主键的新表
+            message_columns = f"{MESSAGE_COLUMNS}, summary_last_message_id"
+            conn.execute(MESSAGES_TABLE_SQL.format(name="conversation_messages_new"))
+            conn.execute(
+                f"""
+                INSERT INTO conversation_messages_new ({message_columns})
+                SELECT {message_columns} FROM conversation_messages
+                ORDER BY created_at, rowid
+                """
+            )
+            conn.execute("DROP TABLE conversation_messages")
+            conn.execute("ALTER TABLE conversation_messages_new RENAME TO conversation_messages")
+
+        has_summary_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_msg_summary_unique'"
+        ).fetchone()
+        if not has_summary_index:
+            # 建唯一索引前只保留每个会话最新的一条摘要
+            conn.execute(
+                """
+                DELETE FROM conversation_messages
+                WHERE is_summary = 1 AND seq NOT IN (
+                    SELECT MAX(seq) FROM conversation_messages
+                    WHERE is_summary = 1
+                    GROUP BY conversation_id
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE UNIQUE INDEX idx_msg_summary_unique
+                ON conversation_messages(conversation_id) WHERE is_summary = 1
+                """
+            )
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        """Return this thread's persistent connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                str(self.db_path),
+                check_same_thread=False,
+                factory=_Connection,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            conn.row_factory = sqlite3.Row
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            self._local.depth = 0
+            self._connections.add(conn)
+        return conn
 
     @contextmanager
     def connection(self) -> Iterator[sqlite3.Connection]:
-        """Get database connection with auto-commit"""
-        conn = sqlite3.connect(str(self.db_path))
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
+        """Get this thread's connection; the outermost block commits or rolls back."""
+        conn = self._thread_connection()
+        if self._local.depth:
+            # 嵌套调用（如 transaction() 内）复用同一事务，由最外层统一提交或回滚
+            yield conn
+            return
+
+        self._local.depth = 1
         try:
             yield conn
             conn.commit()
@@ -92,78 +325,113 @@ class Database:
             conn.rollback()
             raise
         finally:
+            self._local.depth = 0
+
+    @staticmethod
+    def _tuple_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+        """Cursor returning plain tuples, for hot reads that unpack by position."""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Group several writes on this thread into one commit (reentrant)."""
+        with self.connection() as conn:
+            yield conn
+
+    def close_all(self):
+        """Close every thread's cached connection (call on shutdown)."""
+        for conn in list(self._connections):
             conn.close()
+        self._connections.clear()
+        self._local = threading.local()
 
     # === File Records ===
 
-    def get_all_file_records(self) -> dict[str, tuple[str, float]]:
-        """Get all indexed file records as path -> (hash, mtime)"""
+    def get_all_file_records(self) -> dict[str, tuple[str, float, int | None]]:
+        """Get all indexed file records as path -> (hash, mtime, size)"""
         with self.connection() as conn:
-            rows = conn.execute("SELECT path, hash, mtime FROM files").fetchall()
-            return {row["path"]: (row["hash"], row["mtime"]) for row in rows}
+            rows = self._tuple_cursor(conn).execute(ALL_FILE_RECORDS_SQL)
+            return {path: (file_hash, mtime, size) for path, file_hash, mtime, size in rows}
 
     def get_file_record(self, path: str) -> FileRecord | None:
         """Get a single file record"""
         with self.connection() as conn:
-            row = conn.execute(
-                "SELECT * FROM files WHERE path = ?", (path,)
+            row = self._tuple_cursor(conn).execute(
+                f"SELECT {FILE_COLUMNS} FROM files WHERE path = ?", (path,)
             ).fetchone()
             if row:
                 return FileRecord(
-                    path=row["path"],
-                    hash=row["hash"],
-                    mtime=row["mtime"],
-                    status=row["status"],
-                    source_type=row["source_type"],
-                    book_id=row["book_id"],
-                    last_error=row["last_error"],
-                    updated_at=datetime.fromisoformat(row["updated_at"]),
+                    *row[:7], updated_at=datetime.fromisoformat(row[7]), size=row[8]
                 )
             return None
 
+    @staticmethod
+    def _file_record_params(record: FileRecord) -> tuple:
+        return (
+            record.path,
+            record.hash,
+            record.mtime,
+            record.status,
+            record.source_type,
+            record.book_id,
+            record.last_error,
+            record.updated_at.isoformat(),
+            record.size,
+        )
+
     def upsert_file_record(self, record: FileRecord):
         """Insert or update a file record"""
         with self.connection() as conn:
-            conn.execute(
-                """
-                INSERT INTO files (path, hash, mtime, status, source_type, book_id, last_error, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(path) DO UPDATE SET
-                    hash = excluded.hash,
-                    mtime = excluded.mtime,
-                    status = excluded.status,
-                    source_type = excluded.source_type,
-                    book_id = excluded.book_id,
-                    last_error = excluded.last_error,
-                    updated_at = excluded.updated_at
-                """,
-                (
-                    record.path,
-                    record.hash,
-                    record.mtime,
-                    record.status,
-                    record.source_type,
-                    record.book_id,
-                    record.last_error,
-                    record.updated_at.isoformat(),
-                ),
-            )
+            conn.execute(UPSERT_FILE_SQL, self._file_record_params(record))
+
+    def upsert_file_records(self, records: Iterable[FileRecord]):
+        """Insert or update many file records in a single transaction"""
+        params = [self._file_record_params(record) for record in records]
+        if not params:
+            return
+        with self.connection() as conn:
+            conn.executemany(UPSERT_FILE_SQL, params)
 
     def delete_file_record(self, path: str):
         """Delete a file record"""
         with self.connection() as conn:
             conn.execute("DELETE FROM files WHERE path = ?", (path,))
 
+    def delete_file_records(self, paths: Iterable[str]):
+        """Delete many file records in a single transaction"""
+        params = [(path,) for path in paths]
+        if not params:
+            return
+        with self.connection() as conn:
+            conn.executemany("DELETE FROM files WHERE path = ?", params)
+
     def update_file_status(self, path: str, status: str, error: str | None = None):
         """Update file status and optionally error"""
+        self.update_file_statuses([(path, status, error)])
+
+    def update_file_statuses(self, updates: Iterable[tuple[str, str, str | None]]):
+        """Update (path, status, error) for many files in a single transaction"""
+        now = _now_iso()
+        params = [(status, error, now, path) for path, status, error in updates]
+        if not params:
+            return
         with self.connection() as conn:
-            conn.execute(
-                """
-                UPDATE files SET status = ?, last_error = ?, updated_at = ?
-                WHERE path = ?
-                """,
-                (status, error, datetime.now().isoformat(), path),
-            )
+            conn.executemany(UPDATE_FILE_STATUS_SQL, params)
+
+    def update_file_mtime(self, path: str, mtime: float):
+        """Record a new mtime for a file whose content hash is unchanged"""
+        self.update_file_mtimes([(path, mtime)])
+
+    def update_file_mtimes(self, updates: Iterable[tuple[str, float]]):
+        """Update (path, mtime) for many files in a single transaction"""
+        now = _now_iso()
+        params = [(mtime, now, path) for path, mtime in updates]
+        if not params:
+            return
+        with self.connection() as conn:
+            conn.executemany(UPDATE_FILE_MTIME_SQL, params)
 
     def get_file_count(self) -> dict[str, int]:
         """Get file count by status"""
@@ -173,6 +441,18 @@ class Database:
             ).fetchall()
             return {row["status"]: row["count"] for row in rows}
 
+    def get_index_signature(self) -> str:
+        """Digest of every indexed file's (path, hash, status); changes whenever indexed content does"""
+        digest = hashlib.sha256()
+        with self.connection() as conn:
+            rows = self._tuple_cursor(conn).execute(
+                "SELECT path, hash, status FROM files ORDER BY path"
+            )
+            for row in rows:
+                digest.update("\0".join(row).encode("utf-8"))
+                digest.update(b"\n")
+        return digest.hexdigest()
+
     def get_book_ids(self) -> list[str]:
         """Get all unique book IDs"""
         with self.connection() as conn:
@@ -181,11 +461,69 @@ class Database:
             ).fetchall()
             return [row["book_id"] for row in rows]
 
+    # === Chunk Sources ===
+
+    def add_chunk_sources(self, pairs: Iterable[tuple[str, str]]):
+        """Record (source_path, chunk_id) pairs for chunks written to the vector store"""
+        params = list(pairs)
+        if not params:
+            return
+        with self.connection() as conn:
+            conn.executemany(INSERT_CHUNK_SOURCE_SQL, params)
+
+    def get_chunk_ids_for_source(self, source_path: str) -> list[str]:
+        """Get ids of the recorded chunks of a source file"""
+        with self.connection() as conn:
+            rows = self._tuple_cursor(conn).execute(
+                "SELECT chunk_id FROM chunk_sources WHERE source_path = ?", (source_path,)
+            )
+            return [chunk_id for (chunk_id,) in rows]
+
+    def has_chunk_sources(self) -> bool:
+        """Whether any chunk has been recorded"""
+        with self.connection() as conn:
+            return conn.execute("SELECT 1 FROM chunk_sources LIMIT 1").fetchone() is not None
+
+    def delete_chunk_sources(self, source_path: str):
+        """Forget the recorded chunks of a source file"""
+        with self.connection() as conn:
+            conn.execute("DELETE FROM chunk_sources WHERE source_path = ?", (source_path,))
+
+    def clear_chunk_sources(self):
+        """Forget all recorded chunks (the vector store was cleared)"""
+        with self.connection() as conn:
+            conn.execute("DELETE FROM chunk_sources")
+
+    # === Embedding Cache ===
+
+    def get_cached_embeddings(self, model_id: str, content_hashes: list[str]) -> dict[str, bytes]:
+        """Get cached vectors (raw float32 bytes) for a model as content_hash -> vector"""
+        found: dict[str, bytes] = {}
+        with self.connection() as conn:
+            cursor = self._tuple_cursor(conn)
+            for start in range(0, len(content_hashes), EMBEDDING_LOOKUP_BATCH_SIZE):
+                batch = content_hashes[start:start + EMBEDDING_LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                found.update(cursor.execute(
+                    "SELECT content_hash, vector FROM embedding_cache "
+                    f"WHERE model_id = ? AND content_hash IN ({placeholders})",
+                    (model_id, *batch),
+                ))
+        return found
+
+    def add_cached_embeddings(self, model_id: str, vectors: Iterable[tuple[str, bytes]]):
+        """Store (content_hash, vector) pairs for a model; existing entries are kept"""
+        params = [(content_hash, model_id, vector) for content_hash, vector in vectors]
+        if not params:
+            return
+        with self.connection() as conn:
+            conn.executemany(INSERT_EMBEDDING_SQL, params)
+
     # === Tasks ===
 
     def create_task(self, task_type: str, total: int = 0) -> int:
         """Create a new task and return its ID"""
-        now = datetime.now().isoformat()
+        now = _now_iso()
         with self.connection() as conn:
             cursor = conn.execute(
                 """
@@ -200,8 +538,8 @@ class Database:
         """Update task progress"""
         with self.connection() as conn:
             conn.execute(
-                "UPDATE tasks SET progress = ?, updated_at = ? WHERE id = ?",
-                (progress, datetime.now().isoformat(), task_id),
+                UPDATE_TASK_PROGRESS_SQL,
+                (progress, _now_iso(), task_id),
             )
 
     def complete_task(self, task_id: int, status: str = "done", error: str | None = None):
@@ -209,11 +547,11 @@ class Database:
         with self.connection() as conn:
             conn.execute(
                 "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE id = ?",
-                (status, error, datetime.now().isoformat(), task_id),
+                (status, error, _now_iso(), task_id),
             )
 
-    def get_latest_task(self, task_type: str | None = None) -> dict | None:
-        """Get the latest task"""
+    def get_latest_task(self, task_type: str | None = None) -> sqlite3.Row | None:
+        """Get the latest task (a Row: supports row["field"] and dict(row))"""
         with self.connection() as conn:
             if task_type:
                 row = conn.execute(
@@ -224,7 +562,7 @@ class Database:
                 row = conn.execute(
                     "SELECT * FROM tasks ORDER BY id DESC LIMIT 1"
                 ).fetchone()
-            return dict(row) if row else None
+            return row
 
     # === Conversations ===
 
@@ -252,7 +590,7 @@ class Database:
                      WHERE m.conversation_id = c.id AND m.role != 'system') AS message_count,
                     (SELECT m2.content FROM conversation_messages m2
                      WHERE m2.conversation_id = c.id AND m2.role = 'user'
-                     ORDER BY m2.created_at DESC LIMIT 1) AS last_user_message
+                     ORDER BY m2.seq DESC LIMIT 1) AS last_user_message
                 FROM conversations c
                 ORDER BY c.updated_at DESC
                 LIMIT ? OFFSET ?
@@ -283,7 +621,7 @@ class Database:
         conversation_id: str | None = None,
     ) -> str:
         """创建会话并返回会话 ID。"""
-        now = datetime.now().isoformat()
+        now = _now_iso()
         conv_id = conversation_id or uuid.uuid4().hex
         with self.connection() as conn:
             conn.execute(
@@ -295,25 +633,28 @@ class Database:
             )
         return conv_id
 
-    def get_conversation(self, conversation_id: str) -> dict[str, Any] | None:
-        """按会话 ID 查询会话信息。"""
+    def get_conversation(self, conversation_id: str) -> sqlite3.Row | None:
+        """按会话 ID 查询会话信息（sqlite3.Row，可按列名取值，需要时 dict(row)）。"""
         with self.connection() as conn:
-            row = conn.execute(
-                "SELECT * FROM conversations WHERE id = ?",
+            return conn.execute(
+                "SELECT id, created_at, updated_at, title, status FROM conversations WHERE id = ?",
                 (conversation_id,),
             ).fetchone()
-            return dict(row) if row else None
 
     def conversation_exists(self, conversation_id: str) -> bool:
         """判断会话是否存在。"""
-        return self.get_conversation(conversation_id) is not None
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT 1 FROM conversations WHERE id = ? LIMIT 1",
+                (conversation_id,),
+            ).fetchone() is not None
 
     def touch_conversation(self, conversation_id: str):
         """更新会话更新时间。"""
         with self.connection() as conn:
             conn.execute(
                 "UPDATE conversations SET updated_at = ? WHERE id = ?",
-                (datetime.now().isoformat(), conversation_id),
+                (_now_iso(), conversation_id),
             )
 
     def delete_conversation(self, conversation_id: str):
@@ -334,33 +675,17 @@ class Database:
         is_clarification: bool = False,
         is_summary: bool = False,
         message_id: str | None = None,
+        summary_last_message_id: str | None = None,
     ) -> str:
         """写入一条会话消息并返回消息 ID。"""
         msg_id = message_id or uuid.uuid4().hex
-        created_at = datetime.now().isoformat()
-        citations_json = json.dumps(citations or [], ensure_ascii=False)
+        created_at = _now_iso()
+        # 大多数消息没有引用，直接存 NULL，省去一次序列化
+        citations_json = orjson.dumps(citations).decode("utf-8") if citations else None
 
         with self.connection() as conn:
-            if is_summary:
-                conn.execute(
-                    "DELETE FROM conversation_messages WHERE conversation_id = ? AND is_summary = 1",
-                    (conversation_id,),
-                )
             conn.execute(
-                """
-                INSERT INTO conversation_messages (
-                    id,
-                    conversation_id,
-                    role,
-                    content,
-                    citations_json,
-                    created_at,
-                    token_estimate,
-                    is_clarification,
-                    is_summary
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
+                UPSERT_SUMMARY_SQL if is_summary else INSERT_MESSAGE_SQL,
                 (
                     msg_id,
                     conversation_id,
@@ -371,6 +696,7 @@ class Database:
                     token_estimate,
                     int(is_clarification),
                     int(is_summary),
+                    summary_last_message_id,
                 ),
             )
             # Auto-generate title from first user message
@@ -380,32 +706,28 @@ class Database:
                        WHERE id = ? AND (title IS NULL OR title = '')""",
                     (content[:30].strip(), conversation_id),
                 )
-            conn.execute(
-                "UPDATE conversations SET updated_at = ? WHERE id = ?",
-                (created_at, conversation_id),
-            )
 
         return msg_id
 
-    def _to_message_dict(self, row: sqlite3.Row) -> dict[str, Any]:
-        """将数据库行转换为会话消息字典。"""
+    def _to_message_dict(self, row: tuple) -> dict[str, Any]:
+        """将按 MESSAGE_COLUMNS 列序查询的行转换为会话消息字典。"""
         citations = []
-        citations_json = row["citations_json"]
-        if citations_json:
+        citations_json = row[4]
+        if citations_json and citations_json != "[]":
             try:
-                citations = json.loads(citations_json)
-            except json.JSONDecodeError:
+                citations = orjson.loads(citations_json)
+            except orjson.JSONDecodeError:
                 citations = []
         return {
-            "id": row["id"],
-            "conversation_id": row["conversation_id"],
-            "role": row["role"],
-            "content": row["content"],
+            "id": row[0],
+            "conversation_id": row[1],
+            "role": row[2],
+            "content": row[3],
             "citations": citations,
-            "created_at": row["created_at"],
-            "token_estimate": row["token_estimate"],
-            "is_clarification": bool(row["is_clarification"]),
-            "is_summary": bool(row["is_summary"]),
+            "created_at": row[5],
+            "token_estimate": row[6],
+            "is_clarification": bool(row[7]),
+            "is_summary": bool(row[8]),
         }
 
     def list_conversation_messages(
@@ -418,19 +740,68 @@ class Database:
         """分页读取会话消息，按时间升序返回。"""
         system_filter = "" if include_system else " AND role != 'system'"
         with self.connection() as conn:
-            rows = conn.execute(
+            # 内层按索引倒序取最近一页，外层只对这一页恢复升序
+            rows = self._tuple_cursor(conn).execute(
                 f"""
-                SELECT *
-                FROM conversation_messages
-                WHERE conversation_id = ? {system_filter}
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
+                SELECT * FROM (
+                    SELECT {MESSAGE_COLUMNS}, seq
+                    FROM conversation_messages
+                    WHERE conversation_id = ? {system_filter}
+                    ORDER BY seq DESC
+                    LIMIT ? OFFSET ?
+                )
+                ORDER BY seq ASC
                 """,
                 (conversation_id, limit, offset),
             ).fetchall()
-        rows = list(reversed(rows))
         return [self._to_message_dict(row) for row in rows]
 
+    def get_conversation_page(
+        self,
+        conversation_id: str,
+        limit: int = 30,
+        offset: int = 0,
+        include_system: bool = True,
+    ) -> tuple[bool, list[dict[str, Any]], int]:
+        """分页读取会话消息并返回 (会话是否存在, 升序消息, 总数)。
+
+        总数通过窗口函数随分页结果一并返回；仅在本页为空时才补查存在性与总数。
+        """
+        system_filter = "" if include_system else " AND role != 'system'"
+        with self.connection() as conn:
+            rows = self._tuple_cursor(conn).execute(
+                f"""
+                SELECT * FROM (
+                    SELECT {MESSAGE_COLUMNS}, seq, COUNT(*) OVER () AS total
+                    FROM conversation_messages
+                    WHERE conversation_id = ? {system_filter}
+                    ORDER BY seq DESC
+                    LIMIT ? OFFSET ?
+                )
+                ORDER BY seq ASC
+                """,
+                (conversation_id, limit, offset),
+            ).fetchall()
+            if rows:
+                total = rows[0][-1]
+                exists = True
+            else:
+                row = conn.execute(
+                    f"""
+                    SELECT
+                        EXISTS(SELECT 1 FROM conversations WHERE id = ?) AS found,
+                        (
+                            SELECT COUNT(*)
+                            FROM conversation_messages
+                            WHERE conversation_id = ? {system_filter}
+                        ) AS total
+                    """,
+                    (conversation_id, conversation_id),
+                ).fetchone()
+                exists = bool(row["found"])
+                total = int(row["total"])
+        return exists, [self._to_message_dict(row) for row in rows], total
+
     def list_conversation_messages_since(
         self,
         conversation_id: str,
@@ -441,9 +812,9 @@ class Database:
         """Read conversation messages since a timestamp in ascending order."""
         system_filter = "" if include_system else " AND role != 'system'"
         with self.connection() as conn:
-            rows = conn.execute(
+            rows = self._tuple_cursor(conn).execute(
                 f"""
-                SELECT *
+                SELECT {MESSAGE_COLUMNS}
                 FROM conversation_messages
                 WHERE conversation_id = ? AND created_at >= ? {system_filter}
                 ORDER BY created_at ASC
@@ -499,22 +870,116 @@ class Database:
                 SELECT content
                 FROM conversation_messages
                 WHERE conversation_id = ? AND is_summary = 1
-                ORDER BY created_at DESC
+                ORDER BY seq DESC
                 LIMIT 1
                 """,
                 (conversation_id,),
             ).fetchone()
             return str(row["content"]) if row else None
 
-    def save_summary(self, conversation_id: str, summary: str):
-        """保存会话摘要（覆盖旧摘要）。"""
+    def get_summary_cursor(self, conversation_id: str) -> str | None:
+        """获取最新摘要覆盖到的最后一条消息 ID。"""
+        with self.connection() as conn:
+            row = conn.execute(
+                """
+                SELECT summary_last_message_id
+                FROM conversation_messages
+                WHERE conversation_id = ? AND is_summary = 1
+                ORDER BY seq DESC
+                LIMIT 1
+                """,
+                (conversation_id,),
+            ).fetchone()
+            return row["summary_last_message_id"] if row else None
+
+    def list_messages_after(
+        self,
+        conversation_id: str,
+        after_message_id: str | None,
+        limit: int = 200,
+        include_system: bool = False,
+    ) -> list[dict[str, Any]]:
+        """读取某条消息之后的消息（按写入顺序升序）；after_message_id 为空时从头读取。"""
+        system_filter = "" if include_system else " AND role != 'system'"
+        with self.connection() as conn:
+            rows = self._tuple_cursor(conn).execute(
+                f"""
+                SELECT {MESSAGE_COLUMNS}
+                FROM conversation_messages
+                WHERE conversation_id = ? {system_filter}
+                  AND seq > COALESCE(
+                      (SELECT seq FROM conversation_messages WHERE id = ?), 0
+                  )
+                ORDER BY seq ASC
+                LIMIT ?
+                """,
+                (conversation_id, after_message_id, limit),
+            ).fetchall()
+        return [self._to_message_dict(row) for row in rows]
+
+    def sum_unsummarized_tokens(self, conversation_id: str) -> int:
+        """统计最新摘要与其尚未覆盖的非 system 消息的 token 估算之和。"""
+        with self.connection() as conn:
+            row = conn.execute(
+                """
+                WITH latest AS (
+                    SELECT token_estimate, summary_last_message_id
+                    FROM conversation_messages
+                    WHERE conversation_id = ? AND is_summary = 1
+                    ORDER BY seq DESC
+                    LIMIT 1
+                )
+                SELECT
+                    COALESCE((SELECT token_estimate FROM latest), 0)
+                    + COALESCE(SUM(m.token_estimate), 0) AS total
+                FROM conversation_messages m
+                WHERE m.conversation_id = ?
+                  AND m.role != 'system'
+                  AND m.seq > COALESCE(
+                      (
+                          SELECT c.seq
+                          FROM conversation_messages c
+                          WHERE c.id = (SELECT summary_last_message_id FROM latest)
+                      ),
+                      0
+                  )
+                """,
+                (conversation_id, conversation_id),
+            ).fetchone()
+        return int(row["total"]) if row else 0
+
+    def save_summary(
+        self,
+        conversation_id: str,
+        summary: str,
+        last_message_id: str | None = None,
+        token_estimate: int | None = None,
+    ):
+        """保存会话摘要（覆盖旧摘要）。
+
+        last_message_id 记录摘要覆盖到的最后一条消息；省略时视为覆盖当前全部消息。
+        """
+        if last_message_id is None:
+            with self.connection() as conn:
+                row = conn.execute(
+                    """
+                    SELECT id
+                    FROM conversation_messages
+                    WHERE conversation_id = ? AND role != 'system'
+                    ORDER BY seq DESC
+                    LIMIT 1
+                    """,
+                    (conversation_id,),
+                ).fetchone()
+            last_message_id = row["id"] if row else None
         self.add_conversation_message(
             conversation_id=conversation_id,
             role="system",
             content=summary,
             citations=[],
-            token_estimate=max(1, len(summary) // 4),
+            token_estimate=token_estimate if token_estimate is not None else max(1, len(summary) // 4),
             is_summary=True,
+            summary_last_message_id=last_message_id,
         )
 
     def get_latest_system_message_with_prefix(
@@ -524,15 +989,15 @@ class Database:
     ) -> dict[str, Any] | None:
         """Get latest non-summary system message that matches a content prefix."""
         with self.connection() as conn:
-            row = conn.execute(
-                """
-                SELECT *
+            row = self._tuple_cursor(conn).execute(
+                f"""
+                SELECT {MESSAGE_COLUMNS}
                 FROM conversation_messages
                 WHERE conversation_id = ?
                   AND role = 'system'
                   AND is_summary = 0
                   AND content LIKE ?
-                ORDER BY created_at DESC
+                ORDER BY seq DESC
                 LIMIT 1
                 """,
                 (conversation_id, f"{prefix}%"),
@@ -542,21 +1007,22 @@ class Database:
     def count_recent_clarifications(self, conversation_id: str, limit: int = 2) -> int:
         """统计最近连续澄清消息数量，用于避免无限反问。"""
         with self.connection() as conn:
-            rows = conn.execute(
+            # 最近 N 条助手消息中，最后一条非澄清消息之后的条数即连续澄清数
+            row = self._tuple_cursor(conn).execute(
                 """
-                SELECT is_clarification
-                FROM conversation_messages
-                WHERE conversation_id = ? AND role = 'assistant'
-                ORDER BY created_at DESC
-                LIMIT ?
+                WITH recent AS (
+                    SELECT seq, is_clarification
+                    FROM conversation_messages
+                    WHERE conversation_id = ? AND role = 'assistant'
+                    ORDER BY seq DESC
+                    LIMIT ?
+                )
+                SELECT COUNT(*)
+                FROM recent
+                WHERE seq > COALESCE(
+                    (SELECT MAX(seq) FROM recent WHERE is_clarification = 0), 0
+                )
                 """,
                 (conversation_id, limit),
-            ).fetchall()
-
-        count = 0
-        for row in rows:
-            if bool(row["is_clarification"]):
-                count += 1
-            else:
-                break
-        return count
+            ).fetchone()
+        return row[0]
@@ -1,14 +1,40 @@
 """Embedding service with OpenAI/Ollama support"""
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Protocol, Callable, TypeVar
+import hashlib
 import random
 import time
 import httpx
+import numpy as np
 
+from ..clients import get_http_client, get_openai_client
 from ..config import get_settings
+from .database import Database
 
 T = TypeVar("T")
 
+# 旧版 Ollama 只有逐条的 /api/embeddings，回退时并发请求的数量
+OLLAMA_FALLBACK_WORKERS = 8
+
+# 限流与网关类错误可重试（Ollama 通过 raise_for_status 抛出 HTTPStatusError）
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+@lru_cache(maxsize=1)
+def _retryable_exceptions() -> tuple[type[BaseException], ...]:
+    """可重试的异常类型；openai 延迟导入，仅使用 Ollama 时无需加载。"""
+    import openai
+
+    return (
+        httpx.TimeoutException,
+        httpx.TransportError,
+        openai.RateLimitError,
+        openai.APIConnectionError,  # 包含 APITimeoutError
+        openai.InternalServerError,
+    )
+
 
 def _retry_with_backoff(
     operation: Callable[[], T],
@@ -31,36 +57,14 @@ def _retry_with_backoff(
     规则:
         仅对可判定为限流/网络异常的错误进行重试，其他错误直接抛出。
     """
+    retryable = _retryable_exceptions()
     for attempt in range(max_retries):
         try:
             return operation()
         except Exception as exc:
-            message = str(exc).lower()
-            exc_name = exc.__class__.__name__
-            retryable_names = {
-                "ratelimiterror",
-                "apitimeouterror",
-                "apiconnectionerror",
-                "internalservererror",
-                "serviceunavailableerror",
-            }
-            retryable_messages = (
-                "rate limit",
-                "rpm limit",
-                "too many requests",
-                "429",
-                "502",
-                "503",
-                "504",
-                "timeout",
-                "timed out",
-                "connection",
-                "temporarily",
-            )
-            should_retry = (
-                isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
-                or exc_name in retryable_names
-                or any(token in message for token in retryable_messages)
+            should_retry = isinstance(exc, retryable) or (
+                isinstance(exc, httpx.HTTPStatusError)
+                and exc.response.status_code in RETRYABLE_STATUS_CODES
             )
             if not should_retry or attempt >= max_retries - 1:
                 raise
@@ -70,6 +74,39 @@ def _retry_with_backoff(
             time.sleep(delay)
 
 
+def _embed_in_batches(client, model: str, texts: list[str], batch_size: int) -> list[list[float]]:
+    """按 batch_size 切分后并发请求 OpenAI 兼容的嵌入接口，结果保持输入顺序。
+
+    多批时先按文本长度排序再切分，长度相近的文本同批，服务端按批内最长文本
+    padding 时浪费更少；并发数取 embedding_concurrency；每个批次独立重试。
+    """
+    def _embed_batch(batch: list[str]) -> list[list[float]]:
+        response = _retry_with_backoff(
+            lambda: client.embeddings.create(
+                input=batch,
+                model=model,
+            )
+        )
+        return [item.embedding for item in response.data]
+
+    if len(texts) <= batch_size:
+        return _embed_batch(texts) if texts else []
+
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = [
+        [texts[i] for i in order[start:start + batch_size]]
+        for start in range(0, len(order), batch_size)
+    ]
+    embeddings: list[list[float]] = [[] for _ in texts]
+    max_workers = max(1, min(get_settings().embedding_concurrency, len(batches)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # executor.map 按提交顺序返回，与排序后的 order 一一对应，再按原下标放回
+        results = executor.map(_embed_batch, batches)
+        for i, embedding in zip(order, (e for result in results for e in result)):
+            embeddings[i] = embedding
+    return embeddings
+
+
 class EmbeddingProvider(Protocol):
     """Protocol for embedding providers"""
     
@@ -88,29 +125,13 @@ class OpenAIEmbedding:
         
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
+        # 进程级共享客户端，连接池在各次 embed 调用之间保持复用
+        self._client = get_openai_client(self.api_key)
     
     def embed(self, texts: list[str]) -> list[list[float]]:
         """Generate embeddings using OpenAI API"""
-        import openai
-        
-        client = openai.OpenAI(api_key=self.api_key)
-        
         # OpenAI has a limit on batch size
-        batch_size = 100
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            response = _retry_with_backoff(
-                lambda: client.embeddings.create(
-                    input=batch,
-                    model=self.model,
-                )
-            )
-            embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(embeddings)
-        
-        return all_embeddings
+        return _embed_in_batches(self._client, self.model, texts, batch_size=100)
 
 
 class OllamaEmbedding:
@@ -120,15 +141,49 @@ class OllamaEmbedding:
         settings = get_settings()
         self.base_url = base_url or settings.ollama_base_url
         self.model = model or "nomic-embed-text"
+        # 首次调用时探测服务端是否支持批量接口 /api/embed
+        self._supports_batch: bool | None = None
     
     def embed(self, texts: list[str]) -> list[list[float]]:
         """Generate embeddings using Ollama"""
-        embeddings = []
-        
-        for text in texts:
+        if not texts:
+            return []
+        if self._supports_batch is not False:
+            embeddings = self._embed_batch(texts)
+            if embeddings is not None:
+                return embeddings
+        return self._embed_each(texts)
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]] | None:
+        """一次请求批量嵌入；服务端不支持 /api/embed 时返回 None。"""
+        client = get_http_client()
+
+        def _request():
+            response = client.post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model, "input": texts},
+                timeout=60.0,
+            )
+            if response.status_code == 404 and self._supports_batch is None:
+                return None
+            response.raise_for_status()
+            return response.json()
+
+        data = _retry_with_backoff(_request)
+        if data is None:
+            self._supports_batch = False
+            return None
+        self._supports_batch = True
+        return data["embeddings"]
+
+    def _embed_each(self, texts: list[str]) -> list[list[float]]:
+        """逐条调用旧接口 /api/embeddings，并发发出以重叠网络往返。"""
+        client = get_http_client()
+
+        def _embed_one(text: str) -> list[float]:
             def _request():
                 """请求单条嵌入并返回响应 JSON。"""
-                response = httpx.post(
+                response = client.post(
                     f"{self.base_url}/api/embeddings",
                     json={"model": self.model, "prompt": text},
                     timeout=60.0,
@@ -136,10 +191,12 @@ class OllamaEmbedding:
                 response.raise_for_status()
                 return response.json()
 
-            data = _retry_with_backoff(_request)
-            embeddings.append(data["embedding"])
-        
-        return embeddings
+            return _retry_with_backoff(_request)["embedding"]
+
+        if len(texts) == 1:
+            return [_embed_one(texts[0])]
+        with ThreadPoolExecutor(max_workers=min(OLLAMA_FALLBACK_WORKERS, len(texts))) as executor:
+            return list(executor.map(_embed_one, texts))
 
 
 class SiliconFlowEmbedding:
@@ -153,31 +210,41 @@ class SiliconFlowEmbedding:
         
         if not self.api_key:
             raise ValueError("SiliconFlow API key is required")
+        self._client = get_openai_client(self.api_key, self.base_url)
     
     def embed(self, texts: list[str]) -> list[list[float]]:
         """Generate embeddings using SiliconFlow API"""
-        import openai
-        
-        client = openai.OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-        )
-        
-        batch_size = 24  # SiliconFlow API limit
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            response = _retry_with_backoff(
-                lambda: client.embeddings.create(
-                    input=batch,
-                    model=self.model,
-                )
-            )
-            embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(embeddings)
-        
-        return all_embeddings
+        # SiliconFlow API limit
+        return _embed_in_batches(self._client, self.model, texts, batch_size=24)
+
+
+class CachedEmbedding:
+    """Wraps a provider and reuses vectors for text it has already embedded"""
+    
+    def __init__(self, provider: EmbeddingProvider, db: Database, model_id: str | None = None):
+        self.provider = provider
+        self.db = db
+        # 换 provider 或模型后向量不可混用，缓存按 model_id 隔离
+        self.model_id = model_id or f"{type(provider).__name__}:{getattr(provider, 'model', '')}"
+    
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Generate embeddings, only sending texts without a cached vector to the provider"""
+        if not texts:
+            return []
+        keys = [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+        vectors = self.db.get_cached_embeddings(self.model_id, list(set(keys)))
+        # 未命中的文本去重后再请求（重复的摘录只 embed 一次）
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embeddings = self.provider.embed(list(missing.values()))
+            new_vectors = {
+                key: np.asarray(embedding, dtype=np.float32).tobytes()
+                for key, embedding in zip(missing, embeddings)
+            }
+            self.db.add_cached_embeddings(self.model_id, new_vectors.items())
+            vectors.update(new_vectors)
+        # 命中与未命中都从 float32 还原，同一文本每次得到完全相同的向量
+        return [np.frombuffer(vectors[key], dtype=np.float32).tolist() for key in keys]
 
 
 def get_embedding_provider() -> EmbeddingProvider:
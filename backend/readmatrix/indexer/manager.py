@@ -1,21 +1,99 @@
 """Index manager - orchestrates scanning, parsing, chunking, and indexing"""
 
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Callable, Optional
+from typing import Callable, Iterator, Optional
 
 from ..config import get_settings
-from ..models import Chunk, FileRecord
+from ..models import Chunk, FileRecord, chunk_anchor
 from ..vault import (
     scan_vault,
     parse_markdown,
     chunk_weread_document,
     get_files_needing_update,
     compute_file_hash,
+    detect_source_type,
+    make_chunk_id,
 )
 from .database import Database
 from .vectorstore import VectorStore
-from .embedder import get_embedding_provider
+from .embedder import CachedEmbedding, get_embedding_provider
+
+
+# 文件记录攒批写入 SQLite 的条数，兼顾提交次数与中途失败时丢失的进度
+FILE_RECORD_BATCH_SIZE = 200
+
+# 文件数少于该值时直接在本进程解析，避免子进程启动与导入开销超过收益
+PARALLEL_PARSE_MIN_FILES = 500
+
+
+def _error_record(path: str, source_type: str, error: Exception) -> FileRecord:
+    """File record marking a file whose indexing failed"""
+    return FileRecord(
+        path=path,
+        hash="",
+        mtime=0,
+        status="error",
+        source_type=source_type,
+        book_id=None,
+        last_error=str(error),
+    )
+
+
+def _parse_and_chunk(file_path: Path, source_type: str | None) -> tuple[list[Chunk], FileRecord]:
+    """Parse and chunk a file without embedding; returns chunks and the file record"""
+    # Parse file; an unknown source type is detected from the same read
+    document = parse_markdown(file_path, source_type)
+    source_type = document.source_type
+    
+    # Chunk based on source type
+    if source_type == "weread":
+        chunks = chunk_weread_document(document)
+    else:
+        # For now, treat entire file as one chunk
+        # TODO: Implement generic markdown chunker
+        chunks = [Chunk(
+            chunk_id=make_chunk_id(str(file_path), "main"),
+            block_id="main",
+            content=document.content[:2000],  # Limit size
+            source_path=str(file_path),
+            title_path=[document.title],
+            book_id="",
+            book_title=document.title,
+            author=None,
+            highlight_time=None,
+        )]
+    
+    # 空文件 / 纯空白 chunk 不送 embedding（API 会拒绝空输入），没有内容时也不会初始化 embedder
+    chunks = [c for c in chunks if c.content.strip()]
+    for chunk in chunks:
+        chunk.anchor = chunk_anchor(chunk.block_id, document.block_anchors, document.heading_anchor)
+    
+    # Update file record
+    record = FileRecord(
+        path=str(file_path),
+        hash=document.hash,
+        mtime=document.mtime,
+        size=document.size,
+        status="indexed",
+        source_type=source_type,
+        book_id=document.book_id,
+        last_error=None,
+    )
+    
+    return chunks, record
+
+
+def _parse_and_chunk_worker(item: tuple[Path, str | None]) -> tuple[list[Chunk], FileRecord]:
+    """Process-pool entry point: like _parse_and_chunk, but failures come back as error records"""
+    file_path, source_type = item
+    try:
+        return _parse_and_chunk(file_path, source_type)
+    except Exception as e:
+        return [], _error_record(str(file_path), source_type or detect_source_type(file_path), e)
 
 
 class IndexManager:
@@ -33,7 +111,10 @@ class IndexManager:
     @property
     def embedder(self):
         if self._embedder is None:
-            self._embedder = get_embedding_provider()
+            provider = get_embedding_provider()
+            if get_settings().embedding_cache_enabled:
+                provider = CachedEmbedding(provider, self.db)
+            self._embedder = provider
         return self._embedder
     
     def full_rebuild(
@@ -59,8 +140,9 @@ class IndexManager:
             raise
         
         try:
-            # Scan vault
-            files = list(scan_vault())
+            # Scan vault: only list paths here; source types are detected by the
+            # (parallel) parse step, so the first parse isn't blocked on reading every file
+            files = list(scan_vault(detect_types=False))
         except Exception as e:
             print(f"ERROR scanning vault: {e}")
             raise
@@ -77,32 +159,94 @@ class IndexManager:
             "errors": [],
         }
         
-        for i, (file_path, source_type) in enumerate(files):
-            try:
-                chunks = self._index_file(file_path, source_type)
-                stats["indexed_files"] += 1
-                stats["total_chunks"] += len(chunks)
-                
-                if progress_callback:
-                    progress_callback(i + 1, total, f"Indexed: {file_path.name}")
+        batch_size = settings.index_batch_size
+        pending_records: list[FileRecord] = []
+        # 切分好但尚未 embed / 写入向量库的 chunk，及其对应的文件记录
+        batch_chunks: list[Chunk] = []
+        batch_records: list[FileRecord] = []
+        try:
+            for i, (chunks, record) in enumerate(self._iter_parsed(files, settings.index_workers)):
+                if record.status == "error":
+                    stats["errors"].append(f"{record.path}: {record.last_error}")
                     
-            except Exception as e:
-                error_msg = f"{file_path}: {str(e)}"
-                stats["errors"].append(error_msg)
-                
-                # Record error in database
-                record = FileRecord(
-                    path=str(file_path),
-                    hash="",
-                    mtime=0,
-                    status="error",
-                    source_type=source_type,
-                    book_id=None,
-                    last_error=str(e),
+                    # Record error in database
+                    pending_records.append(record)
+                else:
+                    batch_chunks.extend(chunks)
+                    batch_records.append(record)
+                    
+                    if progress_callback:
+                        progress_callback(i + 1, total, f"Indexed: {Path(record.path).name}")
+
+                if len(batch_chunks) >= batch_size:
+                    stats["indexed_files"] += self._flush_batch(
+                        batch_chunks, batch_records, pending_records, stats
+                    )
+                if len(pending_records) >= FILE_RECORD_BATCH_SIZE:
+                    self.db.upsert_file_records(pending_records)
+                    pending_records.clear()
+        finally:
+            try:
+                stats["indexed_files"] += self._flush_batch(
+                    batch_chunks, batch_records, pending_records, stats
                 )
-                self.db.upsert_file_record(record)
+            finally:
+                self.db.upsert_file_records(pending_records)
         
         return stats
+
+    def _iter_parsed(
+        self,
+        files: list[tuple[Path, str]],
+        workers: int,
+    ) -> Iterator[tuple[list[Chunk], FileRecord]]:
+        """Parse and chunk files (in input order), across processes for large vaults"""
+        workers = workers or max(1, (os.cpu_count() or 1) - 1)
+        if workers <= 1 or len(files) < PARALLEL_PARSE_MIN_FILES:
+            yield from map(_parse_and_chunk_worker, files)
+            return
+        
+        # spawn 而非 fork：API 进程里已有线程（uvicorn / chromadb），fork 可能继承被持有的锁
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        try:
+            yield from pool.map(_parse_and_chunk_worker, files, chunksize=8)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def _flush_batch(
+        self,
+        chunks: list[Chunk],
+        records: list[FileRecord],
+        pending_records: list[FileRecord],
+        stats: dict,
+    ) -> int:
+        """
+        Embed and upsert buffered chunks, then queue their file records; clears the buffers.
+        
+        Returns:
+            Number of files indexed (0 if the batch failed)
+        """
+        if not records:
+            return 0
+        try:
+            self.vectorstore.add_chunks_batched(
+                chunks, self.embedder.embed, get_settings().index_batch_size
+            )
+            pending_records.extend(records)
+            stats["total_chunks"] += len(chunks)
+            return len(records)
+        except Exception as e:
+            # 整批失败时，批内文件全部记为错误，下次增量更新会重新索引
+            for record in records:
+                stats["errors"].append(f"{record.path}: {str(e)}")
+                pending_records.append(_error_record(record.path, record.source_type, e))
+            return 0
+        finally:
+            chunks.clear()
+            records.clear()
     
     def incremental_update(
         self,
@@ -117,13 +261,15 @@ class IndexManager:
         # Get current index state
         indexed_records = self.db.get_all_file_records()
         
-        # Scan vault
-        scanned_files = list(scan_vault())
+        # Scan vault; source types are detected only for files that need indexing
+        scanned_files = list(scan_vault(detect_types=False))
         
         # Determine what needs updating
-        files_to_index, paths_to_remove = get_files_needing_update(
+        files_to_index, paths_to_remove, mtime_updates = get_files_needing_update(
             scanned_files, indexed_records
         )
+        # 内容未变但 mtime 变化的文件只更新 mtime，下次扫描即可跳过哈希
+        self.db.update_file_mtimes(mtime_updates)
         
         total = len(files_to_index) + len(paths_to_remove)
         
@@ -140,80 +286,69 @@ class IndexManager:
             progress_callback(0, total, "Starting incremental update...")
         
         # Remove deleted files
-        for i, path in enumerate(paths_to_remove):
-            self.vectorstore.delete_by_source_path(path)
-            self.db.delete_file_record(path)
-            stats["removed"] += 1
-            
-            if progress_callback:
-                progress_callback(i + 1, total, f"Removed: {Path(path).name}")
+        try:
+            for i, path in enumerate(paths_to_remove):
+                self.vectorstore.delete_by_source_path(path)
+                stats["removed"] += 1
+                
+                if progress_callback:
+                    progress_callback(i + 1, total, f"Removed: {Path(path).name}")
+        finally:
+            self.db.delete_file_records(paths_to_remove[: stats["removed"]])
         
         # Index new/changed files
         offset = len(paths_to_remove)
-        for i, (file_path, source_type) in enumerate(files_to_index):
-            try:
-                # Delete old chunks first
-                self.vectorstore.delete_by_source_path(str(file_path))
-                
-                chunks = self._index_file(file_path, source_type)
-                stats["indexed"] += 1
-                stats["total_chunks"] += len(chunks)
-                
-                if progress_callback:
-                    progress_callback(offset + i + 1, total, f"Indexed: {file_path.name}")
+        batch_size = get_settings().index_batch_size
+        pending_records: list[FileRecord] = []
+        pending_errors: list[tuple[str, str, str | None]] = []
+        # 与 full_rebuild 相同：跨文件攒够一批 chunk 再 embed，避免小文件逐个请求 embedding
+        batch_chunks: list[Chunk] = []
+        batch_records: list[FileRecord] = []
+        try:
+            for i, (file_path, source_type) in enumerate(files_to_index):
+                try:
+                    # Delete old chunks first
+                    self.vectorstore.delete_by_source_path(str(file_path))
                     
-            except Exception as e:
-                error_msg = f"{file_path}: {str(e)}"
-                stats["errors"].append(error_msg)
-                self.db.update_file_status(str(file_path), "error", str(e))
+                    chunks, record = _parse_and_chunk(file_path, source_type)
+                    batch_chunks.extend(chunks)
+                    batch_records.append(record)
+                    
+                    if progress_callback:
+                        progress_callback(offset + i + 1, total, f"Indexed: {file_path.name}")
+                        
+                except Exception as e:
+                    error_msg = f"{file_path}: {str(e)}"
+                    stats["errors"].append(error_msg)
+                    pending_errors.append((str(file_path), "error", str(e)))
+
+                if len(batch_chunks) >= batch_size:
+                    stats["indexed"] += self._flush_batch(
+                        batch_chunks, batch_records, pending_records, stats
+                    )
+                if len(pending_records) + len(pending_errors) >= FILE_RECORD_BATCH_SIZE:
+                    self._flush_file_updates(pending_records, pending_errors)
+        finally:
+            try:
+                stats["indexed"] += self._flush_batch(
+                    batch_chunks, batch_records, pending_records, stats
+                )
+            finally:
+                self._flush_file_updates(pending_records, pending_errors)
         
         return stats
-    
-    def _index_file(self, file_path: Path, source_type: str) -> list[Chunk]:
-        """Index a single file"""
-        # Parse file
-        document = parse_markdown(file_path, source_type)
-        
-        # Chunk based on source type
-        if source_type == "weread":
-            chunks = chunk_weread_document(document)
-        else:
-            # For now, treat entire file as one chunk
-            # TODO: Implement generic markdown chunker
-            from ..vault.chunker import make_chunk_id
-            chunks = [Chunk(
-                chunk_id=make_chunk_id(str(file_path), "main"),
-                block_id="main",
-                content=document.content[:2000],  # Limit size
-                source_path=str(file_path),
-                title_path=[document.title],
-                book_id="",
-                book_title=document.title,
-                author=None,
-                highlight_time=None,
-            )]
-        
-        if chunks:
-            # Generate embeddings
-            texts = [c.content for c in chunks]
-            embeddings = self.embedder.embed(texts)
-            
-            # Store in vector database
-            self.vectorstore.add_chunks(chunks, embeddings)
-        
-        # Update file record
-        record = FileRecord(
-            path=str(file_path),
-            hash=document.hash,
-            mtime=document.mtime,
-            status="indexed",
-            source_type=source_type,
-            book_id=document.book_id,
-            last_error=None,
-        )
-        self.db.upsert_file_record(record)
-        
-        return chunks
+
+    def _flush_file_updates(
+        self,
+        records: list[FileRecord],
+        errors: list[tuple[str, str, str | None]],
+    ):
+        """Write buffered file records and error statuses, then clear the buffers"""
+        with self.db.transaction():
+            self.db.upsert_file_records(records)
+            self.db.update_file_statuses(errors)
+        records.clear()
+        errors.clear()
     
     def get_stats(self) -> dict:
         """Get current index statistics"""
@@ -1,11 +1,14 @@
 """ChromaDB vector store for chunks"""
 
 import chromadb
+import numpy as np
+from itertools import islice
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Optional
 
 from ..config import get_settings
-from ..models import Chunk
+from ..models import Chunk, ChunkBatch
+from .database import Database
 
 
 class VectorStore:
@@ -13,8 +16,12 @@ class VectorStore:
     
     COLLECTION_NAME = "readmatrix_chunks"
     
-    def __init__(self, persist_path: Path | None = None):
+    def __init__(self, persist_path: Path | None = None, db: Database | None = None):
         settings = get_settings()
+        self._db = db
+        self._chunk_sources_ready = False
+        # 每次写入/删除递增，供检索缓存判断结果是否过期（仅反映本进程内的修改）
+        self.version = 0
         self.persist_path = persist_path or settings.chroma_path
         self.persist_path.mkdir(parents=True, exist_ok=True)
         
@@ -35,22 +42,81 @@ class VectorStore:
         if not chunks:
             return
         
+        self.add_batch(ChunkBatch.from_chunks(chunks), embeddings)
+    
+    def add_batch(self, batch: ChunkBatch, embeddings: list[list[float]]):
+        """Upsert a column-oriented batch as-is, without repacking"""
+        if not batch:
+            return
+        
         self.collection.upsert(
-            ids=[c.chunk_id for c in chunks],
-            documents=[c.content for c in chunks],
+            ids=batch.ids,
+            documents=batch.documents,
             embeddings=embeddings,
-            metadatas=[c.to_metadata() for c in chunks],
+            metadatas=batch.metadatas,
+        )
+        self.version += 1
+        self.db.add_chunk_sources(
+            (metadata["source_path"], chunk_id)
+            for chunk_id, metadata in zip(batch.ids, batch.metadatas)
         )
     
+    def add_chunks_batched(
+        self,
+        chunks: Iterable[Chunk],
+        embed_fn: Callable[[list[str]], list[list[float]]],
+        batch_size: int = 128,
+    ) -> int:
+        """
+        Embed and upsert chunks in fixed-size batches.
+        
+        Each batch is one embed_fn call plus one collection.upsert, keeping
+        upserts inside ChromaDB's efficient 50-250 item range.
+        
+        Returns:
+            Number of chunks written
+        """
+        iterator = iter(chunks)
+        written = 0
+        while batch := ChunkBatch.from_chunks(islice(iterator, batch_size)):
+            self.add_batch(batch, embed_fn(batch.documents))
+            written += len(batch)
+        return written
+    
     def delete_by_source_path(self, source_path: str):
         """Delete all chunks from a specific source file"""
-        # ChromaDB requires getting IDs first
-        results = self.collection.get(
-            where={"source_path": source_path},
-            include=[]
-        )
-        if results["ids"]:
-            self.collection.delete(ids=results["ids"])
+        self._ensure_chunk_sources()
+        with self.db.transaction():
+            # 查 SQLite 旁路索引（主键查找），避免 ChromaDB 按 metadata 全量扫描
+            ids = self.db.get_chunk_ids_for_source(source_path)
+            if ids:
+                self.collection.delete(ids=ids)
+                self.version += 1
+            self.db.delete_chunk_sources(source_path)
+    
+    CHUNK_SOURCES_BACKFILL_BATCH = 5000
+    
+    def _ensure_chunk_sources(self):
+        """Backfill the chunk_sources index once for stores written before it existed"""
+        if self._chunk_sources_ready:
+            return
+        if not self.db.has_chunk_sources() and self.collection.count():
+            offset = 0
+            while True:
+                results = self.collection.get(
+                    include=["metadatas"],
+                    limit=self.CHUNK_SOURCES_BACKFILL_BATCH,
+                    offset=offset,
+                )
+                ids = results["ids"]
+                if not ids:
+                    break
+                self.db.add_chunk_sources(
+                    ((metadata or {}).get("source_path", ""), chunk_id)
+                    for chunk_id, metadata in zip(ids, results["metadatas"])
+                )
+                offset += len(ids)
+        self._chunk_sources_ready = True
     
     def search(
         self,
@@ -71,6 +137,44 @@ class VectorStore:
         Returns:
             List of matching Chunks
         """
+        return self.search_many([query_embedding], top_k, book_id, book_title)[0]
+    
+    def search_many(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int = 5,
+        book_id: Optional[str] = None,
+        book_title: Optional[str] = None,
+    ) -> list[list[Chunk]]:
+        """Search several query vectors in one collection.query; results align with the inputs, nearest first"""
+        chunks, _ = self._query_many(query_embeddings, top_k, book_id, book_title)
+        return chunks
+    
+    def search_many_with_embeddings(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int = 5,
+        book_id: Optional[str] = None,
+        book_title: Optional[str] = None,
+    ) -> list[tuple[list[Chunk], np.ndarray]]:
+        """Like search_many, also returning each hit's stored vector (float32 rows aligned with the chunks)"""
+        chunks, embeddings = self._query_many(
+            query_embeddings, top_k, book_id, book_title, include_embeddings=True
+        )
+        return list(zip(chunks, embeddings))
+    
+    def _query_many(
+        self,
+        query_embeddings: list[list[float]],
+        top_k: int,
+        book_id: Optional[str],
+        book_title: Optional[str],
+        include_embeddings: bool = False,
+    ) -> tuple[list[list[Chunk]], list[np.ndarray]]:
+        """One collection.query for all query vectors; embeddings are empty unless requested"""
+        if not query_embeddings:
+            return [], []
+        
         # Build filter
         where = None
         if book_id:
@@ -78,63 +182,82 @@ class VectorStore:
         elif book_title:
             where = {"book_title": {"$contains": book_title}}
         
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=top_k,
             where=where,
-            include=["documents", "metadatas", "distances"],
+            include=include,
         )
         
-        chunks = []
-        ids = results.get("ids", [])
-        if ids and ids[0]:
-            distances = results.get("distances", [[]])[0]
-            for i, chunk_id in enumerate(ids[0]):
-                chunk = Chunk.from_metadata(
-                    chunk_id=chunk_id,
-                    content=results["documents"][0][i],
-                    metadata=results["metadatas"][0][i],
-                    distance=distances[i] if i < len(distances) else None,
+        ids = results.get("ids")
+        if not ids:
+            empty = np.empty((0, 0), dtype=np.float32)
+            return [[] for _ in query_embeddings], [empty for _ in query_embeddings]
+        # 请求了 distances 时 ChromaDB 返回与 ids 对齐的各列，无需逐行做越界检查
+        from_metadata = Chunk.from_metadata
+        chunks = [
+            [
+                from_metadata(chunk_id, document, metadata, distance)
+                for chunk_id, document, metadata, distance in zip(
+                    row_ids, row_documents, row_metadatas, row_distances
                 )
-                chunks.append(chunk)
-        
-        return chunks
+            ]
+            for row_ids, row_documents, row_metadatas, row_distances in zip(
+                ids,
+                results["documents"],
+                results["metadatas"],
+                results["distances"],
+            )
+        ]
+        embeddings = []
+        if include_embeddings:
+            embeddings = [
+                np.asarray(row, dtype=np.float32).reshape(len(row_ids), -1)
+                for row, row_ids in zip(results["embeddings"], ids)
+            ]
+        return chunks, embeddings
     
     def get_chunk_count(self) -> int:
         """Get total number of chunks"""
         return self.collection.count()
     
-    def get_all_book_ids(self) -> list[str]:
-        """Get all unique book IDs in the store"""
-        # This is a workaround since ChromaDB doesn't have DISTINCT
-        results = self.collection.get(include=["metadatas"])
-        book_ids = set()
-        for metadata in results.get("metadatas", []):
-            if metadata and metadata.get("book_id"):
-                book_ids.add(metadata["book_id"])
-        return list(book_ids)
+    @property
+    def db(self) -> Database:
+        if self._db is None:
+            self._db = Database()
+        return self._db
+    
+    HEALTHCHECK_COLLECTION = "readmatrix-healthcheck"
     
     def test_persistence(self) -> bool:
         """Test if the store can persist data (for doctor check)"""
         try:
-            test_collection = self.client.get_or_create_collection("_test_persistence")
-            test_collection.add(
+            # 只写临时集合：哨兵不能出现在主集合的检索结果里，进程中途退出也不会污染真实内容；
+            # upsert 而非 add，上次残留的临时集合也能直接复用
+            test_collection = self.client.get_or_create_collection(self.HEALTHCHECK_COLLECTION)
+            test_collection.upsert(
                 ids=["test"],
                 documents=["test"],
                 embeddings=[[0.0] * 384],  # Minimal embedding
             )
-            self.client.delete_collection("_test_persistence")
+            self.client.delete_collection(self.HEALTHCHECK_COLLECTION)
             return True
         except Exception:
             return False
     
     def clear(self):
         """Clear all data (for full rebuild)"""
+        # 删除并重建集合：比逐 id 删除快得多，且会重置向量维度（切换 embedding 模型后重建需要）
         self.client.delete_collection(self.COLLECTION_NAME)
-        self.collection = self.client.get_or_create_collection(
+        self.collection = self.client.create_collection(
             name=self.COLLECTION_NAME,
             metadata={"hnsw:space": "cosine"}
         )
+        self.version += 1
+        self.db.clear_chunk_sources()
 
     def get_by_source(self, source_path: str, limit: int = 50) -> list[Chunk]:
         """
@@ -171,3 +294,72 @@ class VectorStore:
         chunks.sort(key=lambda c: c.block_id or "")
 
         return chunks
+
+    def list_chunk_ids_by_source(
+        self,
+        source_path: str,
+        limit: int = 50,
+    ) -> tuple[list[str], list[str]]:
+        """
+        Get chunk ids of a source file in document order, without documents.
+
+        Returns:
+            Tuple of (chunk_ids, block_ids), both sorted by block_id
+        """
+        return self.list_chunk_ids_by_sources([source_path], limit).get(source_path, ([], []))
+
+    def list_chunk_ids_by_sources(
+        self,
+        source_paths: list[str],
+        limit: int = 50,
+    ) -> dict[str, tuple[list[str], list[str]]]:
+        """
+        Chunk ids of several source files in one collection.get, without documents.
+
+        Returns:
+            Mapping source_path -> (chunk_ids, block_ids), sorted by block_id,
+            at most ``limit`` per source
+        """
+        paths = list(dict.fromkeys(source_paths))
+        if not paths:
+            return {}
+        where = {"source_path": paths[0]} if len(paths) == 1 else {"source_path": {"$in": paths}}
+        results = self.collection.get(
+            where=where,
+            include=["metadatas"],
+            limit=limit * len(paths),
+        )
+        grouped: dict[str, list[tuple[str, str]]] = {path: [] for path in paths}
+        for chunk_id, metadata in zip(results.get("ids") or [], results.get("metadatas") or []):
+            metadata = metadata or {}
+            rows = grouped.get(metadata.get("source_path"))
+            if rows is not None:
+                rows.append((metadata.get("block_id") or "", chunk_id))
+
+        listed = {}
+        for path, rows in grouped.items():
+            rows.sort()
+            rows = rows[:limit]
+            listed[path] = ([chunk_id for _, chunk_id in rows], [block_id for block_id, _ in rows])
+        return listed
+
+    def get_by_ids(self, chunk_ids: list[str]) -> list[Chunk]:
+        """Fetch chunks (documents + metadata) by id in a single call"""
+        if not chunk_ids:
+            return []
+        results = self.collection.get(
+            ids=chunk_ids,
+            include=["documents", "metadatas"],
+        )
+        return [
+            Chunk.from_metadata(
+                chunk_id=chunk_id,
+                content=document or "",
+                metadata=metadata or {},
+            )
+            for chunk_id, document, metadata in zip(
+                results.get("ids") or [],
+                results.get("documents") or [],
+                results.get("metadatas") or [],
+            )
+        ]
@@ -1,13 +1,29 @@
 """FastAPI application entry point"""
 
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import get_settings
 from .api import router
+from .api.deps import shutdown, warm_up
 from .middleware import ObservabilityMiddleware, setup_logging
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize shared services once at startup."""
+    # 同步路由与 run_in_threadpool 共用 anyio 默认线程池（默认仅 40）
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = get_settings().threadpool_size
+    await run_in_threadpool(warm_up)
+    yield
+    await run_in_threadpool(shutdown)
+
+
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
     settings = get_settings()
@@ -19,6 +35,7 @@ def create_app() -> FastAPI:
         title="ReadMatrix",
         description="Local-first personal knowledge platform with grounded Q&A",
         version="0.1.0",
+        lifespan=lifespan,
     )
 
     # 观测性中间件（放在最外层，记录所有请求）
@@ -1,8 +1,12 @@
 """API 观测性中间件"""
 
+import atexit
+import itertools
 import logging
+import os
+import queue
 import time
-import uuid
+from logging.handlers import QueueHandler, QueueListener
 from typing import Callable
 
 from fastapi import Request, Response
@@ -11,6 +15,13 @@ from starlette.middleware.base import BaseHTTPMiddleware
 # 配置结构化日志
 logger = logging.getLogger("readmatrix.api")
 
+# 请求 ID：进程号低 8 位前缀 + 进程内自增计数，无需每次读取系统随机源
+_REQUEST_ID_PREFIX = f"{os.getpid() & 0xff:02x}"
+_request_counter = itertools.count()
+
+# 整数纳秒计时，耗时按整数微秒计算
+_now_ns = time.monotonic_ns
+
 
 class ObservabilityMiddleware(BaseHTTPMiddleware):
     """
@@ -24,8 +35,8 @@ class ObservabilityMiddleware(BaseHTTPMiddleware):
     """
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        request_id = str(uuid.uuid4())[:8]
-        start_time = time.perf_counter()
+        request_id = f"{_REQUEST_ID_PREFIX}{next(_request_counter) & 0xffffff:06x}"
+        start_ns = _now_ns()
 
         # 将 request_id 注入到 request.state，方便后续使用
         request.state.request_id = request_id
@@ -42,7 +53,8 @@ class ObservabilityMiddleware(BaseHTTPMiddleware):
             error = str(e)
             raise
         finally:
-            latency_ms = (time.perf_counter() - start_time) * 1000
+            latency_us = (_now_ns() - start_ns) // 1000
+            latency_ms = latency_us / 1000
 
             # 结构化日志输出
             log_data = {
@@ -50,43 +62,66 @@ class ObservabilityMiddleware(BaseHTTPMiddleware):
                 "method": request.method,
                 "path": request.url.path,
                 "status_code": status_code,
-                "latency_ms": round(latency_ms, 2),
+                "latency_ms": latency_ms,
                 "client_ip": client_ip,
             }
 
+            # %-风格参数：格式化推迟到日志监听线程执行
             if error:
                 log_data["error"] = error
                 logger.error(
-                    f"[{request_id}] {request.method} {request.url.path} "
-                    f"-> {status_code} ({latency_ms:.2f}ms) ERROR: {error}"
+                    "[%s] %s %s -> %d (%.3fms) ERROR: %s",
+                    request_id, request.method, request.url.path, status_code, latency_ms, error,
                 )
             else:
                 # 根据状态码选择日志级别
                 if status_code >= 500:
-                    logger.error(
-                        f"[{request_id}] {request.method} {request.url.path} "
-                        f"-> {status_code} ({latency_ms:.2f}ms)"
-                    )
+                    level = logging.ERROR
                 elif status_code >= 400:
-                    logger.warning(
-                        f"[{request_id}] {request.method} {request.url.path} "
-                        f"-> {status_code} ({latency_ms:.2f}ms)"
-                    )
+                    level = logging.WARNING
                 else:
-                    logger.info(
-                        f"[{request_id}] {request.method} {request.url.path} "
-                        f"-> {status_code} ({latency_ms:.2f}ms)"
-                    )
+                    level = logging.INFO
+                logger.log(
+                    level,
+                    "[%s] %s %s -> %d (%.3fms)",
+                    request_id, request.method, request.url.path, status_code, latency_ms,
+                )
 
         # 将 request_id 添加到响应头，方便客户端追踪
         response.headers["X-Request-ID"] = request_id
         return response
 
 
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that enqueues the raw record, leaving formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_log_listener: QueueListener | None = None
+
+
 def setup_logging(log_level: str = "INFO") -> None:
-    """配置日志格式"""
+    """配置日志格式；请求线程只把日志记录放入队列，由后台线程格式化并写出"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter(
+            fmt="%(asctime)s | %(levelname)-7s | %(name)s | %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    )
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    # 进程退出前排空队列，避免丢失最后几条日志
+    atexit.register(_log_listener.stop)
+
     logging.basicConfig(
         level=getattr(logging, log_level.upper(), logging.INFO),
-        format="%(asctime)s | %(levelname)-7s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[_DeferredQueueHandler(log_queue)],
     )
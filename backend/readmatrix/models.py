@@ -1,6 +1,11 @@
 """Data models for ReadMatrix"""
 
+import operator
+import os
+import re
+import sys
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import quote
@@ -18,6 +23,9 @@ class Document:
     mtime: float
     source_type: str  # "weread" | "markdown"
     metadata: dict = field(default_factory=dict)
+    block_anchors: frozenset[str] = frozenset()  # 文件中出现的全部 ^block 锚点
+    heading_anchor: str | None = None            # 已 URL 编码的标题锚点
+    size: int | None = None                      # 文件字节数
     
     @property
     def book_id(self) -> str | None:
@@ -28,7 +36,7 @@ class Document:
         return self.metadata.get("author")
 
 
-@dataclass
+@dataclass(slots=True)
 class Chunk:
     """Represents a text chunk for indexing"""
     chunk_id: str           # sha256(source_path + "^" + block_id)[:16]
@@ -41,6 +49,7 @@ class Chunk:
     author: str | None
     highlight_time: str | None
     distance: float | None = None
+    anchor: str | None = None  # Obsidian URI fragment resolved at index time; None = unknown (older index)
     
     def to_metadata(self) -> dict:
         """Convert to ChromaDB metadata format"""
@@ -52,6 +61,7 @@ class Chunk:
             "book_title": self.book_title,
             "author": self.author or "",
             "highlight_time": self.highlight_time or "",
+            "anchor": self.anchor or "",
         }
     
     @classmethod
@@ -63,20 +73,74 @@ class Chunk:
         distance: float | None = None,
     ) -> "Chunk":
         """Create from ChromaDB metadata"""
+        try:
+            # to_metadata 总是写全 8 个键，一次 C 层 itemgetter 调用取出全部字段
+            (
+                block_id, source_path, title_path, book_id,
+                book_title, author, highlight_time, anchor,
+            ) = _metadata_values(metadata)
+        except KeyError:
+            block_id = metadata.get("block_id", "")
+            source_path = metadata.get("source_path", "")
+            title_path = metadata.get("title_path", "")
+            book_id = metadata.get("book_id", "")
+            book_title = metadata.get("book_title", "")
+            author = metadata.get("author")
+            highlight_time = metadata.get("highlight_time")
+            # 旧索引没有 anchor 键，保持 None，构建 URI 时回退到读取源文件
+            anchor = metadata.get("anchor")
+        # 同一本书的 chunk 共享路径、书名等字符串，驻留后一次检索的多个 chunk 不再各持一份
         return cls(
             chunk_id=chunk_id,
-            block_id=metadata.get("block_id", ""),
+            block_id=block_id,
             content=content,
-            source_path=metadata.get("source_path", ""),
-            title_path=metadata.get("title_path", "").split("|"),
-            book_id=metadata.get("book_id", ""),
-            book_title=metadata.get("book_title", ""),
-            author=metadata.get("author") or None,
-            highlight_time=metadata.get("highlight_time") or None,
+            source_path=sys.intern(source_path),
+            title_path=[sys.intern(title) for title in title_path.split("|")],
+            book_id=sys.intern(book_id),
+            book_title=sys.intern(book_title),
+            author=author or None,
+            highlight_time=highlight_time or None,
             distance=distance,
+            anchor=anchor,
         )
 
 
+_metadata_values = operator.itemgetter(
+    "block_id",
+    "source_path",
+    "title_path",
+    "book_id",
+    "book_title",
+    "author",
+    "highlight_time",
+    "anchor",
+)
+
+
+@dataclass(slots=True)
+class ChunkBatch:
+    """Column-oriented (SoA) chunk batch, laid out as collection.upsert expects"""
+    ids: list[str] = field(default_factory=list)
+    documents: list[str] = field(default_factory=list)
+    metadatas: list[dict] = field(default_factory=list)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    @classmethod
+    def from_chunks(cls, chunks) -> "ChunkBatch":
+        """Build all three columns in a single pass over the chunks"""
+        batch = cls()
+        add_id = batch.ids.append
+        add_document = batch.documents.append
+        add_metadata = batch.metadatas.append
+        for chunk in chunks:
+            add_id(chunk.chunk_id)
+            add_document(chunk.content)
+            add_metadata(chunk.to_metadata())
+        return batch
+
+
 @dataclass
 class Citation:
     """Represents a citation in the answer"""
@@ -93,19 +157,7 @@ class Citation:
     obsidian_uri: str | None
     
     def to_dict(self) -> dict:
-        return {
-            "id": self.id,
-            "chunk_id": self.chunk_id,
-            "block_id": self.block_id,
-            "source_path": self.source_path,
-            "title_path": self.title_path,
-            "snippet": self.snippet,
-            "book_id": self.book_id,
-            "book_title": self.book_title,
-            "author": self.author,
-            "highlight_time": self.highlight_time,
-            "obsidian_uri": self.obsidian_uri,
-        }
+        return dict(zip(_CITATION_FIELDS, _citation_values(self)))
     
     @classmethod
     def from_chunk(
@@ -119,6 +171,7 @@ class Citation:
             chunk.source_path,
             chunk.block_id,
             vault_name=vault_name,
+            anchor=chunk.anchor,
         )
         
         return cls(
@@ -136,64 +189,128 @@ class Citation:
         )
 
 
+_CITATION_FIELDS = (
+    "id",
+    "chunk_id",
+    "block_id",
+    "source_path",
+    "title_path",
+    "snippet",
+    "book_id",
+    "book_title",
+    "author",
+    "highlight_time",
+    "obsidian_uri",
+)
+_citation_values = operator.attrgetter(*_CITATION_FIELDS)
+
+
+def citations_to_dicts(citations: list[Citation]) -> list[dict]:
+    """Serialize citations in bulk (attrgetter projects all fields in one C call)"""
+    return [dict(zip(_CITATION_FIELDS, _citation_values(c))) for c in citations]
+
+
 def _build_obsidian_uri(
     source_path: str,
     block_id: str | None,
     vault_name: str | None = None,
+    anchor: str | None = None,
 ) -> str | None:
-    """根据源文件路径构建 Obsidian URI，仅在存在锚点时追加 block_id。"""
+    """根据源文件路径构建 Obsidian URI，仅在存在锚点时追加 block_id。
+
+    anchor 为索引时算好的 URI 片段（空串表示无锚点）；为 None 时才读取源文件判断。
+    """
     if not source_path:
         return None
 
-    settings = get_settings()
-    vault_path = settings.vault_path.resolve()
+    abs_root, real_root, default_vault_name = _vault_roots(get_settings().vault_path)
 
-    try:
-        relative_path = Path(source_path).resolve().relative_to(vault_path)
-    except Exception:
-        relative_path = Path(source_path).name
+    # 先用不触发 stat 的 abspath 判断；仅当路径不在库内（如经过符号链接）时才 realpath
+    relative_path = _path_within(os.path.abspath(source_path), abs_root)
+    if relative_path is None:
+        relative_path = _path_within(os.path.realpath(source_path), real_root)
+    if relative_path is None:
+        relative_path = os.path.basename(source_path)
 
-    vault = vault_name or vault_path.name
-    file_path = quote(str(relative_path).replace("\\", "/"), safe="/")
+    vault = vault_name or default_vault_name
+    file_path = quote(relative_path.replace("\\", "/"), safe="/")
     obsidian_uri = f"obsidian://open?vault={quote(vault)}&file={file_path}"
 
-    if block_id and _has_block_anchor(Path(source_path), block_id):
-        obsidian_uri += f"#^{block_id}"
-    else:
-        heading_anchor = _get_heading_anchor(Path(source_path))
-        if heading_anchor:
-            obsidian_uri += f"#{heading_anchor}"
+    if anchor is None:
+        anchor = chunk_anchor(block_id, *_file_anchors(source_path))
+    if anchor:
+        obsidian_uri += f"#{anchor}"
 
     return obsidian_uri
 
 
-def _has_block_anchor(file_path: Path, block_id: str) -> bool:
-    """判断文件中是否存在指定的 Obsidian block anchor。"""
-    try:
-        content = file_path.read_text(encoding="utf-8")
-    except Exception:
-        return False
-    return f"^{block_id}" in content
+@lru_cache(maxsize=8)
+def _vault_roots(vault_path: Path) -> tuple[str, str, str]:
+    """解析一次库根目录，返回 (abspath, realpath, 库名)；以配置的路径为键，配置变更后自动失效。"""
+    real_root = os.path.realpath(vault_path)
+    return os.path.abspath(vault_path), real_root, os.path.basename(real_root)
 
 
-def _get_heading_anchor(file_path: Path) -> str | None:
-    """获取可跳转的标题锚点（优先使用章节标题）。"""
+def _path_within(path: str, root: str) -> str | None:
+    """path 位于 root 之下时返回相对路径，否则返回 None。"""
     try:
-        content = file_path.read_text(encoding="utf-8")
-    except Exception:
+        relative = os.path.relpath(path, root)
+    except ValueError:  # Windows 上不同盘符
+        return None
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
         return None
+    return relative
 
-    # 优先取第一个二级标题，其次一级标题
-    for line in content.splitlines():
-        stripped = line.strip()
-        if stripped.startswith("## "):
-            return quote(stripped[3:].strip())
+
+_BLOCK_ANCHOR_RE = re.compile(r"\^([A-Za-z0-9_-]+)")
+
+
+def extract_anchors(content: str) -> tuple[frozenset[str], str | None]:
+    """扫描文件内容，返回 (全部 block anchor, 已编码的标题锚点)；标题优先取第一个二级标题，其次一级标题。"""
+    first_h2 = first_h1 = None
     for line in content.splitlines():
         stripped = line.strip()
-        if stripped.startswith("# "):
-            return quote(stripped[2:].strip())
+        if first_h2 is None and stripped.startswith("## "):
+            first_h2 = stripped[3:].strip()
+            break
+        if first_h1 is None and stripped.startswith("# "):
+            first_h1 = stripped[2:].strip()
+    heading = first_h2 if first_h2 is not None else first_h1
 
-    return None
+    return (
+        frozenset(_BLOCK_ANCHOR_RE.findall(content)),
+        quote(heading) if heading is not None else None,
+    )
+
+
+def chunk_anchor(
+    block_id: str | None,
+    block_anchors: frozenset[str],
+    heading_anchor: str | None,
+) -> str:
+    """chunk 的 Obsidian URI 片段：文件中有该块锚点时为 ^block_id，否则为标题锚点，都没有时为空串。"""
+    if block_id and block_id in block_anchors:
+        return f"^{block_id}"
+    return heading_anchor or ""
+
+
+@lru_cache(maxsize=1024)
+def _load_anchors(path: str, mtime_ns: int) -> tuple[frozenset[str], str | None]:
+    """一次读取文件并提取锚点；以 mtime 为键，文件修改后自动失效。"""
+    try:
+        content = Path(path).read_text(encoding="utf-8")
+    except Exception:
+        return frozenset(), None
+    return extract_anchors(content)
+
+
+def _file_anchors(file_path: str) -> tuple[frozenset[str], str | None]:
+    """按当前 mtime 取文件的 (block anchor 集合, 标题锚点) 缓存；文件不存在时返回空结果。"""
+    try:
+        mtime_ns = os.stat(file_path).st_mtime_ns
+    except OSError:
+        return frozenset(), None
+    return _load_anchors(file_path, mtime_ns)
 
 
 @dataclass
@@ -207,3 +324,4 @@ class FileRecord:
     book_id: str | None
     last_error: str | None
     updated_at: datetime = field(default_factory=datetime.now)
+    size: int | None = None  # 字节数；旧记录为 None
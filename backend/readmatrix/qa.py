@@ -2,9 +2,18 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import re
+import string
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import AsyncIterator, Optional
+from typing import AsyncIterator, Iterable, Optional
 
+from .cache import LRUCache, SemanticCache
+from .clients import get_async_openai_client, get_openai_client
 from .config import get_settings
 from .conversation import (
     ContextAssembler,
@@ -12,7 +21,7 @@ from .conversation import (
     ConversationService,
     DebateState,
 )
-from .models import Citation
+from .models import Chunk, Citation, citations_to_dicts
 from .retriever import Retriever
 
 
@@ -34,15 +43,15 @@ QA_PROMPT = """你是一位深度阅读助手，帮助用户基于他们的读
 4. 可补充你的理解，但不得编造与笔记冲突的事实。
 5. 当占比 > 0 且笔记无相关信息时，回答“根据你的笔记，我没有找到相关信息。”
 
+【用户笔记】
+{note_context}
+
 【会话摘要】
 {conversation_summary}
 
 【最近对话】
 {recent_dialogue}
 
-【用户笔记】
-{note_context}
-
 【当前问题】
 {question}
 
@@ -76,6 +85,29 @@ EXPLICIT_SUBJECT_HINTS = (
     "上一个回答",
 )
 
+# 关键词表编译成单个正则，一次 C 层扫描代替逐个 `in` 查找
+_AMBIGUOUS_REFERENCE_RE = re.compile("|".join(map(re.escape, AMBIGUOUS_REFERENCES)))
+_EXPLICIT_SUBJECT_RE = re.compile("|".join(map(re.escape, EXPLICIT_SUBJECT_HINTS)))
+# 短于该长度的追问视为承接上一轮，可直接沿用上一轮明确的对象
+CLARIFICATION_SHORT_QUERY_LEN = 15
+
+# 查询改写结果的进程内缓存条数（按模型 + 归一化问题缓存）
+REWRITE_CACHE_SIZE = 1024
+# 投机准备上下文的后台线程数（并发请求之间共享）
+SPECULATIVE_WORKERS = 4
+# RRF 平滑常数（常用取值 60），越大各名次之间的权重差越小
+RRF_K = 60
+
+
+# 拼接历史对话文本时的角色名
+_ROLE_LABELS = {"user": "用户", "assistant": "助手"}
+
+
+def _normalize_query(query: str) -> str:
+    """Collapse whitespace and casefold, so trivially different questions share cache entries."""
+    return " ".join(query.split()).casefold()
+
+
 DEBATE_END_COMMANDS = ("结束", "结束辩论", "停止辩论")
 
 DEBATE_PROMPT = """你正在与用户进行读书辩论，请你明确站在用户立场的对立面进行回应。
@@ -100,15 +132,15 @@ DEBATE_PROMPT = """你正在与用户进行读书辩论，请你明确站在用
 2. 先给核心反驳观点，再给展开论证。
 3. 尽量结合会话历史避免重复。
 
+【用户笔记】
+{note_context}
+
 【会话摘要】
 {conversation_summary}
 
 【最近对话】
 {recent_dialogue}
 
-【用户笔记】
-{note_context}
-
 【用户本轮发言】
 {question}
 
@@ -140,6 +172,23 @@ DEBATE_SUMMARY_PROMPT = """你是这场读书辩论的主持人。请根据辩
 """
 
 
+def _compile_prompt(template: str) -> tuple[tuple[str, str | None], ...]:
+    """Split a str.format template into (literal, field) pairs once, at import time."""
+    return tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(template))
+
+
+def _render_prompt(parts: tuple[tuple[str, str | None], ...], **values) -> str:
+    """Fill a compiled template; equivalent to template.format(**values) for plain {field}s."""
+    return "".join(
+        [literal + (str(values[field]) if field is not None else "") for literal, field in parts]
+    )
+
+
+# 每轮都要渲染的模板预先拆分，渲染时只做一次拼接，不再逐字符解析整段模板
+_QA_PROMPT_PARTS = _compile_prompt(QA_PROMPT)
+_DEBATE_PROMPT_PARTS = _compile_prompt(DEBATE_PROMPT)
+
+
 @dataclass
 class PreparedContext:
     """Preprocessed context shared by ask/ask_stream flows."""
@@ -179,23 +228,58 @@ class QAEngine:
         self.conversation_service = conversation_service or ConversationService()
         self.context_assembler = context_assembler or ContextAssembler()
         self._client = None
+        self._aclient = None
+
+        settings = get_settings()
+        self.answer_cache = SemanticCache(
+            threshold=settings.answer_cache_threshold,
+            max_entries=settings.answer_cache_max_entries,
+            ttl_seconds=settings.answer_cache_ttl,
+        )
+        # 融合检索结果缓存：按原问题向量匹配，与答案缓存使用同一（更严格的）阈值
+        self.fused_cache = SemanticCache(
+            threshold=settings.answer_cache_threshold,
+            max_entries=settings.retrieval_cache_max_entries,
+            ttl_seconds=settings.retrieval_cache_ttl,
+        )
+        self._rewrite_cache = LRUCache(maxsize=REWRITE_CACHE_SIZE)
+        # 按完整提示词（问题 + 检索到的笔记正文 + 会话上下文）精确缓存回答；笔记变化后键随之变化
+        self._prompt_answers = LRUCache(maxsize=settings.answer_cache_max_entries)
+        # 所有 LLM 调用（同步线程与流式）共享的并发上限，避免并发请求同时打满 provider
+        self._llm_slots = threading.BoundedSemaphore(max(1, settings.llm_max_concurrency))
+        # 与 LLM 澄清判断并行、投机执行的检索 / 上下文准备
+        self._speculative_executor = ThreadPoolExecutor(
+            max_workers=SPECULATIVE_WORKERS, thread_name_prefix="qa-speculative"
+        )
 
     @property
     def client(self):
         """Lazy-load LLM client based on provider."""
         if self._client is None:
-            import openai
-
             settings = get_settings()
             if settings.llm_provider == "siliconflow":
-                self._client = openai.OpenAI(
-                    api_key=settings.siliconflow_api_key,
-                    base_url=settings.siliconflow_base_url,
+                self._client = get_openai_client(
+                    settings.siliconflow_api_key,
+                    settings.siliconflow_base_url,
                 )
             else:
-                self._client = openai.OpenAI(api_key=settings.openai_api_key)
+                self._client = get_openai_client(settings.openai_api_key)
         return self._client
 
+    @property
+    def aclient(self):
+        """Lazy-load the async LLM client used by streaming paths."""
+        if self._aclient is None:
+            settings = get_settings()
+            if settings.llm_provider == "siliconflow":
+                self._aclient = get_async_openai_client(
+                    settings.siliconflow_api_key,
+                    settings.siliconflow_base_url,
+                )
+            else:
+                self._aclient = get_async_openai_client(settings.openai_api_key)
+        return self._aclient
+
     def _build_prompt(
         self,
         *,
@@ -207,7 +291,8 @@ class QAEngine:
     ) -> str:
         """Build QA prompt with runtime sections."""
         safe_ratio = max(0, min(100, note_ratio))
-        return QA_PROMPT.format(
+        return _render_prompt(
+            _QA_PROMPT_PARTS,
             question=question,
             note_ratio=safe_ratio,
             conversation_summary=conversation_summary,
@@ -216,8 +301,24 @@ class QAEngine:
         )
 
     def _rewrite_query(self, original_query: str) -> list[str]:
-        """Rewrite user question into 2-3 retrieval-friendly queries."""
+        """Rewrite user question into 2-3 retrieval-friendly queries (cached per normalized question)."""
         settings = get_settings()
+        # 忽略首尾/连续空白与大小写差异，重复提问不再调用 LLM
+        normalized = _normalize_query(original_query)
+        cache_key = (settings.llm_model, normalized)
+        rewrites = self._rewrite_cache.get(cache_key)
+        if rewrites is None:
+            queries = self._request_rewrites(original_query)
+            if queries is None:
+                return [original_query]
+            # 缓存中不保留原问题本身，命中时换成本次的原始写法
+            rewrites = tuple(q for q in queries if _normalize_query(q) != normalized)
+            self._rewrite_cache.put(cache_key, rewrites)
+
+        return [original_query, *rewrites][:3]
+
+    def _request_rewrites(self, original_query: str) -> tuple[str, ...] | None:
+        """Ask the LLM for rewritten queries; None when the call fails (not cached)."""
         prompt = f"""将以下问题改写为 2-3 个更具体的搜索查询，用于在读书笔记中检索相关内容。
 
 要求：
@@ -230,19 +331,53 @@ class QAEngine:
 搜索查询："""
 
         try:
-            response = self.client.chat.completions.create(
-                model=settings.llm_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=200,
-            )
+            response = self._complete(prompt, temperature=0.3, max_tokens=200)
             text = response.choices[0].message.content or ""
-            queries = [q.strip().lstrip("0123456789.-、 ") for q in text.split("\n") if q.strip()]
-            if original_query not in queries:
-                queries.insert(0, original_query)
-            return queries[:3]
+            return tuple(q.strip().lstrip("0123456789.-、 ") for q in text.split("\n") if q.strip())
         except Exception:
-            return [original_query]
+            return None
+
+    def _retrieve_fused(self, query: str, search_kwargs: dict) -> list[Chunk]:
+        """Top-k chunks for the question, fusing the raw and rewritten query results."""
+        retriever = self.retriever
+        cache_enabled = retriever.cache_enabled and get_settings().fused_retrieval_cache_enabled
+        if cache_enabled:
+            # 融合结果按原问题向量做语义缓存：复述的问题连改写 LLM 调用和各子查询检索一起跳过
+            embedding = retriever.embed_query(query)
+            scope = retriever.cache_scope(
+                search_kwargs["top_k"],
+                search_kwargs["book_id"],
+                search_kwargs["book_title"],
+            )
+            cached = retriever.cached_chunks(embedding, scope, cache=self.fused_cache)
+            if cached is not None:
+                return cached
+
+        # 改写要等一次 LLM 往返：期间先在后台用原问题检索，改写返回后只检索新增的查询
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieve") as executor:
+            raw_future = executor.submit(retriever.search, query, **search_kwargs)
+            extra_queries = [q for q in self._rewrite_query(query) if q != query]
+            # 各改写查询一次批量 embed，检索并发执行
+            extra_results = (
+                retriever.search_batch(extra_queries, **search_kwargs) if extra_queries else []
+            )
+            results = [raw_future.result(), *extra_results]
+
+        # Reciprocal Rank Fusion 合并各查询结果：在多个查询中都靠前的 chunk 优先；
+        # 同分时按首次出现顺序（原问题在前）
+        scores: dict[str, float] = defaultdict(float)
+        merged: dict[str, Chunk] = {}
+        for chunks in results:
+            for rank, chunk in enumerate(chunks, 1):
+                scores[chunk.chunk_id] += 1.0 / (RRF_K + rank)
+                merged.setdefault(chunk.chunk_id, chunk)
+        fused = sorted(merged.values(), key=lambda c: -scores[c.chunk_id])[
+            : search_kwargs["top_k"]
+        ]
+
+        if cache_enabled:
+            retriever.cache_chunks(embedding, scope, fused, cache=self.fused_cache)
+        return fused
 
     def _prepare_context(
         self,
@@ -254,24 +389,17 @@ class QAEngine:
     ) -> PreparedContext:
         """Prepare retrieval context, citations, and final QA prompt."""
         settings = get_settings()
-        queries = self._rewrite_query(query)
+        search_kwargs = {
+            "top_k": settings.retrieval_top_k,
+            "book_id": book_id,
+            "book_title": book_title,
+        }
 
-        all_chunks = []
-        seen_chunk_ids = set()
+        fused = self._retrieve_fused(query, search_kwargs)
 
-        for q in queries:
-            chunks = self.retriever.search(
-                query=q,
-                top_k=settings.retrieval_top_k,
-                book_id=book_id,
-                book_title=book_title,
-            )
-            for chunk in chunks:
-                if chunk.chunk_id not in seen_chunk_ids:
-                    seen_chunk_ids.add(chunk.chunk_id)
-                    all_chunks.append(chunk)
-
-        chunks = all_chunks[: settings.retrieval_top_k]
+        # 先按相关度截取 top_k，再按源文件与块位置排序：同一组证据总是生成逐字节相同的笔记段，
+        # 且提示词中稳定部分（指令、笔记）在前、易变部分（对话、问题）在后，便于 provider 复用前缀缓存
+        chunks = sorted(fused, key=lambda c: (c.source_path, c.block_id))
 
         context_parts = []
         citations: list[Citation] = []
@@ -313,11 +441,11 @@ class QAEngine:
         text = query.strip()
         if not text:
             return False
-        return any(token in text for token in AMBIGUOUS_REFERENCES)
+        return _AMBIGUOUS_REFERENCE_RE.search(text) is not None
 
     def _has_explicit_subject(self, query: str) -> bool:
         text = query.strip()
-        if any(token in text for token in EXPLICIT_SUBJECT_HINTS):
+        if _EXPLICIT_SUBJECT_RE.search(text):
             return True
         if "“" in text and "”" in text:
             return True
@@ -338,17 +466,36 @@ class QAEngine:
             return True
         return True
 
+    def _decisive_clarification(
+        self,
+        query: str,
+        recent_messages: list[ConversationMessage],
+    ) -> bool | None:
+        """Settle an ambiguous reference without the LLM when the history makes it obvious; else None."""
+        # 没有历史可供指代，必须澄清
+        if not recent_messages:
+            return True
+        # 上一轮用户问题点明了对象，简短的追问默认指向它
+        last_user = next((m for m in reversed(recent_messages) if m.role == "user"), None)
+        if (
+            last_user is not None
+            and len(query.strip()) < CLARIFICATION_SHORT_QUERY_LEN
+            and _EXPLICIT_SUBJECT_RE.search(last_user.content)
+        ):
+            return False
+        return None
+
     def _llm_based_clarification(
         self,
         query: str,
         recent_messages: list[ConversationMessage],
     ) -> bool:
-        settings = get_settings()
-        history_lines = []
-        for item in recent_messages[-6:]:
-            role = "用户" if item.role == "user" else "助手"
-            history_lines.append(f"{role}: {item.content}")
-        history_text = "\n".join(history_lines) or "（无历史）"
+        history_text = "\n".join(
+            [
+                f"{_ROLE_LABELS.get(item.role, '助手')}: {item.content}"
+                for item in recent_messages[-6:]
+            ]
+        ) or "（无历史）"
 
         prompt = f"""你是对话澄清分类器。
 
@@ -363,25 +510,36 @@ class QAEngine:
 """
 
         try:
-            response = self.client.chat.completions.create(
-                model=settings.llm_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-                max_tokens=5,
-            )
+            response = self._complete(prompt, temperature=0, max_tokens=5)
             answer = (response.choices[0].message.content or "").strip().upper()
             return answer.startswith("YES")
         except Exception:
             return self._rule_based_clarification(query, recent_messages)
 
-    def _needs_clarification(
+    def _prepare_context_unless_clarifying(
         self,
         query: str,
         recent_messages: list[ConversationMessage],
-    ) -> bool:
-        if not self._rule_based_clarification(query, recent_messages):
-            return False
-        return self._llm_based_clarification(query, recent_messages)
+        check_clarification: bool,
+        **context_kwargs,
+    ) -> PreparedContext | None:
+        """
+        Prepare the QA context, or return None when the question needs clarification first.
+
+        The LLM clarification check and retrieval are independent, so when the
+        rule-based pre-check flags the question, retrieval starts speculatively
+        alongside the LLM call and is discarded if clarification wins.
+        """
+        if not check_clarification or not self._rule_based_clarification(query, recent_messages):
+            return self._prepare_context(query, **context_kwargs)
+        decided = self._decisive_clarification(query, recent_messages)
+        if decided is not None:
+            return None if decided else self._prepare_context(query, **context_kwargs)
+        ctx_future = self._speculative_executor.submit(self._prepare_context, query, **context_kwargs)
+        if self._llm_based_clarification(query, recent_messages):
+            ctx_future.cancel()
+            return None
+        return ctx_future.result()
 
     def _build_clarification_question(
         self,
@@ -389,7 +547,8 @@ class QAEngine:
         recent_messages: list[ConversationMessage],
     ) -> str:
         if recent_messages:
-            recent_hint = recent_messages[-1].content.strip().replace("\n", " ")[:48]
+            # 先截断再替换换行，长回答不必整段复制
+            recent_hint = recent_messages[-1].content.lstrip()[:48].rstrip().replace("\n", " ")
             if recent_hint:
                 return (
                     "我需要先确认一下：你这次提到的对象具体指哪一个？"
@@ -401,15 +560,24 @@ class QAEngine:
         self,
         previous_summary: str,
         history: list[ConversationMessage],
+        strategy: str = "stuff",
     ) -> str:
-        settings = get_settings()
-        history_lines = []
-        for item in history[-16:]:
-            role = "用户" if item.role == "user" else "助手"
-            history_lines.append(f"{role}: {item.content}")
-        history_text = "\n".join(history_lines)
+        history_text = "\n".join(
+            [f"{_ROLE_LABELS.get(item.role, '分段摘要')}: {item.content}" for item in history]
+        )
+
+        if strategy == "map":
+            # map 阶段只总结单个对话分段，最终由 reduce 合并
+            instruction = "请把以下对话片段整理成紧凑摘要。"
+            section_title = "对话片段"
+        elif strategy == "reduce":
+            instruction = "请把历史摘要与以下各分段摘要合并，输出更新后的紧凑摘要，供后续追问使用。"
+            section_title = "分段摘要"
+        else:
+            instruction = "请在历史摘要的基础上合并新增对话，输出更新后的紧凑摘要，供后续追问使用。"
+            section_title = "新增对话"
 
-        prompt = f"""请把以下对话整理成紧凑摘要，供后续追问使用。
+        prompt = f"""{instruction}
 
 要求：
 1. 保留用户目标、关键结论、关键术语
@@ -420,30 +588,110 @@ class QAEngine:
 历史摘要：
 {previous_summary or '（无）'}
 
-最近对话：
+{section_title}：
 {history_text}
 
 新摘要："""
 
         try:
-            response = self.client.chat.completions.create(
-                model=settings.llm_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=500,
-            )
+            response = self._complete(prompt, temperature=0.2, max_tokens=500)
             text = (response.choices[0].message.content or "").strip()
             return text or previous_summary
         except Exception:
             return previous_summary
 
+    def _prompt_cache_key(self, prompt: str) -> str | None:
+        """Evidence signature of a QA prompt under the current generation settings."""
+        settings = get_settings()
+        if not settings.answer_cache_enabled:
+            return None
+        payload = f"{settings.llm_model}\0{settings.temperature}\0{prompt}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _answer_prompt(self, prompt: str) -> str:
+        """Answer a QA prompt, reusing the answer of an identical prompt (same question and evidence)."""
+        key = self._prompt_cache_key(prompt)
+        answer = self._prompt_answers.get(key) if key else None
+        if answer is None:
+            answer = self._call_llm_answer(prompt)
+            if key and answer:
+                self._prompt_answers.put(key, answer)
+        return answer
+
+    async def _stream_answer(self, prompt: str) -> AsyncIterator[str]:
+        """Stream answer deltas for a QA prompt; an identical prompt replays the cached answer as one delta."""
+        key = self._prompt_cache_key(prompt)
+        cached = self._prompt_answers.get(key) if key else None
+        if cached is not None:
+            yield cached
+            return
+
+        answer_parts: list[str] = []
+        async for delta in self._stream_llm(prompt):
+            answer_parts.append(delta)
+            yield delta
+
+        # 客户端中途断开时生成器被关闭，不完整的回答不会写入缓存
+        if key and answer_parts:
+            self._prompt_answers.put(key, "".join(answer_parts))
+
     def _call_llm_answer(self, prompt: str) -> str:
+        response = self._complete(prompt, temperature=get_settings().temperature)
+        return response.choices[0].message.content or ""
+
+    def _complete(self, prompt: str, **kwargs):
+        """Single-prompt chat completion, bounded by llm_max_concurrency."""
+        with self._llm_slots:
+            return self.client.chat.completions.create(
+                model=get_settings().llm_model,
+                messages=[{"role": "user", "content": prompt}],
+                **kwargs,
+            )
+
+    async def _acquire_llm_slot(self):
+        """Wait for an LLM slot without blocking the event loop; a cancelled wait never leaks it."""
+        if self._llm_slots.acquire(blocking=False):
+            return
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._llm_slots.acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            waiter.add_done_callback(lambda _: self._llm_slots.release())
+            raise
+
+    async def _stream_llm(self, prompt: str) -> AsyncIterator[str]:
+        """Stream completion deltas for a prompt; the LLM slot is held until the stream ends."""
         settings = get_settings()
-        response = self.client.chat.completions.create(
-            model=settings.llm_model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=settings.temperature,
-        )
+        await self._acquire_llm_slot()
+        try:
+            # 异步客户端逐块 await，生成期间不阻塞事件循环上的其他请求
+            stream = await self.aclient.chat.completions.create(
+                model=settings.llm_model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=settings.temperature,
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            self._llm_slots.release()
+
+    async def _acall_llm_answer(self, prompt: str) -> str:
+        """Async counterpart of _call_llm_answer for the streaming paths."""
+        settings = get_settings()
+        await self._acquire_llm_slot()
+        try:
+            response = await self.aclient.chat.completions.create(
+                model=settings.llm_model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=settings.temperature,
+            )
+        finally:
+            self._llm_slots.release()
         return response.choices[0].message.content or ""
 
     def _is_debate_end_command(self, query: str) -> bool:
@@ -486,7 +734,8 @@ class QAEngine:
 
     def _build_debate_turn_prompt(self, query: str, debate: dict, ctx: PreparedContext) -> str:
         note_context = ctx.note_context.strip() if ctx.note_context else "（未检索到相关笔记片段）"
-        return DEBATE_PROMPT.format(
+        return _render_prompt(
+            _DEBATE_PROMPT_PARTS,
             topic=debate["topic"],
             user_stance=debate["user_stance"],
             conversation_summary=ctx.conversation_summary,
@@ -499,33 +748,32 @@ class QAEngine:
         self,
         conversation_id: str,
         state_created_at: str | None,
-    ) -> list[ConversationMessage]:
+    ) -> Iterable[ConversationMessage]:
+        # 历史只被遍历一次用于拼接 prompt，无需物化为列表
         if state_created_at:
-            return self.conversation_service.list_messages_since(
+            return self.conversation_service.iter_messages_since(
                 conversation_id=conversation_id,
                 since_created_at=state_created_at,
                 limit=200,
                 include_system=False,
             )
-        return self.conversation_service.list_messages(
+        return self.conversation_service.iter_messages(
             conversation_id=conversation_id,
             limit=200,
             offset=0,
             include_system=False,
         )
 
-    def _build_debate_summary_prompt(self, debate: dict, history: list[ConversationMessage]) -> str:
-        history_lines: list[str] = []
-        for item in history:
-            if item.role not in {"user", "assistant"}:
-                continue
-            role = "用户" if item.role == "user" else "助手"
-            text = item.content.strip()
-            if not text:
-                continue
-            history_lines.append(f"{role}: {text}")
-
-        history_text = "\n".join(history_lines) or "（无有效辩论记录）"
+    def _build_debate_summary_prompt(
+        self, debate: dict, history: Iterable[ConversationMessage]
+    ) -> str:
+        history_text = "\n".join(
+            [
+                f"{_ROLE_LABELS[item.role]}: {text}"
+                for item in history
+                if item.role in _ROLE_LABELS and (text := item.content.strip())
+            ]
+        ) or "（无有效辩论记录）"
         return DEBATE_SUMMARY_PROMPT.format(
             topic=debate["topic"],
             user_stance=debate["user_stance"],
@@ -540,6 +788,71 @@ class QAEngine:
             return text
         return f"{text}\n\n非笔记依据：\n- 无"
 
+    def _append_turn(
+        self,
+        conversation_id: str,
+        query: str,
+        answer: str,
+        citations: list[dict] | None = None,
+        is_clarification: bool = False,
+    ):
+        """Persist a user question and its reply in a single transaction."""
+        with self.conversation_service.batch_append(conversation_id) as service:
+            service.append_user_message(conversation_id, query)
+            service.append_assistant_message(
+                conversation_id,
+                answer,
+                citations=citations,
+                is_clarification=is_clarification,
+            )
+
+    def _answer_cache_scope(self, book_id: Optional[str], book_title: Optional[str]) -> tuple:
+        """Answers are only interchangeable under the same filters and generation settings."""
+        settings = get_settings()
+        return (book_id, book_title, settings.llm_model, settings.qa_note_ratio)
+
+    def _lookup_cached_answer(
+        self,
+        query: str,
+        book_id: Optional[str],
+        book_title: Optional[str],
+        conversation_id: str | None,
+    ) -> tuple[list[float] | None, tuple[str, list[Citation]] | None]:
+        """
+        Look up a cached answer for the opening question of a new conversation.
+
+        Returns:
+            Tuple of (query_embedding, cached (answer, citations)); the embedding is
+            None when the question is not cacheable.
+        """
+        # 已有会话的回答依赖历史上下文，不参与缓存
+        if conversation_id or not get_settings().answer_cache_enabled:
+            return None, None
+        try:
+            embedding = self.retriever.embed_query(query)
+        except Exception:
+            return None, None
+        cached = self.answer_cache.get(
+            embedding, scope=self._answer_cache_scope(book_id, book_title)
+        )
+        return embedding, cached
+
+    def _store_cached_answer(
+        self,
+        embedding: list[float] | None,
+        book_id: Optional[str],
+        book_title: Optional[str],
+        answer: str,
+        citations: list[Citation],
+    ):
+        if embedding is None:
+            return
+        self.answer_cache.put(
+            embedding,
+            (answer, citations),
+            scope=self._answer_cache_scope(book_id, book_title),
+        )
+
     def ask(
         self,
         query: str,
@@ -553,7 +866,7 @@ class QAEngine:
         if not ctx.has_chunks and settings.qa_note_ratio > 0:
             return "根据你的笔记，我没有找到相关信息。", []
 
-        answer = self._call_llm_answer(ctx.prompt)
+        answer = self._answer_prompt(ctx.prompt)
         return answer, ctx.citations
 
     def ask_with_conversation(
@@ -630,7 +943,7 @@ class QAEngine:
             self.conversation_service.append_assistant_message(
                 conv_id,
                 answer,
-                citations=[c.to_dict() for c in response_citations],
+                citations=citations_to_dicts(response_citations),
                 is_clarification=False,
             )
             self.conversation_service.refresh_summary_if_needed(
@@ -646,41 +959,57 @@ class QAEngine:
                 debate_event="normal",
             )
 
+        cache_embedding, cached = self._lookup_cached_answer(
+            query, book_id, book_title, conversation_id
+        )
+        if cached is not None:
+            answer, citations = cached
+            self._append_turn(conv_id, query, answer, citations=citations_to_dicts(citations))
+            self.conversation_service.refresh_summary_if_needed(
+                conv_id,
+                self._build_summary_text,
+            )
+            return AskResult(
+                answer=answer,
+                citations=citations,
+                conversation_id=conv_id,
+                mode="qa",
+            )
+
         recent_before = (
             self.conversation_service.get_recent_window(conv_id) if use_context else []
         )
-        self.conversation_service.append_user_message(conv_id, query)
-
-        if use_context and self.conversation_service.get_recent_clarification_count(conv_id) < 2:
-            if self._needs_clarification(query, recent_before):
-                question = self._build_clarification_question(query, recent_before)
-                self.conversation_service.append_assistant_message(
-                    conv_id,
-                    question,
-                    citations=[],
-                    is_clarification=True,
-                )
-                return AskResult(
-                    answer=question,
-                    citations=[],
-                    conversation_id=conv_id,
-                    needs_clarification=True,
-                    clarification_question=question,
-                    mode="qa",
-                )
 
+        check_clarification = (
+            use_context and self.conversation_service.get_recent_clarification_count(conv_id) < 2
+        )
         summary = self.conversation_service.get_summary(conv_id) if use_context else ""
-        ctx = self._prepare_context(
-            query=query,
+        ctx = self._prepare_context_unless_clarifying(
+            query,
+            recent_before,
+            check_clarification,
             book_id=book_id,
             book_title=book_title,
             summary=summary,
             recent_messages=recent_before if use_context else [],
         )
 
+        # 用户消息推迟到拿到回复后与之同一事务写入，中途失败不会留下无回复的提问
+        if ctx is None:
+            question = self._build_clarification_question(query, recent_before)
+            self._append_turn(conv_id, query, question, citations=[], is_clarification=True)
+            return AskResult(
+                answer=question,
+                citations=[],
+                conversation_id=conv_id,
+                needs_clarification=True,
+                clarification_question=question,
+                mode="qa",
+            )
+
         if not ctx.has_chunks and settings.qa_note_ratio > 0:
             answer = "根据你的笔记，我没有找到相关信息。"
-            self.conversation_service.append_assistant_message(conv_id, answer, citations=[])
+            self._append_turn(conv_id, query, answer, citations=[])
             self.conversation_service.refresh_summary_if_needed(
                 conv_id,
                 self._build_summary_text,
@@ -692,13 +1021,9 @@ class QAEngine:
                 mode="qa",
             )
 
-        answer = self._call_llm_answer(ctx.prompt)
-        self.conversation_service.append_assistant_message(
-            conv_id,
-            answer,
-            citations=[c.to_dict() for c in ctx.citations],
-            is_clarification=False,
-        )
+        answer = self._answer_prompt(ctx.prompt)
+        self._store_cached_answer(cache_embedding, book_id, book_title, answer, ctx.citations)
+        self._append_turn(conv_id, query, answer, citations=citations_to_dicts(ctx.citations))
         self.conversation_service.refresh_summary_if_needed(
             conv_id,
             self._build_summary_text,
@@ -719,7 +1044,7 @@ class QAEngine:
     ) -> AsyncIterator[dict]:
         """Legacy streaming single-turn entrypoint."""
         settings = get_settings()
-        ctx = self._prepare_context(query, book_id, book_title)
+        ctx = await asyncio.to_thread(self._prepare_context, query, book_id, book_title)
 
         if not ctx.has_chunks and settings.qa_note_ratio > 0:
             yield {
@@ -730,21 +1055,10 @@ class QAEngine:
             yield {"event": "done", "data": {}}
             return
 
-        stream = self.client.chat.completions.create(
-            model=settings.llm_model,
-            messages=[{"role": "user", "content": ctx.prompt}],
-            temperature=settings.temperature,
-            stream=True,
-        )
-
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield {
-                    "event": "delta",
-                    "data": {"content": chunk.choices[0].delta.content},
-                }
+        async for delta in self._stream_answer(ctx.prompt):
+            yield {"event": "delta", "data": {"content": delta}}
 
-        yield {"event": "citations", "data": [c.to_dict() for c in ctx.citations]}
+        yield {"event": "citations", "data": citations_to_dicts(ctx.citations)}
         yield {"event": "done", "data": {}}
 
     async def ask_stream_with_conversation(
@@ -759,33 +1073,47 @@ class QAEngine:
     ) -> AsyncIterator[dict]:
         """Streaming conversation entrypoint for QA mode and debate mode."""
         settings = get_settings()
-        conv_id = self.conversation_service.ensure_conversation(conversation_id)
+        conv_id = await asyncio.to_thread(
+            self.conversation_service.ensure_conversation, conversation_id
+        )
 
         if mode == "debate":
             debate_cfg = self._normalize_debate_config(debate)
             if not debate_cfg["topic"] or not debate_cfg["user_stance"]:
                 raise ValueError("debate topic and user_stance are required")
 
-            active_state = self._ensure_active_debate_state(conv_id, debate_cfg)
-            recent_before = (
-                self.conversation_service.get_recent_window(conv_id) if use_context else []
+            active_state = await asyncio.to_thread(
+                self._ensure_active_debate_state, conv_id, debate_cfg
             )
-            self.conversation_service.append_user_message(conv_id, query)
+            recent_before, summary = (
+                await asyncio.gather(
+                    asyncio.to_thread(self.conversation_service.get_recent_window, conv_id),
+                    asyncio.to_thread(self.conversation_service.get_summary, conv_id),
+                )
+                if use_context
+                else ([], "")
+            )
+            await asyncio.to_thread(self.conversation_service.append_user_message, conv_id, query)
 
             if self._is_debate_end_command(query):
-                history = self._collect_debate_history(
+                history = await asyncio.to_thread(
+                    self._collect_debate_history,
                     conversation_id=conv_id,
                     state_created_at=(active_state or {}).get("created_at"),
                 )
                 summary_prompt = self._build_debate_summary_prompt(debate_cfg, history)
-                answer = self._ensure_non_note_section(self._call_llm_answer(summary_prompt))
-                self.conversation_service.append_assistant_message(
+                answer = self._ensure_non_note_section(
+                    await self._acall_llm_answer(summary_prompt)
+                )
+                await asyncio.to_thread(
+                    self.conversation_service.append_assistant_message,
                     conv_id,
                     answer,
                     citations=[],
                     is_clarification=False,
                 )
-                self.conversation_service.save_debate_state(
+                await asyncio.to_thread(
+                    self.conversation_service.save_debate_state,
                     conv_id,
                     DebateState(
                         topic=debate_cfg["topic"],
@@ -815,8 +1143,8 @@ class QAEngine:
                 yield {"event": "done", "data": {}}
                 return
 
-            summary = self.conversation_service.get_summary(conv_id) if use_context else ""
-            ctx = self._prepare_context(
+            ctx = await asyncio.to_thread(
+                self._prepare_context,
                 query=query,
                 book_id=book_id,
                 book_title=book_title,
@@ -837,26 +1165,19 @@ class QAEngine:
                 },
             }
 
-            stream = self.client.chat.completions.create(
-                model=settings.llm_model,
-                messages=[{"role": "user", "content": debate_prompt}],
-                temperature=settings.temperature,
-                stream=True,
-            )
-
             answer_parts: list[str] = []
-            for chunk in stream:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    answer_parts.append(delta)
-                    yield {"event": "delta", "data": {"content": delta}}
+            async for delta in self._stream_llm(debate_prompt):
+                answer_parts.append(delta)
+                yield {"event": "delta", "data": {"content": delta}}
 
             full_answer = self._ensure_non_note_section("".join(answer_parts))
             response_citations = ctx.citations if ctx.has_chunks else []
-            self.conversation_service.append_assistant_message(
+            citations_payload = citations_to_dicts(response_citations)
+            await asyncio.to_thread(
+                self.conversation_service.append_assistant_message,
                 conv_id,
                 full_answer,
-                citations=[c.to_dict() for c in response_citations],
+                citations=citations_payload,
                 is_clarification=False,
             )
             self.conversation_service.refresh_summary_if_needed(
@@ -864,48 +1185,89 @@ class QAEngine:
                 self._build_summary_text,
             )
 
-            yield {"event": "citations", "data": [c.to_dict() for c in response_citations]}
+            yield {"event": "citations", "data": citations_payload}
             yield {"event": "done", "data": {}}
             return
 
-        recent_before = (
-            self.conversation_service.get_recent_window(conv_id) if use_context else []
+        cache_embedding, cached = await asyncio.to_thread(
+            self._lookup_cached_answer, query, book_id, book_title, conversation_id
         )
-        self.conversation_service.append_user_message(conv_id, query)
+        if cached is not None:
+            answer, citations = cached
+            citations_payload = citations_to_dicts(citations)
+            await asyncio.to_thread(
+                self._append_turn, conv_id, query, answer, citations=citations_payload
+            )
+            self.conversation_service.refresh_summary_if_needed(
+                conv_id,
+                self._build_summary_text,
+            )
+            yield {
+                "event": "meta",
+                "data": {
+                    "conversation_id": conv_id,
+                    "needs_clarification": False,
+                    "clarification_question": None,
+                    "mode": "qa",
+                    "debate_status": None,
+                    "debate_event": None,
+                },
+            }
+            yield {"event": "delta", "data": {"content": answer}}
+            yield {"event": "citations", "data": citations_payload}
+            yield {"event": "done", "data": {}}
+            return
 
-        if use_context and self.conversation_service.get_recent_clarification_count(conv_id) < 2:
-            if self._needs_clarification(query, recent_before):
-                question = self._build_clarification_question(query, recent_before)
-                self.conversation_service.append_assistant_message(
-                    conv_id,
-                    question,
-                    citations=[],
-                    is_clarification=True,
-                )
-                yield {
-                    "event": "meta",
-                    "data": {
-                        "conversation_id": conv_id,
-                        "needs_clarification": True,
-                        "clarification_question": question,
-                        "mode": "qa",
-                        "debate_status": None,
-                        "debate_event": None,
-                    },
-                }
-                yield {"event": "delta", "data": {"content": question}}
-                yield {"event": "citations", "data": []}
-                yield {"event": "done", "data": {}}
-                return
+        # 三项读取互不依赖（澄清计数只看助手消息），并发执行；最近窗口须在写入本轮问题之前读取
+        recent_before, clarification_count, summary = (
+            await asyncio.gather(
+                asyncio.to_thread(self.conversation_service.get_recent_window, conv_id),
+                asyncio.to_thread(
+                    self.conversation_service.get_recent_clarification_count, conv_id
+                ),
+                asyncio.to_thread(self.conversation_service.get_summary, conv_id),
+            )
+            if use_context
+            else ([], 0, "")
+        )
+        await asyncio.to_thread(self.conversation_service.append_user_message, conv_id, query)
 
-        summary = self.conversation_service.get_summary(conv_id) if use_context else ""
-        ctx = self._prepare_context(
-            query=query,
+        ctx = await asyncio.to_thread(
+            self._prepare_context_unless_clarifying,
+            query,
+            recent_before,
+            use_context and clarification_count < 2,
             book_id=book_id,
             book_title=book_title,
             summary=summary,
             recent_messages=recent_before if use_context else [],
         )
+        if ctx is None:
+            question = await asyncio.to_thread(
+                self._build_clarification_question, query, recent_before
+            )
+            await asyncio.to_thread(
+                self.conversation_service.append_assistant_message,
+                conv_id,
+                question,
+                citations=[],
+                is_clarification=True,
+            )
+            yield {
+                "event": "meta",
+                "data": {
+                    "conversation_id": conv_id,
+                    "needs_clarification": True,
+                    "clarification_question": question,
+                    "mode": "qa",
+                    "debate_status": None,
+                    "debate_event": None,
+                },
+            }
+            yield {"event": "delta", "data": {"content": question}}
+            yield {"event": "citations", "data": []}
+            yield {"event": "done", "data": {}}
+            return
 
         yield {
             "event": "meta",
@@ -921,7 +1283,12 @@ class QAEngine:
 
         if not ctx.has_chunks and settings.qa_note_ratio > 0:
             answer = "根据你的笔记，我没有找到相关信息。"
-            self.conversation_service.append_assistant_message(conv_id, answer, citations=[])
+            await asyncio.to_thread(
+                self.conversation_service.append_assistant_message,
+                conv_id,
+                answer,
+                citations=[],
+            )
             self.conversation_service.refresh_summary_if_needed(
                 conv_id,
                 self._build_summary_text,
@@ -931,25 +1298,19 @@ class QAEngine:
             yield {"event": "done", "data": {}}
             return
 
-        stream = self.client.chat.completions.create(
-            model=settings.llm_model,
-            messages=[{"role": "user", "content": ctx.prompt}],
-            temperature=settings.temperature,
-            stream=True,
-        )
-
         answer_parts: list[str] = []
-        for chunk in stream:
-            delta = chunk.choices[0].delta.content
-            if delta:
-                answer_parts.append(delta)
-                yield {"event": "delta", "data": {"content": delta}}
+        async for delta in self._stream_answer(ctx.prompt):
+            answer_parts.append(delta)
+            yield {"event": "delta", "data": {"content": delta}}
 
         full_answer = "".join(answer_parts)
-        self.conversation_service.append_assistant_message(
+        self._store_cached_answer(cache_embedding, book_id, book_title, full_answer, ctx.citations)
+        citations_payload = citations_to_dicts(ctx.citations)
+        await asyncio.to_thread(
+            self.conversation_service.append_assistant_message,
             conv_id,
             full_answer,
-            citations=[c.to_dict() for c in ctx.citations],
+            citations=citations_payload,
             is_clarification=False,
         )
         self.conversation_service.refresh_summary_if_needed(
@@ -957,5 +1318,5 @@ class QAEngine:
             self._build_summary_text,
         )
 
-        yield {"event": "citations", "data": [c.to_dict() for c in ctx.citations]}
+        yield {"event": "citations", "data": citations_payload}
         yield {"event": "done", "data": {}}
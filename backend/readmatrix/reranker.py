@@ -1,11 +1,22 @@
 """Reranker for improving retrieval quality using SiliconFlow API"""
 
+import hashlib
+import threading
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import Optional
 
+from .cache import LRUCache
 from .config import get_settings
 from .models import Chunk
 
+# (model, sha256(query), sha256(content)) -> 相关性分数；同一 chunk 跨轮次重复出现时不再送 API
+RERANK_SCORE_CACHE_SIZE = 4096
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 
 @dataclass
 class RankedChunk:
@@ -22,17 +33,26 @@ class Reranker:
 
     def __init__(self):
         self._client = None
+        self._scores = LRUCache(maxsize=RERANK_SCORE_CACHE_SIZE)
+        # 相同 (model, query, documents) 的并发请求共享同一次 HTTP 调用
+        self._inflight: dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
 
     @property
     def client(self):
         """Lazy-load HTTP client"""
         if self._client is None:
             import httpx
+            from .clients import HTTP_LIMITS, http2_available
             settings = get_settings()
+            # removesuffix 而非 rstrip：rstrip("/v1") 会逐字符剥掉结尾的 "/"、"v"、"1"
             self._client = httpx.Client(
-                base_url=settings.siliconflow_base_url.rstrip("/v1"),
+                base_url=settings.siliconflow_base_url.rstrip("/").removesuffix("/v1"),
                 headers={"Authorization": f"Bearer {settings.siliconflow_api_key}"},
                 timeout=30.0,
+                limits=HTTP_LIMITS,
+                # 安装了 h2 时走 HTTP/2，多个并发 rerank 复用同一条连接
+                http2=http2_available(),
             )
         return self._client
 
@@ -57,6 +77,9 @@ class Reranker:
         """
         if not chunks:
             return []
+        # 单个候选无需排序，不必把正文送去重新编码
+        if len(chunks) == 1:
+            return chunks
 
         settings = get_settings()
 
@@ -68,26 +91,11 @@ class Reranker:
             # Prepare documents for reranking
             documents = [chunk.content for chunk in chunks]
 
-            # Call SiliconFlow rerank API
-            response = self.client.post(
-                "/v1/rerank",
-                json={
-                    "model": model,
-                    "query": query,
-                    "documents": documents,
-                    "top_n": top_k or len(chunks),
-                    "return_documents": False,
-                },
-            )
-            response.raise_for_status()
-            result = response.json()
-
             # Sort chunks by rerank score
-            ranked_indices = result.get("results", [])
+            ranked_indices = self._rank(model, query, documents, top_k or len(chunks))
             reranked_chunks = []
 
-            for item in ranked_indices:
-                idx = item.get("index", 0)
+            for idx in ranked_indices:
                 if 0 <= idx < len(chunks):
                     reranked_chunks.append(chunks[idx])
 
@@ -97,3 +105,68 @@ class Reranker:
             # If reranking fails, return original order
             print(f"Reranker error: {e}")
             return chunks[:top_k] if top_k else chunks
+
+    def _rank(self, model: str, query: str, documents: list[str], top_n: int) -> list[int]:
+        """Document indices ordered by relevance; only documents without a cached score hit the API."""
+        query_hash = _sha256(query)
+        keys = [(model, query_hash, _sha256(document)) for document in documents]
+        scores = [self._scores.get(key) for key in keys]
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            fresh = self._score_documents(model, query, [documents[i] for i in missing])
+            for i, score in zip(missing, fresh):
+                if score is not None:
+                    self._scores.put(keys[i], score)
+                scores[i] = score
+
+        # API 未返回分数的文档排在最后，保持原有相对顺序
+        order = sorted(
+            range(len(documents)),
+            key=lambda i: -scores[i] if scores[i] is not None else float("inf"),
+        )
+        return order[:top_n]
+
+    def _score_documents(self, model: str, query: str, documents: list[str]) -> list[float | None]:
+        """Relevance scores aligned with documents; concurrent identical requests are coalesced."""
+        key = (model, query, tuple(documents))
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            scores = self._request_scores(model, query, documents)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(scores)
+            return scores
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _request_scores(self, model: str, query: str, documents: list[str]) -> list[float | None]:
+        """Call SiliconFlow rerank API for a score per document"""
+        response = self.client.post(
+            "/v1/rerank",
+            json={
+                "model": model,
+                "query": query,
+                "documents": documents,
+                "top_n": len(documents),
+                "return_documents": False,
+            },
+        )
+        response.raise_for_status()
+        result = response.json()
+        scores: list[float | None] = [None] * len(documents)
+        for item in result.get("results", []):
+            index = item.get("index", 0)
+            if 0 <= index < len(documents):
+                scores[index] = item.get("relevance_score")
+        return scores
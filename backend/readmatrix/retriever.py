@@ -1,19 +1,63 @@
 """Retriever - semantic search with deduplication, reranking, and context window"""
 
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+import numpy as np
+
+from .cache import LRUCache, SemanticCache
 from .config import get_settings
 from .models import Chunk
 from .indexer import VectorStore, get_embedding_provider
 
+# 多个改写查询的向量检索 / rerank 彼此独立且以 I/O 为主，并发执行的线程数
+SEARCH_BATCH_WORKERS = 4
+# 完全相同查询的结果缓存条数
+EXACT_CACHE_SIZE = 256
+
+
+def _distance_key(chunk: Chunk) -> float:
+    # 没有距离的结果视为通过阈值
+    return chunk.distance if chunk.distance is not None else float("-inf")
+
+
+def _mmr_order(distances: np.ndarray, vectors: np.ndarray, k: int, lam: float) -> list[int]:
+    """Greedy maximal marginal relevance over cosine distances to the query; returns row indices."""
+    relevance = 1.0 - distances
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = unit @ unit.T
+    # 每个候选与已选集合的最大相似度；首轮为 0，即先取最相关的一条
+    redundancy = np.zeros(len(relevance), dtype=np.float32)
+    chosen = np.zeros(len(relevance), dtype=bool)
+    order = []
+    for _ in range(min(k, len(relevance))):
+        scores = np.where(chosen, -np.inf, lam * relevance - (1.0 - lam) * redundancy)
+        best = int(np.argmax(scores))
+        order.append(best)
+        chosen[best] = True
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return order
+
 
 class Retriever:
     """Retrieves relevant chunks for a query"""
 
-    def __init__(self, vectorstore: VectorStore | None = None):
+    def __init__(self, vectorstore: VectorStore | None = None, cache_enabled: bool | None = None):
         self.vectorstore = vectorstore or VectorStore()
+        # None 时跟随 settings.retrieval_cache_enabled；评测等需要每次真实检索的场景传 False
+        self._cache_enabled = cache_enabled
         self._embedder = None
         self._reranker = None
+        self._query_embeddings = LRUCache(maxsize=256)
+        # rerank 请求期间预取上下文扩展所需的相邻 chunk id
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=SEARCH_BATCH_WORKERS, thread_name_prefix="retrieve-prefetch"
+        )
+        self._retrieval_cache: SemanticCache | None = None
+        # (索引版本, query, top_k, book_id, book_title) -> 最终结果；完全相同的查询连 embedding 也跳过
+        self._exact_results = LRUCache(maxsize=EXACT_CACHE_SIZE)
 
     @property
     def embedder(self):
@@ -28,6 +72,67 @@ class Retriever:
             self._reranker = Reranker()
         return self._reranker
 
+    @property
+    def cache_enabled(self) -> bool:
+        """Whether exact and semantic retrieval caching is on for this retriever."""
+        if self._cache_enabled is None:
+            return get_settings().retrieval_cache_enabled
+        return self._cache_enabled
+
+    @property
+    def retrieval_cache(self) -> SemanticCache:
+        if self._retrieval_cache is None:
+            settings = get_settings()
+            self._retrieval_cache = SemanticCache(
+                threshold=settings.retrieval_cache_threshold,
+                max_entries=settings.retrieval_cache_max_entries,
+                ttl_seconds=settings.retrieval_cache_ttl,
+            )
+        return self._retrieval_cache
+
+    def embed_query(self, query: str) -> list[float]:
+        """Embed a query, memoized so repeated lookups of the same text are free."""
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Embed several queries, sending all uncached ones in a single embed call."""
+        embeddings = [self._query_embeddings.get(q) for q in queries]
+        missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+        if missing:
+            fresh = dict(zip(missing, self.embedder.embed(missing)))
+            for q, embedding in fresh.items():
+                self._query_embeddings.put(q, embedding)
+            embeddings = [e if e is not None else fresh[q] for q, e in zip(queries, embeddings)]
+        return embeddings
+
+    def search_batch(
+        self,
+        queries: list[str],
+        top_k: int = 5,
+        book_id: Optional[str] = None,
+        book_title: Optional[str] = None,
+    ) -> list[list[Chunk]]:
+        """Search several queries with one embed call and one vector query, reranking concurrently."""
+        if not self.cache_enabled:
+            return self._search_with_embeddings(
+                queries, self.embed_queries(queries), top_k, book_id, book_title
+            )
+
+        version = self.vectorstore.version
+        keys = [(version, q, top_k, book_id, book_title) for q in queries]
+        results = [self._exact_results.get(key) for key in keys]
+        missing = list(dict.fromkeys(q for q, chunks in zip(queries, results) if chunks is None))
+        if missing:
+            searched = self._search_with_embeddings(
+                missing, self.embed_queries(missing), top_k, book_id, book_title
+            )
+            fresh = dict(zip(missing, searched))
+            for q, chunks in fresh.items():
+                self._exact_results.put((version, q, top_k, book_id, book_title), chunks)
+            results = [r if r is not None else fresh[q] for q, r in zip(queries, results)]
+        # 返回副本，调用方修改列表不影响缓存
+        return [list(chunks) for chunks in results]
+
     def search(
         self,
         query: str,
@@ -47,32 +152,151 @@ class Retriever:
         Returns:
             List of relevant Chunks
         """
+        return self.search_batch([query], top_k, book_id, book_title)[0]
+
+    def _search_with_embeddings(
+        self,
+        queries: list[str],
+        query_embeddings: list[list[float]],
+        top_k: int,
+        book_id: Optional[str],
+        book_title: Optional[str],
+    ) -> list[list[Chunk]]:
+        """Run vector search, filtering, rerank and context expansion; results align with queries."""
         settings = get_settings()
 
-        # Generate query embedding
-        query_embedding = self.embedder.embed([query])[0]
+        # 改写/复述后的相似查询直接复用上次的 chunk id
+        scope = self.cache_scope(top_k, book_id, book_title)
+        cache_enabled = self.cache_enabled
+        if cache_enabled:
+            results = [self.cached_chunks(embedding, scope) for embedding in query_embeddings]
+        else:
+            results = [None] * len(queries)
+
+        pending = [i for i, chunks in enumerate(results) if chunks is None]
+        if not pending:
+            return results
 
         # Search with increased k for deduplication and reranking
         fetch_k = top_k * 3 if settings.enable_reranker else top_k * 2
-        raw_results = self.vectorstore.search(
-            query_embedding=query_embedding,
+        search_kwargs = dict(
+            query_embeddings=[query_embeddings[i] for i in pending],
             top_k=fetch_k,
             book_id=book_id,
             book_title=book_title,
         )
+        # 未命中缓存的查询合并成一次向量库查询；MMR 需要候选本身的向量
+        if not settings.enable_reranker and settings.retrieval_mmr_lambda is not None:
+            raw_results, raw_vectors = zip(
+                *self.vectorstore.search_many_with_embeddings(**search_kwargs)
+            )
+        else:
+            raw_results = self.vectorstore.search_many(**search_kwargs)
+            raw_vectors = [None] * len(pending)
+
+        def _refine(i: int, raw: list[Chunk], vectors: np.ndarray | None) -> list[Chunk]:
+            return self._refine(queries[i], raw, top_k, vectors)
+
+        if len(pending) <= 1:
+            fresh = list(map(_refine, pending, raw_results, raw_vectors))
+        else:
+            # rerank 与上下文扩展以 I/O 为主，各查询并发执行
+            with ThreadPoolExecutor(
+                max_workers=min(SEARCH_BATCH_WORKERS, len(pending)),
+                thread_name_prefix="search",
+            ) as executor:
+                # executor.map 按提交顺序返回，结果与 pending 一一对应
+                fresh = list(executor.map(_refine, pending, raw_results, raw_vectors))
+
+        for i, top_chunks in zip(pending, fresh):
+            results[i] = top_chunks
+            if cache_enabled:
+                self.cache_chunks(query_embeddings[i], scope, top_chunks)
+        return results
+
+    def invalidate_cache(self):
+        """Drop cached retrieval results, e.g. after the index was rebuilt or updated."""
+        self._exact_results.clear()
+        if self._retrieval_cache is not None:
+            self._retrieval_cache.clear()
+
+    def cache_scope(self, *key) -> tuple:
+        """Retrieval-cache scope for key; includes the index version, so writes and deletes invalidate it."""
+        # 在检索开始前取版本号：检索期间索引发生变化时，结果记在旧版本下，不会被命中
+        return (self.vectorstore.version, *key)
+
+    def cache_chunks(
+        self,
+        query_embedding: list[float],
+        scope: tuple,
+        chunks: list[Chunk],
+        cache: SemanticCache | None = None,
+    ):
+        """Remember the chunk ids (and distances) retrieved for a query embedding (in cache, default retrieval_cache)."""
+        (cache or self.retrieval_cache).put(
+            query_embedding,
+            [(chunk.chunk_id, chunk.distance) for chunk in chunks],
+            scope=scope,
+        )
 
-        # 基于距离阈值过滤低相关结果
+    def cached_chunks(
+        self,
+        query_embedding: list[float],
+        scope: tuple,
+        cache: SemanticCache | None = None,
+    ) -> list[Chunk] | None:
+        """Reload the chunks of a similar earlier query, or None if any of them is gone."""
+        hit = (cache or self.retrieval_cache).get(query_embedding, scope=scope)
+        if hit is None:
+            return None
+        # 正文从向量库重新读取；其他进程（CLI 重建）删掉的 chunk 视为未命中
+        fetched = {c.chunk_id: c for c in self.vectorstore.get_by_ids([cid for cid, _ in hit])}
+        if len(fetched) < len(hit):
+            return None
+        chunks = []
+        for chunk_id, distance in hit:
+            chunk = fetched[chunk_id]
+            chunk.distance = distance
+            chunks.append(chunk)
+        return chunks
+
+    def _refine(
+        self,
+        query: str,
+        raw_results: list[Chunk],
+        top_k: int,
+        vectors: np.ndarray | None = None,
+    ) -> list[Chunk]:
+        """
+        Distance filtering, deduplication, rerank and context expansion of raw vector hits.
+
+        vectors (rows aligned with raw_results) enables MMR re-ordering when the reranker is off.
+        """
+        settings = get_settings()
+        if vectors is not None:
+            # 过滤与去重会丢弃部分结果，先记下每个 chunk 对应的向量行
+            rows = {chunk.chunk_id: i for i, chunk in enumerate(raw_results)}
+
+        # 基于距离阈值过滤低相关结果：向量库按距离升序返回，二分找到截断位置即可，不必逐条比较
         if settings.retrieval_max_distance is not None:
-            raw_results = [
-                chunk
-                for chunk in raw_results
-                if chunk.distance is None
-                or chunk.distance <= settings.retrieval_max_distance
+            raw_results = raw_results[
+                : bisect_right(
+                    raw_results,
+                    settings.retrieval_max_distance,
+                    key=_distance_key,
+                )
             ]
 
         # Deduplicate
         deduplicated = self._deduplicate(raw_results)
 
+        # rerank 是一次 API 往返，与之并行取回候选所在源文件的有序 chunk id（rerank 只会缩小候选范围）
+        source_ids = None
+        if settings.enable_reranker and settings.context_window > 0 and deduplicated:
+            source_ids = self._prefetch_executor.submit(
+                self._list_source_ids, [chunk.source_path for chunk in deduplicated]
+            )
+
         # Rerank if enabled
         if settings.enable_reranker and deduplicated:
             deduplicated = self.reranker.rerank(
@@ -81,23 +305,52 @@ class Retriever:
                 top_k=top_k * 2,  # Keep more for context expansion
                 model=settings.reranker_model,
             )
+        elif vectors is not None and len(deduplicated) > 1:
+            candidate_rows = [rows[chunk.chunk_id] for chunk in deduplicated]
+            order = _mmr_order(
+                np.array([c.distance or 0.0 for c in deduplicated], dtype=np.float32),
+                vectors[candidate_rows],
+                top_k * 2,  # 与 rerank 一样多留一些给上下文扩展
+                settings.retrieval_mmr_lambda,
+            )
+            deduplicated = [deduplicated[i] for i in order]
 
         # Take top_k before context expansion
         top_chunks = deduplicated[:top_k]
 
         # Expand with context window if enabled
         if settings.context_window > 0 and top_chunks:
-            top_chunks = self._expand_context(top_chunks, settings.context_window)
+            top_chunks = self._expand_context(
+                top_chunks,
+                settings.context_window,
+                source_ids.result() if source_ids is not None else None,
+            )
 
         return top_chunks[:top_k]
 
-    def _expand_context(self, chunks: list[Chunk], window: int) -> list[Chunk]:
+    def _list_source_ids(self, source_paths: list[str]) -> dict[str, list[str]]:
+        """Ordered chunk ids of each source file, fetched in one query (no content)."""
+        return {
+            path: ids
+            for path, (ids, _) in self.vectorstore.list_chunk_ids_by_sources(
+                source_paths,
+                limit=50,  # Get enough to find neighbors
+            ).items()
+        }
+
+    def _expand_context(
+        self,
+        chunks: list[Chunk],
+        window: int,
+        ordered_ids: dict[str, list[str]] | None = None,
+    ) -> list[Chunk]:
         """
         Expand chunks by including neighboring chunks from the same document.
 
         Args:
             chunks: Original chunks
             window: Number of neighbors to include (before and after)
+            ordered_ids: Prefetched _list_source_ids result covering the chunks' sources
 
         Returns:
             Expanded list of chunks with context
@@ -105,46 +358,43 @@ class Retriever:
         if not chunks or window <= 0:
             return chunks
 
-        expanded = []
         seen_ids = set()
+        # 所有源文件的有序 chunk id 一次查询取回（不取正文）；窗口内邻居的正文最后按 id 一次取回
+        if ordered_ids is None:
+            ordered_ids = self._list_source_ids([chunk.source_path for chunk in chunks])
+        # 每个源文件建一次 chunk_id -> 位置 的索引，定位当前 chunk 不必线性扫描
+        positions = {
+            path: {chunk_id: i for i, chunk_id in enumerate(ids)}
+            for path, ids in ordered_ids.items()
+        }
+        # 输出顺序：已有的 Chunk 直接保留，其余为待取回的邻居 id
+        plan: list[Chunk | str] = []
 
         for chunk in chunks:
-            # Get neighbors from the same source file
-            neighbors = self.vectorstore.get_by_source(
-                source_path=chunk.source_path,
-                limit=50,  # Get enough to find neighbors
-            )
-
-            if not neighbors:
-                if chunk.chunk_id not in seen_ids:
-                    expanded.append(chunk)
-                    seen_ids.add(chunk.chunk_id)
-                continue
+            ids = ordered_ids.get(chunk.source_path, [])
 
             # Find current chunk's position
-            current_idx = -1
-            for i, n in enumerate(neighbors):
-                if n.chunk_id == chunk.chunk_id:
-                    current_idx = i
-                    break
-
-            if current_idx == -1:
+            current_idx = positions.get(chunk.source_path, {}).get(chunk.chunk_id)
+            if current_idx is None:
                 if chunk.chunk_id not in seen_ids:
-                    expanded.append(chunk)
+                    plan.append(chunk)
                     seen_ids.add(chunk.chunk_id)
                 continue
 
             # Add neighbors within window
             start_idx = max(0, current_idx - window)
-            end_idx = min(len(neighbors), current_idx + window + 1)
-
-            for i in range(start_idx, end_idx):
-                neighbor = neighbors[i]
-                if neighbor.chunk_id not in seen_ids:
-                    expanded.append(neighbor)
-                    seen_ids.add(neighbor.chunk_id)
-
-        return expanded
+            for neighbor_id in ids[start_idx:current_idx + window + 1]:
+                if neighbor_id not in seen_ids:
+                    plan.append(chunk if neighbor_id == chunk.chunk_id else neighbor_id)
+                    seen_ids.add(neighbor_id)
+
+        neighbor_ids = [item for item in plan if isinstance(item, str)]
+        fetched = {c.chunk_id: c for c in self.vectorstore.get_by_ids(neighbor_ids)}
+        return [
+            item if isinstance(item, Chunk) else fetched[item]
+            for item in plan
+            if isinstance(item, Chunk) or item in fetched
+        ]
 
     def _deduplicate(self, chunks: list[Chunk]) -> list[Chunk]:
         """
@@ -155,8 +405,8 @@ class Retriever:
         result = []
 
         for chunk in chunks:
-            # 使用内容的前100字符作为去重key
-            content_key = chunk.content[:100] if len(chunk.content) >= 100 else chunk.content
+            # 使用内容的前100字符作为去重key（短内容切片即为原串）
+            content_key = chunk.content[:100]
 
             if content_key not in seen_content:
                 seen_content.add(content_key)
@@ -4,6 +4,8 @@ from .scanner import (
     scan_vault,
     get_file_info,
     compute_file_hash,
+    count_markdown_files,
+    has_weread_markers,
     get_files_needing_update,
     detect_source_type,
 )
@@ -18,6 +20,8 @@ __all__ = [
     "scan_vault",
     "get_file_info",
     "compute_file_hash",
+    "count_markdown_files",
+    "has_weread_markers",
     "get_files_needing_update",
     "detect_source_type",
     "parse_markdown",
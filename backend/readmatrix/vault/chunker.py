@@ -7,6 +7,27 @@ from pathlib import Path
 from ..models import Document, Chunk
 
 
+# 正则在导入时编译一次；重建索引时每个文件都会用到
+# One pass over the document: each match is either a chapter heading (### )
+# or a highlight - time is optional, block_id is optional
+# Format: > 📌 content \n> ⏱time ^id  OR  > 📌 content ^id
+_HIGHLIGHT_OR_CHAPTER_RE = re.compile(
+    r"^### (?P<chapter>[^\n]+?)$"                # Chapter heading
+    r"|> 📌 (?P<text>.+?)\s*\n"                  # Highlight content
+    r"(?:> ⏱(?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}))?\s*"  # Optional timestamp
+    r"\^?(?P<block_id>[\w-]+)?",                 # Optional block_id
+    re.MULTILINE | re.DOTALL,
+)
+# Trailing > symbols and whitespace left in highlight text
+_TRAILING_GT_RE = re.compile(r"\s*>\s*$")
+_NOTE_RE = re.compile(
+    r"> 📌 (.+?)\s+\^([\w-]+)\s*\n"        # Original text with ID
+    r"\s*- 💭 (.+?)\s*\n"                   # Note content
+    r"\s*- ⏱(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})",  # Time
+    re.DOTALL,
+)
+
+
 def make_chunk_id(source_path: str, block_id: str) -> str:
     """Generate globally unique chunk_id from path and block_id"""
     combined = f"{source_path}^{block_id}"
@@ -29,7 +50,8 @@ def parse_weread_highlights(document: Document) -> list[Chunk]:
     """
     Parse WeRead format file and extract highlights as chunks.
 
-    Strategy: Split by section first, then extract highlights within each section.
+    Strategy: a single scan matching chapter headings and highlights in document
+    order; each highlight takes the most recent heading as its chapter.
     This fixes the bug where all highlights get the last chapter's title.
 
     Args:
@@ -47,63 +69,46 @@ def parse_weread_highlights(document: Document) -> list[Chunk]:
     book_title = document.metadata.get("title") or document.title
     author = document.metadata.get("author", "")
 
-    # 1. Split content by chapter headings (### )
-    # Use regex to split while keeping the delimiter
-    sections = re.split(r"\n(?=### )", content)
-
-    # 2. Highlight pattern - time is optional, block_id is optional
-    # Format: > 📌 content \n> ⏱time ^id  OR  > 📌 content ^id
-    highlight_pattern = re.compile(
-        r"> 📌 (.+?)\s*\n"                      # Highlight content
-        r"(?:> ⏱(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}))?\s*"  # Optional timestamp
-        r"\^?([\w-]+)?",                         # Optional block_id
-        re.DOTALL,
-    )
-
-    for section in sections:
-        # Extract chapter title from section
-        chapter_match = re.match(r"^### (.+?)$", section, re.MULTILINE)
-        current_chapter = chapter_match.group(1).strip() if chapter_match else None
-
-        # Skip sections without highlights
-        if "📌" not in section:
+    current_chapter = None
+    for match in _HIGHLIGHT_OR_CHAPTER_RE.finditer(content):
+        chapter = match.group("chapter")
+        if chapter is not None:
+            current_chapter = chapter.strip() or None
+            continue
+
+        text = match.group("text").strip()
+        # Clean up text: remove trailing > symbols and whitespace
+        text = _TRAILING_GT_RE.sub("", text)
+        text = text.strip()
+
+        if not text:
             continue
 
-        # Extract all highlights in this section
-        for match in highlight_pattern.finditer(section):
-            text = match.group(1).strip()
-            # Clean up text: remove trailing > symbols and whitespace
-            text = re.sub(r"\s*>\s*$", "", text)
-            text = text.strip()
-
-            if not text:
-                continue
-
-            time = match.group(2)  # May be None
-            block_id = match.group(3)
-
-            # Generate block_id if missing
-            if not block_id:
-                block_id = hashlib.sha256(text.encode()).hexdigest()[:12]
-
-            # 保证 chunk_id 唯一，不修改原始 block_id
-            chunk_id = _unique_chunk_id(source_path, block_id, block_counts)
-
-            # Build title_path
-            title_path = [current_chapter] if current_chapter else []
-
-            chunk = Chunk(
-                chunk_id=chunk_id,
-                block_id=block_id,
-                content=text,
-                source_path=source_path,
-                title_path=title_path,
-                book_id=book_id,
-                book_title=book_title,
-                author=author or None,
-                highlight_time=time,
-            )
-            chunks.append(chunk)
+        time = match.group("time")  # May be None
+        block_id = match.group("block_id")
+
+        # Generate block_id if missing
+        if not block_id:
+            block_id = hashlib.sha256(text.encode()).hexdigest()[:12]
+
+        # 保证 chunk_id 唯一，不修改原始 block_id
+        chunk_id = _unique_chunk_id(source_path, block_id, block_counts)
+
+        # Build title_path
+        title_path = [current_chapter] if current_chapter else []
+
+        chunk = Chunk(
+            chunk_id=chunk_id,
+            block_id=block_id,
+            content=text,
+            source_path=source_path,
+            title_path=title_path,
+            book_id=book_id,
+            book_title=book_title,
+            author=author or None,
+            highlight_time=time,
+        )
+        chunks.append(chunk)
 
     return chunks
 
@@ -126,15 +131,7 @@ def parse_weread_notes(document: Document) -> list[Chunk]:
     book_title = document.metadata.get("title") or document.title
     author = document.metadata.get("author", "")
 
-    # Note pattern
-    note_pattern = re.compile(
-        r"> 📌 (.+?)\s+\^([\w-]+)\s*\n"        # Original text with ID
-        r"\s*- 💭 (.+?)\s*\n"                   # Note content
-        r"\s*- ⏱(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})",  # Time
-        re.DOTALL,
-    )
-
-    for match in note_pattern.finditer(content):
+    for match in _NOTE_RE.finditer(content):
         original_text = match.group(1).strip()
         note_id = match.group(2)
         note_content = match.group(3).strip()
@@ -4,22 +4,27 @@ import frontmatter
 from pathlib import Path
 from dataclasses import dataclass
 
-from ..models import Document
-from .scanner import compute_file_hash
+from ..models import Document, extract_anchors
+from .scanner import hash_bytes, source_type_of
 
 
-def parse_markdown(file_path: Path, source_type: str = "markdown") -> Document:
+def parse_markdown(file_path: Path, source_type: str | None = "markdown") -> Document:
     """
     Parse a markdown file with frontmatter.
     
     Args:
         file_path: Path to the markdown file
-        source_type: "weread" or "markdown"
+        source_type: "weread" or "markdown"; None detects it from the content
+            already read for parsing instead of opening the file a second time
     
     Returns:
         Document object with parsed content and metadata
     """
-    content = file_path.read_text(encoding="utf-8")
+    # 只读一次文件：原始字节用于哈希，解码后用于解析（与 read_text 一样统一换行符）
+    raw = file_path.read_bytes()
+    content = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    if source_type is None:
+        source_type = source_type_of(content)
     post = frontmatter.loads(content)
     
     # Extract metadata from frontmatter
@@ -44,13 +49,18 @@ def parse_markdown(file_path: Path, source_type: str = "markdown") -> Document:
                     break
     
     stat = file_path.stat()
+    # 解析时顺带提取锚点，查询时构建引用链接无需再读源文件
+    block_anchors, heading_anchor = extract_anchors(content)
     
     return Document(
         path=file_path,
         title=title,
         content=post.content,
-        hash=compute_file_hash(file_path),
+        hash=hash_bytes(raw),
         mtime=stat.st_mtime,
+        size=len(raw),
         source_type=source_type,
         metadata=metadata,
+        block_anchors=block_anchors,
+        heading_anchor=heading_anchor,
     )
@@ -1,13 +1,30 @@
 """Vault file scanner with incremental update detection"""
 
 import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Iterator
+from functools import lru_cache
+from typing import Callable, Iterator
 
 from ..config import get_settings
 
 
+# 数据库中的 mtime 以 REAL 存储，比较时容忍浮点误差
+MTIME_TOLERANCE = 1e-6
+
+# 超过该大小的文件通过 mmap 交给 hasher，不整体读入内存
+HASH_MMAP_THRESHOLD = 1 << 20
+
+# 增量扫描时并行校验文件哈希的线程数
+HASH_CHECK_WORKERS = 8
+
+# 早期写入的哈希不带算法前缀，均为 sha256 前 16 位
+LEGACY_HASH_ALGO = "sha256"
+
+
 @dataclass
 class FileInfo:
     """File information for change detection"""
@@ -17,20 +34,119 @@ class FileInfo:
     size: int
 
 
-def compute_file_hash(file_path: Path) -> str:
-    """Compute SHA256 hash of file content (first 16 chars)"""
-    content = file_path.read_text(encoding="utf-8")
-    return hashlib.sha256(content.encode()).hexdigest()[:16]
+@lru_cache(maxsize=None)
+def _resolve_hasher(algo: str) -> tuple[str, Callable]:
+    """Return (effective algo, hasher factory); xxh3 / blake3 fall back to sha256 when not installed (optional)."""
+    try:
+        if algo == "xxh3":
+            import xxhash
+
+            return algo, xxhash.xxh3_64
+        if algo == "blake3":
+            from blake3 import blake3
+
+            return algo, blake3
+        if algo in hashlib.algorithms_available and not algo.startswith("shake"):
+            return algo, lambda: hashlib.new(algo)
+    except ImportError:
+        pass
+    return "sha256", hashlib.sha256
+
+
+def hash_bytes(data, algo: str | None = None) -> str:
+    """Hash an in-memory buffer the same way compute_file_hash hashes a file"""
+    algo, factory = _resolve_hasher(algo or get_settings().hash_algo)
+    hasher = factory()
+    hasher.update(data)
+    return f"{algo}:{hasher.hexdigest()[:16]}"
 
 
-def scan_directory(directory: Path, pattern: str = "*.md") -> Iterator[Path]:
-    """Scan directory for markdown files"""
+def compute_file_hash(file_path: Path, algo: str | None = None) -> str:
+    """
+    Hash raw file bytes for change detection, as "<algo>:<first 16 hex chars>".
+    
+    Args:
+        file_path: File to hash
+        algo: Hash algorithm (defaults to settings.hash_algo)
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > HASH_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return hash_bytes(data, algo)
+        return hash_bytes(f.read(), algo)
+
+
+def file_hash_matches(file_path: Path, stored_hash: str) -> bool:
+    """Check a file against a stored hash, re-hashing with the algorithm that produced it"""
+    algo, sep, digest = stored_hash.rpartition(":")
+    if not sep:
+        # 旧格式：不带前缀的 sha256
+        algo = LEGACY_HASH_ALGO
+    return compute_file_hash(file_path, algo) == f"{algo}:{digest}"
+
+
+def scan_directory(directory: Path, recursive: bool = False) -> Iterator[Path]:
+    """
+    Scan directory for markdown files.
+    
+    Walks with os.scandir so file/dir checks use the type cached on each
+    DirEntry instead of a stat per entry. When recursive, hidden directories
+    (.obsidian, .git, ...) are not descended into.
+    """
     if not directory.exists():
         return
     
-    for file_path in directory.glob(pattern):
-        if file_path.is_file():
-            yield file_path
+    stack = [str(directory)]
+    # 已进入过的目录 (st_dev, st_ino)：符号链接成环或指回已扫描目录时不重复遍历
+    root = directory.stat()
+    visited: set[tuple[int, int]] = {(root.st_dev, root.st_ino)}
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".md") and entry.is_file():
+                        yield Path(entry.path)
+                    elif recursive and not entry.name.startswith(".") and entry.is_dir():
+                        stat = entry.stat()
+                        key = (stat.st_dev, stat.st_ino)
+                        if key not in visited:
+                            visited.add(key)
+                            stack.append(entry.path)
+                except OSError:
+                    continue
+
+
+def count_markdown_files(directory: Path) -> tuple[int, Path | None]:
+    """
+    Count top-level markdown files in one scandir pass.
+
+    Returns:
+        Tuple of (count, first_file); first_file is None when there are none
+    """
+    count = 0
+    sample = None
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # DirEntry 的类型信息来自目录项本身，无需逐个 stat
+            if entry.name.endswith(".md") and entry.is_file():
+                count += 1
+                if sample is None:
+                    sample = Path(entry.path)
+    return count, sample
+
+
+def has_weread_markers(file_path: Path, head_size: int = 4096) -> bool:
+    """Check WeRead markers in the first bytes of a file without decoding it"""
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(head_size)
+    except OSError:
+        return False
+    return b"bookId:" in head or "📌".encode() in head
 
 
 def get_file_info(file_path: Path) -> FileInfo:
@@ -44,24 +160,38 @@ def get_file_info(file_path: Path) -> FileInfo:
     )
 
 
+def source_type_of(content: str) -> str:
+    """Detect WeRead format from a file's text (only the first 500 chars are looked at)"""
+    head = content[:500]
+    # WeRead files have specific frontmatter
+    if "doc_type: weread-highlights-reviews" in head:
+        return "weread"
+    if "bookId:" in head and "📌" in head:
+        return "weread"
+    return "markdown"
+
+
 def detect_source_type(file_path: Path) -> str:
     """Detect if file is WeRead format or generic markdown"""
     try:
-        content = file_path.read_text(encoding="utf-8")[:500]
-        # WeRead files have specific frontmatter
-        if "doc_type: weread-highlights-reviews" in content:
-            return "weread"
-        if "bookId:" in content and "📌" in content:
-            return "weread"
+        return source_type_of(file_path.read_text(encoding="utf-8"))
     except Exception:
-        pass
-    return "markdown"
+        return "markdown"
 
 
-def scan_vault(vault_path: Path | None = None) -> Iterator[tuple[Path, str]]:
+def scan_vault(
+    vault_path: Path | None = None,
+    detect_types: bool = True,
+) -> Iterator[tuple[Path, str | None]]:
     """
     Scan vault for all markdown files with their source types.
     
+    Args:
+        vault_path: Vault root (defaults to settings.vault_path)
+        detect_types: When False, files outside the WeRead folder are yielded
+            with source_type None instead of reading each file's head, so the
+            caller can detect lazily (only for files it actually parses)
+    
     Yields:
         Tuple of (file_path, source_type)
     """
@@ -77,33 +207,56 @@ def scan_vault(vault_path: Path | None = None) -> Iterator[tuple[Path, str]]:
         for file_path in scan_directory(weread_path):
             yield file_path, "weread"
     
+    # 在路径字符串上做子串判断，等价于逐个检查 file_path.parts 但不构造 parts 元组；
+    # 前面补一个分隔符，使相对路径的首段也能匹配
+    weread_part = f"{os.sep}{settings.weread_folder}{os.sep}"
+    hidden_part = f"{os.sep}."
+    
     # Scan other markdown files (excluding WeRead folder)
-    for file_path in scan_directory(vault, "**/*.md"):
+    for file_path in scan_directory(vault, recursive=True):
+        path_str = os.sep + str(file_path)
         # Skip WeRead folder (already scanned)
-        if settings.weread_folder in file_path.parts:
+        if weread_part in path_str:
             continue
         # Skip hidden folders
-        if any(part.startswith(".") for part in file_path.parts):
+        if hidden_part in path_str:
             continue
-        yield file_path, detect_source_type(file_path)
+        yield file_path, detect_source_type(file_path) if detect_types else None
 
 
 def get_files_needing_update(
-    scanned_files: list[tuple[Path, str]],
-    indexed_records: dict[str, tuple[str, float]],  # path -> (hash, mtime)
-) -> tuple[list[tuple[Path, str]], list[str]]:
+    scanned_files: list[tuple[Path, str | None]],
+    indexed_records: dict[str, tuple],  # path -> (hash, mtime, size)
+    stat_only: bool | None = None,
+) -> tuple[list[tuple[Path, str | None]], list[str], list[tuple[str, float]]]:
     """
     Determine which files need indexing and which should be removed.
     
+    Unchanged mtimes skip hashing entirely, and so does a size change, which
+    always means new content. Files whose mtime moved but whose content hash
+    still matches are reported so the caller can store the new mtime and hit
+    the fast path next time. Stored hashes are compared using the algorithm
+    they were written with, so changing settings.hash_algo does not force a
+    re-index.
+    
     Args:
         scanned_files: List of (path, source_type) from scan
-        indexed_records: Dict of path -> (hash, mtime) from SQLite
+        indexed_records: Dict of path -> (hash, mtime, size) from SQLite;
+            size may be None (or omitted) for records written before it was stored
+        stat_only: Treat any mtime change as a content change without hashing;
+            defaults to settings.index_stat_only
     
     Returns:
-        Tuple of (files_to_index, paths_to_remove)
+        Tuple of (files_to_index, paths_to_remove, mtime_updates)
+        where mtime_updates is a list of (path, new_mtime)
     """
+    if stat_only is None:
+        stat_only = get_settings().index_stat_only
     files_to_index = []
+    mtime_updates = []
     current_paths = set()
+    # mtime 变化、需读文件比对哈希的 ((path, source_type), 旧哈希, 新 mtime)
+    to_hash = []
     
     for file_path, source_type in scanned_files:
         path_str = str(file_path)
@@ -114,20 +267,43 @@ def get_files_needing_update(
             files_to_index.append((file_path, source_type))
         else:
             # Check if file changed
-            old_hash, old_mtime = indexed_records[path_str]
+            old_hash, old_mtime, *rest = indexed_records[path_str]
+            old_size = rest[0] if rest else None
             try:
                 stat = file_path.stat()
-                # Quick check: mtime changed
-                if stat.st_mtime != old_mtime:
-                    # Verify with hash
-                    new_hash = compute_file_hash(file_path)
-                    if new_hash != old_hash:
-                        files_to_index.append((file_path, source_type))
             except Exception:
                 # File might be deleted or inaccessible
-                pass
+                continue
+            # Quick check: mtime changed
+            if abs(stat.st_mtime - old_mtime) >= MTIME_TOLERANCE:
+                # 大小不同必然是内容变化；快速扫描模式下 mtime 变化即视为变化，均无需读文件
+                if stat_only or (old_size is not None and stat.st_size != old_size):
+                    files_to_index.append((file_path, source_type))
+                else:
+                    to_hash.append(((file_path, source_type), old_hash, stat.st_mtime))
+    
+    def _check(candidate: tuple) -> bool | None:
+        """Whether the file's content changed; None if it can no longer be read"""
+        (file_path, _), old_hash, _ = candidate
+        try:
+            return not file_hash_matches(file_path, old_hash)
+        except Exception:
+            return None
+    
+    # 读文件与哈希计算都会释放 GIL，多线程可并行利用磁盘带宽
+    if len(to_hash) > 1:
+        with ThreadPoolExecutor(max_workers=min(HASH_CHECK_WORKERS, len(to_hash))) as pool:
+            changed = list(pool.map(_check, to_hash))
+    else:
+        changed = [_check(candidate) for candidate in to_hash]
+    for (entry, _, new_mtime), is_changed in zip(to_hash, changed):
+        if is_changed:
+            files_to_index.append(entry)
+        elif is_changed is False:
+            # Content unchanged (e.g. touched or re-synced)
+            mtime_updates.append((str(entry[0]), new_mtime))
     
     # Files in index but not in scan = removed
     paths_to_remove = [p for p in indexed_records.keys() if p not in current_paths]
     
-    return files_to_index, paths_to_remove
+    return files_to_index, paths_to_remove, mtime_updates
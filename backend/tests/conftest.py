@@ -0,0 +1,27 @@
+"""Shared pytest fixtures."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from readmatrix.config import reload_settings
+from readmatrix.main import app
+
+
+@pytest.fixture(scope="session", autouse=True)
+def data_dir(tmp_path_factory):
+    """Point data_dir at a temp directory so tests never touch the developer's database."""
+    monkeypatch = pytest.MonkeyPatch()
+    path = tmp_path_factory.mktemp("data")
+    # 环境变量优先于 .env，测试期间任何 reload_settings 也都指向临时目录
+    monkeypatch.setenv("DATA_DIR", str(path))
+    reload_settings()
+    yield path
+    monkeypatch.undo()
+    reload_settings()
+
+
+@pytest.fixture(scope="session")
+def client(data_dir):
+    """One TestClient for the whole session, so app startup/shutdown runs once."""
+    with TestClient(app) as test_client:
+        yield test_client
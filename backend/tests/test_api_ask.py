@@ -1,15 +1,9 @@
 ﻿"""Tests for /api/ask compatibility and debate mode validation."""
 
-from fastapi.testclient import TestClient
-
-from readmatrix.main import app
 from readmatrix.qa import AskResult, QAEngine
 
 
-client = TestClient(app)
-
-
-def test_ask_backward_compatible(monkeypatch):
+def test_ask_backward_compatible(client, monkeypatch):
     """Legacy payload (query/filters only) should still work."""
 
     captured: dict = {}
@@ -52,7 +46,7 @@ def test_ask_backward_compatible(monkeypatch):
     assert captured == {"mode": "qa", "debate": None}
 
 
-def test_ask_debate_requires_config():
+def test_ask_debate_requires_config(client):
     """Debate mode requires debate config payload."""
     resp = client.post(
         "/api/ask",
@@ -65,7 +59,7 @@ def test_ask_debate_requires_config():
     assert "debate config" in resp.json()["detail"]
 
 
-def test_ask_debate_requires_topic_and_stance():
+def test_ask_debate_requires_topic_and_stance(client):
     """Debate mode requires non-empty topic and user stance."""
     resp = client.post(
         "/api/ask",
@@ -82,7 +76,7 @@ def test_ask_debate_requires_topic_and_stance():
     assert "topic and user_stance" in resp.json()["detail"]
 
 
-def test_ask_debate_passes_mode_and_payload(monkeypatch):
+def test_ask_debate_passes_mode_and_payload(client, monkeypatch):
     """Debate mode payload should be passed to QA engine."""
 
     captured: dict = {}
@@ -0,0 +1,248 @@
+"""缓存组件测试。"""
+
+from readmatrix.cache import LRUCache, SemanticCache
+from readmatrix.indexer.database import Database
+from readmatrix.indexer.embedder import CachedEmbedding
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """超过容量时淘汰最久未使用的条目。"""
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_semantic_cache_similarity_and_scope():
+    """相似查询命中缓存，不同 scope 或低相似度不命中。"""
+    cache = SemanticCache(threshold=0.95, max_entries=2)
+    cache.put([1.0, 0.0, 0.0], "answer", scope="book-1")
+
+    assert cache.get([0.99, 0.05, 0.0], scope="book-1") == "answer"
+    assert cache.get([0.99, 0.05, 0.0], scope="book-2") is None
+    assert cache.get([0.0, 1.0, 0.0], scope="book-1") is None
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+    cache.put([0.0, 1.0, 0.0], "second", scope="book-1")
+    cache.put([0.0, 0.0, 1.0], "third", scope="book-1")
+    assert len(cache) == 2
+    assert cache.get([0.0, 0.0, 1.0], scope="book-1") == "third"
+
+
+def test_semantic_cache_ttl():
+    """过期条目不再命中。"""
+    cache = SemanticCache(threshold=0.9, ttl_seconds=0.0)
+    cache.put([1.0, 0.0], "answer")
+    assert cache.get([1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_embedding_cache_only_embeds_new_text(tmp_path):
+    """已缓存的文本不再请求 provider，重复文本只 embed 一次。"""
+    calls: list[list[str]] = []
+
+    class FakeProvider:
+        model = "fake"
+
+        def embed(self, texts):
+            calls.append(list(texts))
+            return [[float(len(text)), 0.5] for text in texts]
+
+    db = Database(db_path=tmp_path / "index.db")
+    embedder = CachedEmbedding(FakeProvider(), db)
+
+    assert embedder.embed(["ab", "c", "ab"]) == [[2.0, 0.5], [1.0, 0.5], [2.0, 0.5]]
+    assert embedder.embed(["c", "def"]) == [[1.0, 0.5], [3.0, 0.5]]
+    assert calls == [["ab", "c"], ["def"]]
+
+    # 不同模型的向量互不复用
+    CachedEmbedding(FakeProvider(), db, model_id="other").embed(["c"])
+    assert calls[-1] == ["c"]
+
+
+def test_retrieval_cache_reuses_chunks_until_index_changes():
+    """相似查询复用上次检索结果；索引写入后重新检索。"""
+    from readmatrix.models import Chunk
+    from readmatrix.retriever import Retriever
+
+    chunk = Chunk(
+        chunk_id="c1",
+        block_id="b1",
+        content="内容",
+        source_path="book.md",
+        title_path=["书"],
+        book_id="book-1",
+        book_title="书",
+        author=None,
+        highlight_time=None,
+        distance=0.1,
+    )
+
+    class FakeVectorStore:
+        version = 0
+        searches = 0
+
+        def search_many(self, query_embeddings, **kwargs):
+            self.searches += 1
+            return [[chunk] for _ in query_embeddings]
+
+        def get_by_ids(self, chunk_ids):
+            return [chunk] if "c1" in chunk_ids else []
+
+        def list_chunk_ids_by_sources(self, source_paths, limit=50):
+            return {"book.md": (["c1"], ["b1"])}
+
+    class FakeReranker:
+        def rerank(self, query, chunks, top_k, model):
+            return chunks[:top_k]
+
+    store = FakeVectorStore()
+    retriever = Retriever(vectorstore=store, cache_enabled=True)
+    retriever._reranker = FakeReranker()
+
+    [first] = retriever._search_with_embeddings(["q1"], [[1.0, 0.0]], 5, None, None)
+    [second] = retriever._search_with_embeddings(["q2"], [[0.99, 0.05]], 5, None, None)
+    assert [c.chunk_id for c in first] == [c.chunk_id for c in second] == ["c1"]
+    assert second[0].distance == 0.1
+    assert store.searches == 1
+
+    # 索引变化后重新检索；一批未命中的查询只查询一次向量库
+    store.version += 1
+    retriever._search_with_embeddings(["q2", "q3"], [[0.99, 0.05], [0.0, 1.0]], 5, None, None)
+    assert store.searches == 2
+
+
+def test_rerank_scores_cached_per_document():
+    """已打分的 (query, chunk) 不再送 API，只对新文档请求分数。"""
+    from readmatrix.reranker import Reranker
+
+    calls: list[list[str]] = []
+
+    class FakeReranker(Reranker):
+        def _request_scores(self, model, query, documents):
+            calls.append(list(documents))
+            return [float(len(document)) for document in documents]
+
+    reranker = FakeReranker()
+    assert reranker._rank("m", "q", ["a", "ccc", "bb"], 3) == [1, 2, 0]
+    assert reranker._rank("m", "q", ["bb", "dddd"], 1) == [1]
+    assert calls == [["a", "ccc", "bb"], ["dddd"]]
+
+
+def test_exact_query_cache_skips_embedding_until_invalidated():
+    """完全相同的查询直接返回缓存结果，invalidate_cache 后重新检索。"""
+    from readmatrix.retriever import Retriever
+
+    class FakeEmbedder:
+        calls = 0
+
+        def embed(self, texts):
+            self.calls += 1
+            return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+    class FakeVectorStore:
+        version = 0
+
+        def search_many(self, query_embeddings, **kwargs):
+            return [[] for _ in query_embeddings]
+
+        def get_by_ids(self, chunk_ids):
+            return []
+
+    embedder = FakeEmbedder()
+    retriever = Retriever(vectorstore=FakeVectorStore(), cache_enabled=True)
+    retriever._embedder = embedder
+
+    assert retriever.search("问题") == []
+    assert retriever.search_batch(["问题", "问题"]) == [[], []]
+    assert embedder.calls == 1
+
+    retriever.invalidate_cache()
+    retriever._query_embeddings.clear()
+    retriever.search("问题")
+    assert embedder.calls == 2
+
+
+def test_embed_batches_sorted_by_length_keep_input_order():
+    """多批请求按长度分组，返回结果仍与输入一一对应。"""
+    from types import SimpleNamespace
+
+    from readmatrix.indexer.embedder import _embed_in_batches
+
+    batches: list[list[str]] = []
+
+    def create(input, model):
+        batches.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(t))]) for t in input])
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    texts = ["aaaa", "b", "ccc", "dd", "eeeee"]
+
+    assert _embed_in_batches(client, "m", texts, batch_size=2) == [[4.0], [1.0], [3.0], [2.0], [5.0]]
+    assert sorted(batches) == [["b", "dd"], ["ccc", "aaaa"], ["eeeee"]]
+
+
+def test_fused_cache_does_not_share_results_between_similar_questions(monkeypatch):
+    """相似但不同的问题（余弦约 0.92）各自检索，只有几乎相同的问题复用融合结果。"""
+    from readmatrix.config import get_settings
+    from readmatrix.models import Chunk
+    from readmatrix.qa import QAEngine
+    from readmatrix.retriever import Retriever
+
+    settings = get_settings()
+    monkeypatch.setattr(settings, "retrieval_cache_enabled", True)
+    monkeypatch.setattr(settings, "fused_retrieval_cache_enabled", True)
+
+    embeddings = {
+        "《人类简史》讲了什么": [1.0, 0.0],
+        "《未来简史》讲了什么": [0.92, 0.39],
+        "《人类简史》讲了什么？": [1.0, 0.01],
+    }
+
+    def chunk_for(query: str) -> Chunk:
+        return Chunk(
+            chunk_id=query,
+            block_id=query,
+            content=query,
+            source_path=f"{query}.md",
+            title_path=[],
+            book_id="",
+            book_title="",
+            author=None,
+            highlight_time=None,
+        )
+
+    class FakeVectorStore:
+        version = 0
+
+        def get_by_ids(self, chunk_ids):
+            return [chunk_for(chunk_id) for chunk_id in chunk_ids]
+
+    searches: list[str] = []
+
+    def search(query, **kwargs):
+        searches.append(query)
+        return [chunk_for(query)]
+
+    retriever = Retriever(vectorstore=FakeVectorStore(), cache_enabled=True)
+    monkeypatch.setattr(retriever, "embed_query", embeddings.__getitem__)
+    monkeypatch.setattr(retriever, "search", search)
+
+    engine = QAEngine(retriever=retriever, conversation_service=object())
+    monkeypatch.setattr(engine, "_rewrite_query", lambda query: ())
+    search_kwargs = {"top_k": 5, "book_id": None, "book_title": None}
+
+    first = engine._retrieve_fused("《人类简史》讲了什么", search_kwargs)
+    second = engine._retrieve_fused("《未来简史》讲了什么", search_kwargs)
+    third = engine._retrieve_fused("《人类简史》讲了什么？", search_kwargs)
+
+    assert [c.chunk_id for c in first] == ["《人类简史》讲了什么"]
+    assert [c.chunk_id for c in second] == ["《未来简史》讲了什么"]
+    assert [c.chunk_id for c in third] == ["《人类简史》讲了什么"]
+    assert searches == ["《人类简史》讲了什么", "《未来简史》讲了什么"]
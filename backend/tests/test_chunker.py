@@ -0,0 +1,24 @@
+"""WeRead 划线解析测试。"""
+
+from pathlib import Path
+
+from readmatrix.models import Document
+from readmatrix.vault.chunker import parse_weread_highlights
+
+
+def _document(content: str) -> Document:
+    return Document(
+        path=Path("book.md"),
+        title="书",
+        content=content,
+        hash="",
+        mtime=0.0,
+        source_type="weread",
+    )
+
+
+def test_highlight_directly_before_next_chapter_is_kept():
+    """没有 block id 的划线紧挨下一章标题时不被吞掉，章节归属正确。"""
+    chunks = parse_weread_highlights(_document("### A\n> 📌 one\n### B\n> 📌 two\n"))
+
+    assert [(c.content, c.title_path) for c in chunks] == [("one", ["A"]), ("two", ["B"])]
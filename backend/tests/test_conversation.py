@@ -9,7 +9,7 @@ from readmatrix.indexer.database import Database
 def test_conversation_service_crud(tmp_path: Path):
     """验证会话创建、写入、读取和删除。"""
     db = Database(db_path=tmp_path / "conversation.db")
-    service = ConversationService(db=db, window_turns=2, summary_refresh_every=2)
+    service = ConversationService(db=db, window_turns=2, summary_token_budget=50)
 
     conversation_id = service.create_conversation(title="测试会话")
     assert conversation_id
@@ -68,3 +68,188 @@ def test_context_assembler_sections():
     assert "产品设计" in sections["conversation_summary"]
     assert "用户:" in sections["recent_dialogue"]
     assert "[1]" in sections["note_context"]
+
+
+def test_list_messages_page(tmp_path: Path):
+    """验证分页读取同时返回存在性与总数。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db)
+
+    conversation_id = service.create_conversation()
+    for index in range(3):
+        service.append_user_message(conversation_id, f"问题{index}")
+
+    exists, messages, total = service.list_messages_page(conversation_id, limit=2)
+    assert exists is True
+    assert total == 3
+    assert [item.content for item in messages] == ["问题1", "问题2"]
+
+    exists, messages, total = service.list_messages_page(conversation_id, limit=2, offset=5)
+    assert (exists, messages, total) == (True, [], 3)
+
+    exists, messages, total = service.list_messages_page("missing")
+    assert (exists, messages, total) == (False, [], 0)
+
+
+def test_conversation_state_cache_invalidation(tmp_path: Path):
+    """验证缓存的窗口、摘要与 token 预算在写入后保持一致。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db, window_turns=2, summary_token_budget=20)
+
+    conversation_id = service.create_conversation()
+    assert service.get_recent_window(conversation_id) == []
+    assert service.get_summary(conversation_id) == ""
+
+    service.append_user_message(conversation_id, "第一个问题")
+    assert [m.content for m in service.get_recent_window(conversation_id)] == ["第一个问题"]
+    assert service.should_refresh_summary(conversation_id) is False
+
+    service.append_assistant_message(conversation_id, "第一个回答" * 5)
+    service.append_user_message(conversation_id, "第二个问题")
+    assert len(service.get_recent_window(conversation_id)) == 3
+    assert service.should_refresh_summary(conversation_id) is True
+
+    service.save_summary(conversation_id, "新的摘要")
+    assert service.get_summary(conversation_id) == "新的摘要"
+    assert service.should_refresh_summary(conversation_id) is False
+    # 重新从数据库播种时只统计摘要及其之后的消息
+    service.invalidate(conversation_id)
+    assert service.should_refresh_summary(conversation_id) is False
+
+
+def test_summary_refresh_runs_in_background(tmp_path: Path):
+    """验证摘要刷新在后台执行，close 后摘要已落库。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db, summary_token_budget=1)
+
+    conversation_id = service.create_conversation()
+    service.append_user_message(conversation_id, "乔布斯怎么看产品设计？")
+    service.refresh_summary_if_needed(
+        conversation_id,
+        lambda previous, history, strategy: f"共 {len(history)} 条消息",
+    )
+    service.close()
+
+    assert service.get_summary(conversation_id) == "共 1 条消息"
+
+
+def test_summary_refresh_only_sends_new_messages(tmp_path: Path):
+    """验证摘要刷新只传入上次摘要之后的新增消息，并保留历史摘要。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db, summary_token_budget=1)
+    conversation_id = service.create_conversation()
+    calls: list[tuple[str, list[str]]] = []
+
+    def builder(previous: str, new_messages: list[ConversationMessage], strategy: str) -> str:
+        calls.append((previous, [m.content for m in new_messages]))
+        return previous + "".join(m.content for m in new_messages)
+
+    service.append_user_message(conversation_id, "A")
+    service.append_assistant_message(conversation_id, "B")
+    service._refresh_summary(conversation_id, builder)
+    service.append_user_message(conversation_id, "C")
+    service._refresh_summary(conversation_id, builder)
+
+    assert calls == [("", ["A", "B"]), ("AB", ["C"])]
+    assert service.get_summary(conversation_id) == "ABC"
+
+
+def test_summary_refresh_skips_repeated_delta(tmp_path: Path):
+    """验证新增对话与上次摘要的内容几乎相同时不调用 LLM，只推进摘要游标。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db, summary_token_budget=1)
+    conversation_id = service.create_conversation()
+    calls: list[list[str]] = []
+
+    def builder(previous: str, new_messages: list[ConversationMessage], strategy: str) -> str:
+        calls.append([m.content for m in new_messages])
+        return "关于产品设计的讨论"
+
+    for _ in range(2):
+        service.append_user_message(conversation_id, "乔布斯怎么看产品设计？")
+        service.append_assistant_message(conversation_id, "他强调端到端体验与对细节的极致追求。")
+        service._refresh_summary(conversation_id, builder)
+
+    assert len(calls) == 1
+    assert service.get_summary(conversation_id) == "关于产品设计的讨论"
+    # 游标已推进，重复的这段不会在下次刷新时再次送出
+    assert db.list_messages_after(
+        conversation_id=conversation_id,
+        after_message_id=db.get_summary_cursor(conversation_id),
+        include_system=False,
+    ) == []
+
+
+def test_large_summary_delta_uses_map_reduce(tmp_path: Path):
+    """验证待摘要消息过多时先分段 map，再与历史摘要 reduce。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db, summary_token_budget=1, summary_stuff_max_tokens=5)
+    conversation_id = service.create_conversation()
+    service.save_summary(conversation_id, "旧摘要")
+    for idx in range(10):
+        service.append_user_message(conversation_id, f"问题{idx}")
+
+    strategies: list[str] = []
+
+    def builder(previous: str, messages: list[ConversationMessage], strategy: str) -> str:
+        strategies.append(strategy)
+        if strategy == "map":
+            return f"{len(messages)}条"
+        return previous + "|" + ",".join(m.content for m in messages)
+
+    service._refresh_summary(conversation_id, builder)
+
+    assert sorted(strategies) == ["map", "map", "reduce"]
+    assert service.get_summary(conversation_id) == "旧摘要|8条,2条"
+
+
+def test_batch_append_is_atomic(tmp_path: Path):
+    """验证 batch_append 内的写入一起提交，异常时整体回滚。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db)
+    conversation_id = service.create_conversation()
+
+    with service.batch_append(conversation_id):
+        service.append_user_message(conversation_id, "问题")
+        service.append_assistant_message(conversation_id, "回答")
+    assert [m.content for m in service.get_recent_window(conversation_id)] == ["问题", "回答"]
+
+    try:
+        with service.batch_append(conversation_id):
+            service.append_user_message(conversation_id, "未回答的问题")
+            raise RuntimeError("LLM 调用失败")
+    except RuntimeError:
+        pass
+    assert [m.content for m in service.get_recent_window(conversation_id)] == ["问题", "回答"]
+
+
+def test_messages_keep_insert_order_with_equal_timestamps(tmp_path: Path, monkeypatch):
+    """验证时间戳相同时消息仍按写入顺序返回（按 seq 排序）。"""
+    monkeypatch.setattr(
+        "readmatrix.indexer.database._now_iso", lambda: "2026-01-01T00:00:00"
+    )
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db)
+    conversation_id = service.create_conversation()
+    for content in ["b", "a", "c"]:
+        service.append_user_message(conversation_id, content)
+
+    assert [m.content for m in service.list_messages(conversation_id)] == ["b", "a", "c"]
+    first_id = service.list_messages(conversation_id, limit=3)[0].id
+    assert [m["content"] for m in db.list_messages_after(conversation_id, first_id)] == ["a", "c"]
+
+
+def test_conversation_cache_evicts_cold_conversations(tmp_path: Path):
+    """内存缓存只保留最近访问的会话，被淘汰的会话从数据库重新加载。"""
+    db = Database(db_path=tmp_path / "conversation.db")
+    service = ConversationService(db=db, cache_size=1)
+
+    first = service.create_conversation()
+    second = service.create_conversation()
+    service.append_user_message(first, "第一个会话")
+    service.append_user_message(second, "第二个会话")
+
+    assert [m.content for m in service.get_recent_window(first)] == ["第一个会话"]
+    assert [m.content for m in service.get_recent_window(second)] == ["第二个会话"]
+    assert len(service._cache) == 1
+    assert [m.content for m in service.get_recent_window(first)] == ["第一个会话"]
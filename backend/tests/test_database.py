@@ -0,0 +1,21 @@
+"""SQLite 数据层测试。"""
+
+import sqlite3
+from pathlib import Path
+
+from readmatrix.indexer.database import ALL_FILE_RECORDS_SQL, Database
+
+
+def test_file_records_scan_uses_primary_key_btree(tmp_path: Path):
+    """增量更新的全表读取直接扫描 files 主键 B 树，旧库遗留的覆盖索引会被删除。"""
+    db_path = tmp_path / "index.db"
+    Database(db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE INDEX idx_files_covering ON files(path, hash, mtime)")
+    Database(db_path=db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(files)")}
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {ALL_FILE_RECORDS_SQL}"))
+    assert "idx_files_covering" not in indexes
+    assert plan == "SCAN files"
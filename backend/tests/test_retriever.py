@@ -0,0 +1,39 @@
+"""检索流程测试。"""
+
+import numpy as np
+
+from readmatrix.config import get_settings
+from readmatrix.models import Chunk
+from readmatrix.retriever import Retriever
+
+
+def _chunk(chunk_id: str, distance: float) -> Chunk:
+    return Chunk(
+        chunk_id=chunk_id,
+        block_id=chunk_id,
+        content=f"内容 {chunk_id}",
+        source_path="book.md",
+        title_path=["书"],
+        book_id="book-1",
+        book_title="书",
+        author=None,
+        highlight_time=None,
+        distance=distance,
+    )
+
+
+def test_mmr_reorders_near_duplicates_without_reranker(monkeypatch):
+    """未启用 reranker 时，MMR 把与已选结果几乎相同的候选排到后面。"""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "enable_reranker", False)
+    monkeypatch.setattr(settings, "retrieval_mmr_lambda", 0.5)
+    monkeypatch.setattr(settings, "retrieval_max_distance", None)
+    monkeypatch.setattr(settings, "context_window", 0)
+
+    chunks = [_chunk("a", 0.10), _chunk("a2", 0.11), _chunk("b", 0.20)]
+    vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]], dtype=np.float32)
+
+    retriever = Retriever(vectorstore=object())
+    assert [c.chunk_id for c in retriever._refine("q", chunks, 3, vectors)] == ["a", "b", "a2"]
+    # 没有向量时保持向量检索顺序
+    assert [c.chunk_id for c in retriever._refine("q", chunks, 3)] == ["a", "a2", "b"]
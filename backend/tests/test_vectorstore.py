@@ -0,0 +1,38 @@
+"""ChromaDB 向量库测试。"""
+
+from pathlib import Path
+
+from readmatrix.indexer.database import Database
+from readmatrix.indexer.vectorstore import VectorStore
+from readmatrix.models import Chunk
+
+
+def test_healthcheck_sentinel_never_appears_in_search(tmp_path: Path, monkeypatch):
+    """doctor 的持久化检查期间并发检索，只返回真实 chunk，主集合不留哨兵。"""
+    store = VectorStore(persist_path=tmp_path / "chroma", db=Database(db_path=tmp_path / "index.db"))
+    chunk = Chunk(
+        chunk_id="c1",
+        block_id="b1",
+        content="内容",
+        source_path="book.md",
+        title_path=["书"],
+        book_id="book-1",
+        book_title="书",
+        author=None,
+        highlight_time=None,
+    )
+    store.add_chunks([chunk], [[1.0, 0.0, 0.0]])
+
+    searched: list[list[str]] = []
+    delete_collection = store.client.delete_collection
+
+    def search_then_delete(name):
+        # 哨兵仍存在时执行一次不带过滤的检索
+        searched.append([c.chunk_id for c in store.search([1.0, 0.0, 0.0], top_k=5)])
+        return delete_collection(name)
+
+    monkeypatch.setattr(store.client, "delete_collection", search_then_delete)
+
+    assert store.test_persistence() is True
+    assert searched == [["c1"]]
+    assert store.get_chunk_count() == 1